@@ -0,0 +1,6 @@
+"""
+Convenience tools for exploratory analysis of JUMP morphological profiles.
+
+Installing this package pulls in the dependencies used by the notebooks, and
+the modules below provide the shared helpers those notebooks build on.
+"""
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+"""
+Dataset-wide phenotypic activity (average precision) computed in chunks.
+
+Scoring a perturbation against its negative controls only needs its
+replicate wells and the controls on the same plates. Perturbations that
+share the same set of plates are grouped, and each of these plate groups is
+loaded, scored with copairs and written to disk independently, in a pool of
+processes. Peak memory is therefore bounded by the largest plate group rather
+than by the size of the dataset. The plate groups are planned from the layout
+index of the subset, so the profiles themselves are only read group by group.
+
+Use cases:
+# Average precision of every well in the crispr dataset
+ap_dir = dataset_activity("crispr", "crispr_activity")
+# Mean average precision and significance per perturbation
+summarise_activity(ap_dir)
+"""
+
+import json
+from hashlib import sha1
+from pathlib import Path
+
+import polars as pl
+
+from jump_deps.annotate import annotate
+from jump_deps.cache import normalise_etag
+from jump_deps.layout import get_layout_index
+from jump_deps.manifest import get_entry, get_manifest
+from jump_deps.matrix import copairs_inputs
+from jump_deps.pool import map_unordered
+from jump_deps.rowgroup_index import get_rowgroup_index, read_perturbations
+
+RUN_FILE = "run.json"
+
+
+def plate_groups(
+    layout: pl.DataFrame, max_plates: int = 16
+) -> list[tuple[list[str], list[str]]]:
+    """
+    Group treatments by the plates where they were assayed.
+
+    Parameters
+    ----------
+    layout : polars.DataFrame
+        One row per well with Metadata_JCP2022, Metadata_Plate and pert_type.
+    max_plates : int
+        Groups spanning more plates than this are split plate-set by
+        plate-set, so that no single chunk grows unbounded.
+
+    Returns
+    -------
+    list of tuple
+        (plates, treatments) pairs. Every treatment appears in exactly one
+        group, together with all the plates it was assayed in.
+
+    """
+    plate_sets = (
+        layout
+        .filter(pl.col("pert_type") == "trt")
+        .group_by("Metadata_JCP2022")
+        .agg(pl.col("Metadata_Plate").unique().sort())
+        .group_by("Metadata_Plate")
+        .agg(pl.col("Metadata_JCP2022").sort())
+        .sort(pl.col("Metadata_Plate").list.first())
+    )
+
+    groups, plates, perts = [], set(), []
+    for plate_set, jcp_ids in plate_sets.iter_rows():
+        if perts and len(plates.union(plate_set)) > max_plates:
+            groups.append((sorted(plates), perts))
+            plates, perts = set(), []
+        plates.update(plate_set)
+        perts.extend(jcp_ids)
+    if perts:
+        groups.append((sorted(plates), perts))
+    return groups
+
+
+def score_group(
+    subset: str,
+    plates: list[str],
+    treatments: list[str],
+    negcons: list[str],
+    manifest: list[dict[str, str]],
+    batch_size: int = 20000,
+) -> pl.DataFrame:
+    """
+    Average precision of some treatments against the controls on their plates.
+
+    Parameters
+    ----------
+    subset : str
+        Name of the subset in the manifest.
+    plates : list of str
+        Plates where the treatments were assayed.
+    treatments : list of str
+        JCP2022 ids to score.
+    negcons : list of str
+        JCP2022 ids of the negative controls of the dataset.
+    manifest : list of dict
+        Manifest to resolve the subset with.
+    batch_size : int
+        Batch size passed on to copairs.
+
+    Returns
+    -------
+    polars.DataFrame
+        Metadata of the treatment wells with their average precision.
+
+    """
+    from copairs.map import average_precision
+
+    profiles = read_perturbations(subset, plates=plates, manifest=manifest).filter(
+        pl.col("Metadata_JCP2022").is_in([*treatments, *negcons])
+    )
+    profiles = annotate(profiles, ("pert_type",))
+
+    meta, features = copairs_inputs(profiles)
+    result = average_precision(
+        meta,
+        features,
+        pos_sameby=["Metadata_JCP2022"],
+        pos_diffby=[],
+        neg_sameby=[],
+        neg_diffby=["pert_type"],
+        batch_size=batch_size,
+        progress_bar=False,
+    )
+    result = pl.from_pandas(result).with_columns(pl.col(pl.Categorical).cast(pl.String))
+    return result.filter(pl.col("pert_type") == "trt")
+
+
+def _check_run(output_dir: Path, run: dict) -> None:
+    """
+    Record the parameters of a run, or check they match the recorded ones.
+
+    Raises
+    ------
+    ValueError
+        If `output_dir` holds parts of a run with other parameters (e.g., an
+        older version of the subset).
+
+    """
+    path = output_dir / RUN_FILE
+    if path.exists():
+        recorded = json.loads(path.read_text())
+        if recorded != run:
+            raise ValueError(
+                f"{output_dir} holds results of another run ({recorded}), "
+                f"not {run}; use a new output directory"
+            )
+        return
+    if any(output_dir.glob("part-*.parquet")):
+        raise ValueError(f"{output_dir} holds results of an unrecorded run")
+    path.write_text(json.dumps(run, indent=2))
+
+
+def dataset_activity(
+    subset: str,
+    output_dir: str | Path,
+    max_workers: int = 4,
+    max_plates: int = 16,
+    manifest: list[dict[str, str]] | None = None,
+    batch_size: int = 20000,
+) -> Path:
+    """
+    Compute the average precision of every treatment well in a subset.
+
+    The layout index of the subset is split in plate groups (see
+    `plate_groups`) and each group is read with `read_perturbations` and
+    scored in a separate process. Results are written as one parquet file per
+    group as soon as it finishes; groups whose file already exists are
+    skipped, so an interrupted run can be resumed by calling this function
+    again. The subset version (ETag) and the grouping parameters are recorded
+    in `output_dir`, and resuming with other ones raises an error instead of
+    mixing results of different runs.
+
+    Parameters
+    ----------
+    subset : str
+        Name of the subset in the manifest (e.g., "crispr", "orf", "compound").
+    output_dir : str or Path
+        Directory where the per-group parquet files are written.
+    max_workers : int
+        Number of processes. At most twice as many groups are loaded at once.
+    max_plates : int
+        Maximum number of plates per group, see `plate_groups`.
+    manifest : list of dict or None
+        Manifest to resolve the subset with. If None the default one is loaded.
+    batch_size : int
+        Batch size passed on to copairs.
+
+    Returns
+    -------
+    Path
+        The output directory.
+
+    Raises
+    ------
+    ValueError
+        If `output_dir` holds results of a run with another subset version or
+        `max_plates`.
+
+    """
+    if manifest is None:
+        manifest = get_manifest()
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    entry = get_entry(subset, manifest)
+    _check_run(
+        output_dir,
+        {
+            "subset": entry["subset"],
+            "etag": normalise_etag(entry["etag"]),
+            "max_plates": max_plates,
+        },
+    )
+
+    # Build the indices before the workers need them
+    get_rowgroup_index(subset, manifest)
+    layout = get_layout_index(subset, manifest).wells
+    negcons = (
+        layout
+        .filter(pl.col("pert_type") == "negcon")
+        .get_column("Metadata_JCP2022")
+        .unique()
+        .to_list()
+    )
+
+    jobs = []
+    for plates, treatments in plate_groups(layout, max_plates):
+        name = sha1(",".join(treatments).encode()).hexdigest()[:16]
+        part = output_dir / f"part-{name}.parquet"
+        if not part.exists():
+            args = (subset, plates, treatments, negcons, manifest, batch_size)
+            jobs.append((part, args))
+
+    for part, result in map_unordered(score_group, jobs, max_workers):
+        tmp = part.with_suffix(".tmp")
+        result.write_parquet(tmp)
+        tmp.replace(part)
+
+    return output_dir
+
+
+def summarise_activity(
+    output_dir: str | Path,
+    null_size: int = 10000,
+    threshold: float = 0.05,
+    seed: int = 0,
+) -> pl.DataFrame:
+    """
+    Mean average precision per perturbation from `dataset_activity` results.
+
+    Parameters
+    ----------
+    output_dir : str or Path
+        Directory written by `dataset_activity`.
+    null_size : int
+        Size of the null distribution used by copairs to compute p-values.
+    threshold : float
+        Corrected p-value below which a perturbation is deemed active.
+    seed : int
+        Random seed of the null distribution.
+
+    Returns
+    -------
+    polars.DataFrame
+        One row per perturbation with its mAP and (corrected) p-values.
+
+    """
+    from copairs.map import mean_average_precision
+
+    ap_scores = pl.read_parquet(Path(output_dir) / "part-*.parquet")
+    result = mean_average_precision(
+        ap_scores.to_pandas(),
+        ["Metadata_JCP2022"],
+        null_size=null_size,
+        threshold=threshold,
+        seed=seed,
+        progress_bar=False,
+    )
+    return pl.DataFrame(result)
@@ -0,0 +1,507 @@
+#!/usr/bin/env python
+"""
+Approximate nearest-neighbour search over well-level profiles.
+
+Finding the wells that look like a query by comparing it against every
+profile of the `all` dataset touches hundreds of thousands of vectors per
+query. This module builds an inverted file index with product quantization
+(IVF-PQ) in NumPy:
+
+- Profiles are scaled to unit length, so that Euclidean distances rank them
+  like cosine similarities.
+- k-means splits them into `n_lists` clusters (the inverted lists).
+- The residual of every profile to its cluster centre is split into
+  `n_subspaces` chunks, and each chunk is replaced by the nearest of 256
+  centroids learnt for that chunk, i.e. one byte.
+
+A query is only compared against the profiles in its `n_probe` nearest
+lists, using precomputed tables of distances between its residual and the
+chunk centroids. Increasing `n_probe` trades speed for recall. Metadata of
+every well is stored with the index, so results can be restricted to some
+sources or perturbation types.
+
+Use cases:
+# Index the wells of the whole dataset
+index = build_ann_index("all", "all_ann")
+# Ten most similar treated wells from two sources for a batch of profiles
+index = AnnIndex.load("all_ann")
+filters = {"pert_type": ["trt"], "Metadata_Source": ["source_4", "source_13"]}
+index.search(feature_matrix(profiles, index.features), k=10, filters=filters)
+"""
+
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+
+from jump_deps.annotate import annotate
+from jump_deps.cache import ProfileCache
+from jump_deps.matrix import feature_matrix, split_columns
+from jump_deps.remote import open_parquet
+from jump_deps.similarity import normalise_rows
+
+INDEX_FILE = "ivfpq.npz"
+METADATA_FILE = "metadata.parquet"
+METADATA_COLUMNS = (
+    "Metadata_Source",
+    "Metadata_Plate",
+    "Metadata_Well",
+    "Metadata_JCP2022",
+)
+
+
+def squared_distances(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Squared Euclidean distances between the rows of two matrices."""
+    return (
+        np.einsum("ij,ij->i", x, x)[:, None]
+        - 2 * x @ centroids.T
+        + np.einsum("ij,ij->i", centroids, centroids)[None]
+    )
+
+
+def assign(x: np.ndarray, centroids: np.ndarray, batch_size: int = 65536) -> np.ndarray:
+    """Index of the nearest centroid of every row, computed in batches."""
+    return np.concatenate([
+        squared_distances(x[i : i + batch_size], centroids).argmin(axis=1)
+        for i in range(0, len(x), batch_size)
+    ])
+
+
+def pad(x: np.ndarray, n_subspaces: int) -> np.ndarray:
+    """Append zero columns so that features split evenly into subspaces."""
+    missing = -x.shape[1] % n_subspaces
+    if not missing:
+        return x
+    return np.pad(x, ((0, 0), (0, missing)))
+
+
+def kmeans(
+    x: np.ndarray, n_clusters: int, n_iter: int = 20, seed: int = 0
+) -> np.ndarray:
+    """
+    Lloyd's k-means.
+
+    Parameters
+    ----------
+    x : numpy.ndarray
+        (n_samples, n_features) training data.
+    n_clusters : int
+        Number of centroids; reduced to the number of samples if larger.
+    n_iter : int
+        Number of iterations.
+    seed : int
+        Seed of the initial choice of centroids.
+
+    Returns
+    -------
+    numpy.ndarray
+        (n_clusters, n_features) centroids. Empty clusters are re-seeded with
+        random samples.
+
+    """
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(x))
+    centroids = x[rng.choice(len(x), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        labels = assign(x, centroids)
+        counts = np.bincount(labels, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, x)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        centroids[empty] = x[rng.choice(len(x), empty.sum(), replace=False)]
+    return centroids
+
+
+class AnnIndex:
+    """
+    Inverted file index with product quantization.
+
+    Parameters
+    ----------
+    centroids : numpy.ndarray
+        (n_lists, n_features) centres of the inverted lists.
+    codebooks : numpy.ndarray
+        (n_subspaces, 256, n_features / n_subspaces) centroids of the residual
+        chunks.
+    codes : numpy.ndarray
+        (n_profiles, n_subspaces) uint8 codes, grouped by list.
+    offsets : numpy.ndarray
+        (n_lists + 1,) start of each list in `codes`.
+    ids : numpy.ndarray
+        (n_profiles,) row of `metadata` of every code.
+    metadata : polars.DataFrame
+        Metadata of the indexed profiles.
+    features : list of str
+        Feature columns, in the order used by the index.
+
+    """
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        codebooks: np.ndarray,
+        codes: np.ndarray,
+        offsets: np.ndarray,
+        ids: np.ndarray,
+        metadata: pl.DataFrame,
+        features: list[str],
+    ):
+        self.centroids = centroids
+        self.codebooks = codebooks
+        self.codes = codes
+        self.offsets = offsets
+        self.ids = ids
+        self.metadata = metadata
+        self.features = features
+        self.pending: list[tuple[np.ndarray, np.ndarray, pl.DataFrame]] = []
+
+    @classmethod
+    def train(
+        cls,
+        sample: np.ndarray,
+        features: list[str],
+        n_lists: int = 1024,
+        n_subspaces: int = 32,
+        n_iter: int = 20,
+        seed: int = 0,
+    ) -> "AnnIndex":
+        """
+        Learn the list centres and the codebooks from a sample of profiles.
+
+        Parameters
+        ----------
+        sample : numpy.ndarray
+            (n_samples, n_features) profiles; tens of samples per list suffice.
+        features : list of str
+            Names of the columns of `sample`.
+        n_lists : int
+            Number of inverted lists.
+        n_subspaces : int
+            Number of chunks (bytes) each profile is encoded into. Features
+            are zero-padded to a multiple of it.
+        n_iter : int
+            k-means iterations.
+        seed : int
+            Random seed.
+
+        Returns
+        -------
+        AnnIndex
+            Empty index.
+
+        """
+        sample = pad(normalise_rows(sample.astype(np.float32)), n_subspaces)
+        centroids = kmeans(sample, n_lists, n_iter, seed)
+        residuals = sample - centroids[assign(sample, centroids)]
+        chunks = np.split(residuals, n_subspaces, axis=1)
+        codebooks = np.stack([kmeans(c, 256, n_iter, seed) for c in chunks])
+        return cls(
+            centroids,
+            codebooks,
+            np.empty((0, n_subspaces), np.uint8),
+            np.zeros(len(centroids) + 1, np.int64),
+            np.empty(0, np.int64),
+            pl.DataFrame(),
+            features,
+        )
+
+    def encode(self, x: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Inverted list and PQ code of each profile."""
+        x = pad(normalise_rows(x.astype(np.float32)), len(self.codebooks))
+        lists = assign(x, self.centroids)
+        chunks = np.split(x - self.centroids[lists], len(self.codebooks), axis=1)
+        codes = np.stack(
+            [assign(c, cb) for c, cb in zip(chunks, self.codebooks)], axis=1
+        ).astype(np.uint8)
+        return lists, codes
+
+    def add(self, x: np.ndarray, metadata: pl.DataFrame) -> None:
+        """
+        Add profiles to the index.
+
+        Profiles are encoded right away but only sorted into their lists by
+        `finalise`, which `search` and `save` call, so adding many batches
+        does not re-sort the whole index every time.
+
+        Parameters
+        ----------
+        x : numpy.ndarray
+            (n_profiles, n_features) profiles, with columns in `self.features`.
+        metadata : polars.DataFrame
+            One row per profile, appended to `self.metadata`.
+
+        """
+        lists, codes = self.encode(x)
+        self.pending.append((lists, codes, metadata))
+
+    def finalise(self) -> None:
+        """Sort the profiles added since the last call into their lists."""
+        if not self.pending:
+            return
+        lists, codes, metadata = zip(*self.pending)
+        old_lists = np.repeat(np.arange(len(self.centroids)), np.diff(self.offsets))
+        all_lists = np.concatenate([old_lists, *lists])
+        order = np.argsort(all_lists, kind="stable")
+        n_new = len(all_lists) - len(old_lists)
+        ids = np.concatenate([self.ids, np.arange(n_new) + self.metadata.height])
+
+        self.codes = np.concatenate([self.codes, *codes])[order]
+        self.ids = ids[order]
+        self.offsets = np.concatenate([
+            [0],
+            np.cumsum(np.bincount(all_lists, minlength=len(self.centroids))),
+        ])
+        self.metadata = pl.concat([self.metadata, *metadata], how="diagonal_relaxed")
+        self.pending = []
+
+    def _scan(
+        self,
+        queries: np.ndarray,
+        rows: np.ndarray,
+        lists: np.ndarray,
+        allowed: np.ndarray | None = None,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Approximate distances from some queries to the profiles of some lists.
+
+        Queries are grouped by the list they probe, so that every list is
+        visited once, with a single distance table for all its queries.
+
+        Parameters
+        ----------
+        queries : numpy.ndarray
+            (n_queries, n_padded_features) unit-length, padded queries.
+        rows : numpy.ndarray
+            (m,) positions in `queries` of the queries to scan.
+        lists : numpy.ndarray
+            (m, n_probed) lists probed by each of them.
+        allowed : numpy.ndarray or None
+            Boolean mask over `self.metadata` of the profiles that may be
+            returned.
+
+        Returns
+        -------
+        tuple of numpy.ndarray
+            Position of the query, row of `self.metadata` and squared distance
+            of every (query, profile) pair.
+
+        """
+        query_rows = np.repeat(rows, lists.shape[1])
+        lists = lists.ravel()
+        order = np.argsort(lists, kind="stable")
+        query_rows, lists = query_rows[order], lists[order]
+        bounds = np.flatnonzero(np.diff(lists)) + 1
+
+        n_subspaces = len(self.codebooks)
+        codebook_norms = np.einsum("skd,skd->sk", self.codebooks, self.codebooks)
+        found = []
+        for group, list_id in zip(
+            np.split(query_rows, bounds), lists[np.r_[0, bounds].astype(int)]
+        ):
+            start, end = self.offsets[list_id], self.offsets[list_id + 1]
+            ids, codes = self.ids[start:end], self.codes[start:end]
+            if allowed is not None:
+                ids, codes = ids[allowed[ids]], codes[allowed[ids]]
+            if not len(ids):
+                continue
+            residuals = queries[group] - self.centroids[list_id]
+            chunks = residuals.reshape(len(group), n_subspaces, -1)
+            # Distance of each query chunk to each of its 256 centroids
+            tables = (
+                (chunks**2).sum(axis=2)[..., None]
+                - 2 * np.einsum("msd,skd->msk", chunks, self.codebooks)
+                + codebook_norms
+            )
+            distances = np.zeros((len(group), len(ids)), np.float32)
+            for subspace in range(n_subspaces):
+                distances += tables[:, subspace, codes[:, subspace]]
+            found.append((
+                np.repeat(group, len(ids)),
+                np.tile(ids, len(group)),
+                distances.ravel(),
+            ))
+        if not found:
+            return np.empty(0, int), np.empty(0, int), np.empty(0, np.float32)
+        return tuple(np.concatenate(x) for x in zip(*found))
+
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int = 10,
+        n_probe: int = 8,
+        filters: dict[str, list] | None = None,
+    ) -> pl.DataFrame:
+        """
+        Approximate top-k most similar profiles of a batch of queries.
+
+        Filters are applied while scanning the lists, so the `n_probe`
+        nearest lists of a query may hold fewer than `k` profiles that pass
+        them. Such queries probe further lists, doubling the number of probed
+        lists each time, until `k` results pass or every list was visited.
+        Fewer than `k` rows are only returned for a query when fewer than `k`
+        indexed profiles pass the filters.
+
+        Parameters
+        ----------
+        queries : numpy.ndarray
+            (n_queries, n_features) profiles, with columns in `self.features`.
+        k : int
+            Number of neighbours per query.
+        n_probe : int
+            Inverted lists visited per query, at least. Higher values increase
+            recall and cost; `n_lists` makes the search exhaustive.
+        filters : dict or None
+            Maps metadata columns to the values that results may take (e.g.,
+            {"Metadata_Source": ["source_13"], "pert_type": ["trt"]}).
+
+        Returns
+        -------
+        polars.DataFrame
+            Columns query (position in `queries`), rank, similarity (the
+            approximate cosine similarity) and the metadata of the result.
+
+        """
+        self.finalise()
+        allowed = None
+        if filters:
+            predicate = pl.all_horizontal(
+                pl.col(column).is_in(values) for column, values in filters.items()
+            )
+            allowed = self.metadata.select(predicate).to_series().to_numpy()
+
+        queries = pad(normalise_rows(queries.astype(np.float32)), len(self.codebooks))
+        probes = np.argsort(squared_distances(queries, self.centroids), axis=1)
+        n_lists = len(self.centroids)
+
+        found = []
+        counts = np.zeros(len(queries), np.int64)
+        rows, start, stop = np.arange(len(queries)), 0, min(n_probe, n_lists)
+        while len(rows) and start < n_lists:
+            found.append(self._scan(queries, rows, probes[rows, start:stop], allowed))
+            counts += np.bincount(found[-1][0], minlength=len(queries))
+            rows = rows[counts[rows] < k]
+            start, stop = stop, min(2 * stop, n_lists)
+
+        if not found:
+            return pl.DataFrame()
+        query_rows, ids, distances = (np.concatenate(x) for x in zip(*found))
+        if not len(ids):
+            return pl.DataFrame()
+        order = np.lexsort((distances, query_rows))
+        query_rows, ids, distances = query_rows[order], ids[order], distances[order]
+        rank = np.arange(len(ids)) - np.searchsorted(query_rows, query_rows)
+        top = rank < k
+        return (
+            self
+            .metadata[ids[top]]
+            .with_columns(
+                query=pl.Series(query_rows[top]),
+                rank=pl.Series(rank[top] + 1),
+                # Unit vectors: squared distance = 2 - 2 * cosine similarity
+                similarity=pl.Series(1 - distances[top] / 2),
+            )
+            .select(
+                "query", "rank", "similarity", pl.exclude("query", "rank", "similarity")
+            )
+        )
+
+    def save(self, path: str | Path) -> None:
+        """Store the index and its metadata in a directory."""
+        self.finalise()
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            path / INDEX_FILE,
+            centroids=self.centroids,
+            codebooks=self.codebooks,
+            codes=self.codes,
+            offsets=self.offsets,
+            ids=self.ids,
+            features=np.array(self.features),
+        )
+        self.metadata.write_parquet(path / METADATA_FILE)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "AnnIndex":
+        """Load an index stored with `save`."""
+        path = Path(path)
+        with np.load(path / INDEX_FILE) as data:
+            arrays = {k: data[k] for k in data.files}
+        return cls(
+            arrays["centroids"],
+            arrays["codebooks"],
+            arrays["codes"],
+            arrays["offsets"],
+            arrays["ids"],
+            pl.read_parquet(path / METADATA_FILE),
+            arrays["features"].tolist(),
+        )
+
+
+def build_ann_index(
+    subset: str,
+    path: str | Path,
+    n_lists: int = 1024,
+    n_subspaces: int = 32,
+    n_train: int = 100_000,
+    batch_size: int = 65536,
+    seed: int = 0,
+    cache_dir: str | Path | None = None,
+) -> AnnIndex:
+    """
+    Index the wells of a profile subset, reading it in batches.
+
+    Parameters
+    ----------
+    subset : str
+        Name of the subset in the manifest (e.g., "crispr" or "all").
+    path : str or Path
+        Directory where the index is stored.
+    n_lists : int
+        Number of inverted lists, see `AnnIndex.train`.
+    n_subspaces : int
+        Bytes per profile, see `AnnIndex.train`.
+    n_train : int
+        Number of randomly sampled wells used for training.
+    batch_size : int
+        Wells encoded at a time.
+    seed : int
+        Random seed.
+    cache_dir : str, Path or None
+        Root of the local cache, see `jump_deps.manifest.get_cache_dir`.
+
+    Returns
+    -------
+    AnnIndex
+        Index of all the wells, with their metadata and pert_type.
+
+    """
+    local = ProfileCache(cache_dir=cache_dir).path(subset)
+    pf = open_parquet(local)
+    lazy = pl.scan_parquet(local)
+    features = split_columns(lazy)[1]
+    metadata = [c for c in METADATA_COLUMNS if c in lazy.collect_schema()]
+
+    n_rows = pf.metadata.num_rows
+    rows = np.random.default_rng(seed).choice(n_rows, min(n_train, n_rows), False)
+    sample = (
+        lazy
+        .with_row_index()
+        .filter(pl.col("index").is_in(rows))
+        .select(features)
+        .collect(engine="streaming")
+    )
+    index = AnnIndex.train(
+        feature_matrix(sample, features), features, n_lists, n_subspaces, seed=seed
+    )
+    del sample
+
+    for batch in pf.iter_batches(batch_size=batch_size, columns=[*metadata, *features]):
+        profiles = pl.from_arrow(batch)
+        index.add(
+            feature_matrix(profiles, features),
+            annotate(profiles.select(metadata), ("pert_type",)),
+        )
+    index.save(path)
+    return index
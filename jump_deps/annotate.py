@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""
+Bulk annotation of profiles with the broad_babel translation table.
+
+Instead of building one Python dictionary per output column with
+`broad_babel.query.get_mapper` and applying it with `replace`, the babel
+table is loaded once into polars and joined against the profiles. This adds
+any number of columns in a single vectorised pass and works on lazy frames,
+so it scales to the full crispr, orf and compound datasets.
+
+Use cases:
+# Add perturbation type and gene/compound name
+annotate(profiles, {"pert_type": "pert_type", "standard_key": "name"})
+# Keep it lazy
+annotate(pl.scan_parquet(path), ("plate_type",)).collect()
+"""
+
+import sqlite3
+from contextlib import closing
+from functools import cache
+
+import polars as pl
+
+BABEL_COLUMNS = (
+    "standard_key",
+    "JCP2022",
+    "plate_type",
+    "NCBI_Gene_ID",
+    "broad_sample",
+    "pert_type",
+)
+
+
+@cache
+def get_babel_table() -> pl.DataFrame:
+    """
+    Load the broad_babel translation table into polars.
+
+    Returns
+    -------
+    polars.DataFrame
+        Entire babel table, one row per entry of the sqlite database.
+
+    """
+    from broad_babel.query import DB_FILE, TABLE
+
+    with closing(sqlite3.connect(DB_FILE)) as con:
+        cursor = con.execute(f"SELECT {','.join(BABEL_COLUMNS)} FROM {TABLE}")
+        rows = cursor.fetchall()
+    return pl.DataFrame(
+        rows,
+        schema=dict.fromkeys(BABEL_COLUMNS, pl.String),
+        orient="row",
+        strict=False,
+    )
+
+
+def get_translation(
+    output_columns: tuple[str] | dict[str, str],
+    input_column: str = "JCP2022",
+) -> pl.DataFrame:
+    """
+    Build a one-row-per-identifier lookup table from the babel table.
+
+    Parameters
+    ----------
+    output_columns : tuple of str or dict
+        Babel columns to add. A dictionary maps babel columns to the names
+        they will take in the output.
+    input_column : str
+        Babel column that identifies the profiles, usually JCP2022.
+
+    Returns
+    -------
+    polars.DataFrame
+        Table keyed by `input_column` with the requested output columns.
+
+    Raises
+    ------
+    ValueError
+        If any of the columns is not in the babel table.
+
+    """
+    if not isinstance(output_columns, dict):
+        output_columns = {k: k for k in output_columns}
+    input_column = input_column.removeprefix("Metadata_")
+    invalid = {input_column, *output_columns}.difference(BABEL_COLUMNS)
+    if invalid:
+        raise ValueError(f"Invalid babel column(s) {invalid}, valid: {BABEL_COLUMNS}")
+
+    return (
+        get_babel_table()
+        .select(input_column, *output_columns)
+        .drop_nulls(input_column)
+        # Remove duplicates (e.g., different broad ids, same JUMP ids)
+        .unique(subset=input_column, keep="first", maintain_order=True)
+        .rename({k: v for k, v in output_columns.items() if k != input_column})
+    )
+
+
+def annotate(
+    profiles: pl.DataFrame | pl.LazyFrame,
+    output_columns: tuple[str] | dict[str, str] = ("pert_type", "standard_key"),
+    input_column: str = "Metadata_JCP2022",
+) -> pl.DataFrame | pl.LazyFrame:
+    """
+    Add babel columns to profiles with a single left join.
+
+    Parameters
+    ----------
+    profiles : polars.DataFrame or polars.LazyFrame
+        Profiles containing `input_column`.
+    output_columns : tuple of str or dict
+        Babel columns to add. A dictionary maps babel columns to the names
+        they will take in the output (e.g., {"standard_key": "name"}).
+    input_column : str
+        Column of the profiles to join on. Its name without the "Metadata_"
+        prefix must be a babel column.
+
+    Returns
+    -------
+    polars.DataFrame or polars.LazyFrame
+        Same type as the input, with the new columns appended. Identifiers
+        absent from babel get null values.
+
+    """
+    babel_column = input_column.removeprefix("Metadata_")
+    translation = get_translation(output_columns, babel_column).rename({
+        babel_column: input_column
+    })
+    if isinstance(profiles, pl.LazyFrame):
+        translation = translation.lazy()
+
+    return profiles.join(translation, on=input_column, how="left")
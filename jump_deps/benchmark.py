@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+"""
+Time and peak memory of each pipeline stage on synthetic JUMP-shaped data.
+
+Every stage runs in a fresh process, so its peak resident memory is its own
+and includes allocations made by polars and Arrow outside of Python. Each
+stage prepares its inputs first and only the work that follows is timed;
+the fastest of a few repeats is reported. Results can be compared with a
+previous run to catch regressions before they ship.
+
+Stages:
+- manifest_summary: footer statistics of the profile file
+- filtering: lazy scan filtered to a few hundred perturbations
+- annotation: babel join of the metadata of every well (treatments of
+  generated profiles carry real JCP2022 ids sampled from babel)
+- map: copairs mean average precision of the wells of a few plates
+- cosine_similarity: consensus profiles and their similarity matrix
+- feature_tests: Welch and Mann-Whitney tests of treatments vs controls
+- image_compositing: montages of synthetic five-channel sites
+
+Use cases:
+python -m jump_deps.benchmark --rows 200000 --output bench.parquet
+python -m jump_deps.benchmark --baseline bench.parquet --output new.parquet
+"""
+
+import argparse
+import resource
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import polars as pl
+import polars.selectors as cs
+
+from jump_deps.pool import spawn_pool
+from jump_deps.synthetic import NEGCON_ID, synthetic_profiles, synthetic_site
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+def babel_jcp_ids(n: int, seed: int = 0) -> list[str]:
+    """Random JCP2022 ids of treatments in babel, for synthetic layouts."""
+    from jump_deps.annotate import get_babel_table
+
+    jcp_ids = (
+        get_babel_table()
+        .filter(pl.col("pert_type") == "trt")
+        .get_column("JCP2022")
+        .drop_nulls()
+        .unique()
+        .sort()
+    )
+    return jcp_ids.sample(min(n, len(jcp_ids)), seed=seed, shuffle=True).to_list()
+
+
+def _first_plates(path: Path, n_plates: int) -> pl.DataFrame:
+    lazy = pl.scan_parquet(path)
+    plates = (
+        lazy
+        .select(pl.col("Metadata_Plate").unique(maintain_order=True).head(n_plates))
+        .collect()
+        .get_column("Metadata_Plate")
+    )
+    return lazy.filter(pl.col("Metadata_Plate").is_in(plates.to_list())).collect()
+
+
+def manifest_summary(path: Path) -> Callable[[], object]:
+    from jump_deps.stats import footer_statistics
+
+    return lambda: footer_statistics(path)
+
+
+def filtering(path: Path) -> Callable[[], object]:
+    jcp_ids = (
+        pl
+        .scan_parquet(path)
+        .select(pl.col("Metadata_JCP2022").unique().sort().head(500))
+        .collect()
+        .get_column("Metadata_JCP2022")
+        .to_list()
+    )
+    return lambda: (
+        pl
+        .scan_parquet(path)
+        .filter(pl.col("Metadata_JCP2022").is_in(jcp_ids))
+        .collect()
+    )
+
+
+def annotation(path: Path) -> Callable[[], object]:
+    from jump_deps.annotate import annotate, get_babel_table
+
+    get_babel_table()
+    lazy = pl.scan_parquet(path).select("^Metadata_.*$")
+    return lambda: annotate(lazy, ("pert_type", "standard_key")).collect()
+
+
+def mean_average_precision(path: Path) -> Callable[[], object]:
+    from copairs.map import average_precision
+    from copairs.map import mean_average_precision as map_scores
+
+    from jump_deps.matrix import copairs_inputs
+
+    profiles = _first_plates(path, 8).with_columns(
+        pl
+        .when(pl.col("Metadata_JCP2022") == NEGCON_ID)
+        .then(pl.lit("negcon"))
+        .otherwise(pl.lit("trt"))
+        .alias("Metadata_pert_type")
+    )
+
+    def run():
+        meta, features = copairs_inputs(profiles)
+        result = average_precision(
+            meta,
+            features,
+            pos_sameby=["Metadata_JCP2022"],
+            pos_diffby=[],
+            neg_sameby=[],
+            neg_diffby=["Metadata_pert_type"],
+            progress_bar=False,
+        )
+        result = result.query("Metadata_pert_type == 'trt'")
+        return map_scores(
+            result, ["Metadata_JCP2022"], null_size=1000, threshold=0.05, seed=0
+        )
+
+    return run
+
+
+def cosine_similarity(path: Path) -> Callable[[], object]:
+    from jump_deps.consensus import consensus_frame
+    from jump_deps.correlation import correlation_matrix
+    from jump_deps.matrix import feature_matrix, split_columns
+
+    def run():
+        consensus = consensus_frame(
+            pl.scan_parquet(path).select("Metadata_JCP2022", cs.float())
+        )
+        features = feature_matrix(consensus, split_columns(consensus)[1])
+        return correlation_matrix(features)
+
+    return run
+
+
+def feature_tests(path: Path) -> Callable[[], object]:
+    from jump_deps.feature_stats import compare_clusters
+
+    profiles = _first_plates(path, 8).drop(
+        "Metadata_Source", "Metadata_Plate", "Metadata_Well"
+    )
+    treatments = (
+        profiles.get_column("Metadata_JCP2022").unique().sort().head(50).to_list()
+    )
+    pairs = [(x, NEGCON_ID) for x in treatments if x != NEGCON_ID]
+    return lambda: compare_clusters(profiles, "Metadata_JCP2022", pairs)
+
+
+def image_compositing(path: Path) -> Callable[[], object]:
+    from jump_deps.gallery import site_montage
+
+    sites = [synthetic_site(seed=seed) for seed in range(8)]
+    return lambda: [site_montage(images) for images in sites]
+
+
+STAGES = {
+    "manifest_summary": manifest_summary,
+    "filtering": filtering,
+    "annotation": annotation,
+    "map": mean_average_precision,
+    "cosine_similarity": cosine_similarity,
+    "feature_tests": feature_tests,
+    "image_compositing": image_compositing,
+}
+
+
+def run_stage(name: str, path: Path, repeat: int) -> dict:
+    """
+    Prepare and time one stage; meant to run in its own process.
+
+    Returns
+    -------
+    dict
+        Fastest time in seconds, peak resident memory of the process and how
+        much of it was reached after the inputs were prepared, in MB.
+
+    """
+    run = STAGES[name](path)
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "stage": name,
+        "seconds": min(times),
+        "peak_rss_mb": peak * RSS_UNIT / 1e6,
+        "stage_rss_mb": (peak - before) * RSS_UNIT / 1e6,
+    }
+
+
+def run_benchmarks(
+    path: str | Path,
+    stages: list[str] | None = None,
+    repeat: int = 3,
+) -> pl.DataFrame:
+    """
+    Benchmark pipeline stages on a profile file.
+
+    Parameters
+    ----------
+    path : str or Path
+        Parquet file of profiles, e.g. from `jump_deps.synthetic.synthetic_profiles`.
+    stages : list of str or None
+        Names of the stages to run (see `STAGES`). All of them if None.
+    repeat : int
+        Timed runs per stage.
+
+    Returns
+    -------
+    polars.DataFrame
+        One row per stage, see `run_stage`.
+
+    """
+    results = []
+    for name in stages or STAGES:
+        # A fresh process per stage keeps peak memory measurements apart
+        with spawn_pool(1) as executor:
+            results.append(
+                executor.submit(run_stage, name, Path(path), repeat).result()
+            )
+    return pl.DataFrame(results)
+
+
+def compare_benchmarks(
+    current: pl.DataFrame,
+    baseline: pl.DataFrame,
+    time_tolerance: float = 0.25,
+    memory_tolerance: float = 0.25,
+) -> pl.DataFrame:
+    """
+    Flag stages that became slower or use more memory than in a baseline.
+
+    Parameters
+    ----------
+    current, baseline : polars.DataFrame
+        Outputs of `run_benchmarks`.
+    time_tolerance, memory_tolerance : float
+        Relative increase above which a stage is flagged.
+
+    Returns
+    -------
+    polars.DataFrame
+        The current results with the baseline values, their ratios and a
+        boolean regression column. Memory is compared on stage_rss_mb, the
+        memory used by the timed work itself, since the peak of the process
+        also includes imports and input preparation.
+
+    """
+    return (
+        current
+        .join(baseline, on="stage", how="left", suffix="_baseline")
+        .with_columns(
+            (pl.col("seconds") / pl.col("seconds_baseline")).alias("time_ratio"),
+            # Stages that barely grow the process would otherwise divide by ~0
+            (pl.col("stage_rss_mb") / pl.col("stage_rss_mb_baseline").clip(1.0)).alias(
+                "memory_ratio"
+            ),
+        )
+        .with_columns(
+            (
+                (pl.col("time_ratio") > 1 + time_tolerance)
+                | (pl.col("memory_ratio") > 1 + memory_tolerance)
+            )
+            .fill_null(False)
+            .alias("regression")
+        )
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--features", type=int, default=500)
+    parser.add_argument("--sources", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES))
+    parser.add_argument("--profiles", type=Path, help="Existing profiles to reuse")
+    parser.add_argument("--output", type=Path, help="Parquet file for the results")
+    parser.add_argument("--baseline", type=Path, help="Previous results to compare")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.profiles
+        if path is None:
+            jcp_ids = None
+            if "annotation" in (args.stages or STAGES):
+                # About one treatment per four wells, see synthetic_layout
+                jcp_ids = babel_jcp_ids(args.rows // 4 + 1)
+            path = synthetic_profiles(
+                Path(tmp) / "profiles.parquet",
+                n_rows=args.rows,
+                n_features=args.features,
+                n_sources=args.sources,
+                jcp_ids=jcp_ids,
+            )
+        results = run_benchmarks(path, args.stages, args.repeat)
+
+    if args.output is not None:
+        results.write_parquet(args.output)
+    if args.baseline is not None:
+        results = compare_benchmarks(
+            results, pl.read_parquet(args.baseline), args.tolerance, args.tolerance
+        )
+    with pl.Config(tbl_rows=len(STAGES), tbl_cols=-1):
+        print(results)
+    if "regression" in results.columns and results.get_column("regression").any():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
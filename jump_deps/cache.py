@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+"""
+Local cache of the profile files listed in the JUMP manifest.
+
+Profiles are stored under the ETag recorded in the manifest, so a new release
+of a subset (which comes with a new ETag) never collides with an older one,
+and an existing local file is trusted without contacting the server. Files
+are evicted least-recently-used first once the cache exceeds its byte budget.
+
+Use cases:
+# Local path to the crispr profiles, downloading them only on the first call
+path = get_profile_path("crispr")
+# Lazy frame over the local copy
+profiles = scan_profiles("crispr")
+"""
+
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import polars as pl
+import requests
+
+from jump_deps.io_trace import record_lookup, record_request
+from jump_deps.manifest import get_cache_dir, get_entry, get_manifest
+
+DEFAULT_MAX_BYTES = 50e9
+
+
+def normalise_etag(etag: str) -> str:
+    """Remove quotes and weak-validator prefixes from an ETag."""
+    return etag.removeprefix("W/").strip('"')
+
+
+def index_path(
+    entry: dict[str, str], kind: str, cache_dir: str | Path | None = None
+) -> Path:
+    """
+    Location of an index built from one version of a manifest subset.
+
+    Parameters
+    ----------
+    entry : dict
+        Manifest entry of the subset, with its subset name and ETag.
+    kind : str
+        Kind of index (e.g., "rowgroups" or "layout"), part of the file name.
+    cache_dir : str, Path or None
+        Root of the local cache, see `jump_deps.manifest.get_cache_dir`.
+
+    Returns
+    -------
+    Path
+        Parquet file under the indices directory of the cache, which is
+        created if needed.
+
+    """
+    index_dir = get_cache_dir(cache_dir) / "indices"
+    index_dir.mkdir(parents=True, exist_ok=True)
+    etag = normalise_etag(entry["etag"])
+    return index_dir / f"{entry['subset']}-{etag}.{kind}.parquet"
+
+
+class LRUDirectory:
+    """
+    Directory of files that are evicted least-recently-used first.
+
+    The modification time of each file doubles as its last access time, so the
+    state of the cache lives entirely in the filesystem and is shared by
+    every process that uses the same directory.
+    """
+
+    def __init__(self, root: str | Path, max_bytes: float = DEFAULT_MAX_BYTES):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def get(self, name: str) -> Path | None:
+        """Return the path of a cached file and mark it as recently used."""
+        path = self.root / name
+        hit = path.exists()
+        record_lookup(self.root.name, hit)
+        if not hit:
+            return None
+        os.utime(path)
+        return path
+
+    def put(self, name: str, src: str | Path, evict: bool = True) -> Path:
+        """
+        Move a finished file into the cache and enforce the byte budget.
+
+        Set `evict` to False when adding many files at once, and call `evict`
+        after the last one, to list the cache only once.
+        """
+        path = self.root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(src, path)
+        os.utime(path)
+        if evict:
+            self.evict(keep=path)
+        return path
+
+    def tempfile(self) -> Path:
+        """Create an empty temporary file on the same filesystem as the cache."""
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".partial-")
+        os.close(fd)
+        return Path(tmp)
+
+    def entries(self) -> list[Path]:
+        """List cached files, oldest first, skipping unfinished downloads."""
+        files = [
+            p
+            for p in self.root.rglob("*")
+            if p.is_file() and not p.name.startswith(".partial-")
+        ]
+        return sorted(files, key=lambda p: p.stat().st_mtime)
+
+    def size(self) -> int:
+        """Total number of bytes held in the cache."""
+        return sum(p.stat().st_size for p in self.entries())
+
+    def evict(self, keep: Path | None = None) -> list[Path]:
+        """
+        Remove the least-recently-used files until the cache fits its budget.
+
+        Parameters
+        ----------
+        keep : Path or None
+            File that must survive the eviction, usually the one just added.
+
+        Returns
+        -------
+        list of Path
+            Removed files.
+
+        """
+        entries = self.entries()
+        total = sum(p.stat().st_size for p in entries)
+        removed = []
+        for path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            total -= path.stat().st_size
+            path.unlink(missing_ok=True)
+            removed.append(path)
+        return removed
+
+
+def _store_response(
+    response: requests.Response,
+    url: str,
+    files: LRUDirectory,
+    name: str,
+    started: float,
+) -> Path:
+    """Stream the body of a successful response into a cache directory."""
+    tmp = files.tempfile()
+    try:
+        response.raw.decode_content = True
+        with open(tmp, "wb") as f:
+            shutil.copyfileobj(response.raw, f, length=1 << 24)
+        size = tmp.stat().st_size
+        record_request(url, size, time.perf_counter() - started, size, "download")
+        return files.put(name, tmp)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def download(url: str, files: LRUDirectory, name: str) -> Path:
+    """
+    Stream a url into a cache directory, unless it is already there.
+
+    Parameters
+    ----------
+    url : str
+        Location of the file.
+    files : LRUDirectory
+        Cache directory where the file is stored.
+    name : str
+        Name of the local copy, which must identify the contents of `url`.
+
+    Returns
+    -------
+    Path
+        Local copy of the file.
+
+    """
+    local = files.get(name)
+    if local is not None:
+        return local
+    started = time.perf_counter()
+    with requests.get(url, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        return _store_response(response, url, files, name, started)
+
+
+class ProfileCache:
+    """
+    Resolve manifest subsets to local parquet files.
+
+    Parameters
+    ----------
+    cache_dir : str, Path or None
+        Root of the local cache, see `jump_deps.manifest.get_cache_dir`.
+    max_bytes : float or None
+        Disk budget for profiles. If None it is read from the environment
+        variable JUMP_DEPS_CACHE_MAX_BYTES, falling back to 50 GB.
+    manifest : list of dict or None
+        Manifest to resolve subsets with. If None the default one is loaded.
+
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | Path | None = None,
+        max_bytes: float | None = None,
+        manifest: list[dict[str, str]] | None = None,
+    ):
+        if max_bytes is None:
+            max_bytes = float(
+                os.environ.get("JUMP_DEPS_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)
+            )
+        self.cache_dir = get_cache_dir(cache_dir)
+        self.files = LRUDirectory(self.cache_dir / "profiles", max_bytes)
+        self.manifest = manifest or get_manifest(cache_dir=self.cache_dir)
+
+    @staticmethod
+    def filename(entry: dict[str, str]) -> str:
+        """Name of the local copy of a manifest entry."""
+        return f"{entry['subset']}-{normalise_etag(entry['etag'])}.parquet"
+
+    def local(self, subset: str) -> Path | None:
+        """Return the local copy of a subset if it has been downloaded."""
+        return self.files.get(self.filename(get_entry(subset, self.manifest)))
+
+    def path(self, subset: str, revalidate: bool = False) -> Path:
+        """
+        Return the local parquet file of a subset, downloading it if needed.
+
+        Parameters
+        ----------
+        subset : str
+            Name of the subset in the manifest.
+        revalidate : bool
+            Ask the server whether the local copy still matches the manifest
+            ETag with a conditional GET. By default a local copy is trusted,
+            because the ETag already identifies its contents.
+
+        Returns
+        -------
+        Path
+            Local parquet file.
+
+        """
+        entry = get_entry(subset, self.manifest)
+        name = self.filename(entry)
+        local = self.files.get(name)
+        if local is not None and not revalidate:
+            return local
+        return self._download(entry, name, local)
+
+    def _download(self, entry: dict[str, str], name: str, local: Path | None) -> Path:
+        expected = normalise_etag(entry["etag"])
+        headers = {"If-None-Match": f'"{expected}"'} if local is not None else {}
+        started = time.perf_counter()
+        with requests.get(
+            entry["url"], headers=headers, stream=True, timeout=60
+        ) as response:
+            if response.status_code == 304:
+                return local
+            response.raise_for_status()
+            served = normalise_etag(response.headers.get("ETag", expected))
+            if served != expected:
+                raise ValueError(
+                    f"{entry['url']} has ETag {served} but the manifest "
+                    f"expects {expected}; the manifest may be outdated."
+                )
+            return _store_response(response, entry["url"], self.files, name, started)
+
+    def scan(self, subset: str, **kwargs) -> pl.LazyFrame:
+        """Lazy-load the local copy of a subset with polars."""
+        return pl.scan_parquet(self.path(subset), **kwargs)
+
+    def cached(self) -> pl.DataFrame:
+        """Table of the profile files currently in the cache."""
+        return pl.DataFrame(
+            [
+                {
+                    "file": p.name,
+                    "size_mb": round(p.stat().st_size / 1e6, 1),
+                    "last_used": time.strftime(
+                        "%Y-%m-%d %H:%M", time.localtime(p.stat().st_mtime)
+                    ),
+                }
+                for p in self.files.entries()
+            ],
+            schema={"file": pl.String, "size_mb": pl.Float64, "last_used": pl.String},
+        )
+
+
+def get_profile_path(subset: str, **kwargs) -> Path:
+    """
+    Return the local copy of a subset using the default cache.
+
+    Parameters
+    ----------
+    subset : str
+        Name of the subset in the manifest (e.g., "crispr").
+    **kwargs
+        Passed on to `ProfileCache`.
+
+    Returns
+    -------
+    Path
+        Local parquet file.
+
+    """
+    return ProfileCache(**kwargs).path(subset)
+
+
+def scan_profiles(subset: str, **kwargs) -> pl.LazyFrame:
+    """Lazy-load a subset from the default cache, see `get_profile_path`."""
+    return pl.scan_parquet(get_profile_path(subset, **kwargs))
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+"""
+Concordance between the CRISPR knock-out and ORF overexpression of every gene.
+
+Each gene is mapped to its CRISPR and ORF perturbations with a single join
+on the babel table. The consensus profiles of those perturbations (see
+`jump_deps.consensus`) are averaged into one profile per gene and modality,
+and the cosine similarity of the two profiles of every gene is compared
+with a null distribution: the similarities of its CRISPR profile with the
+ORF profiles of all other genes, and of its ORF profile with the CRISPR
+profiles of all other genes. Everything is obtained from blocks of matrix
+products, so all genes are scored in a few seconds.
+
+Knock-out and overexpression can have opposite effects, so significance is
+two-sided: a gene is concordant when the absolute value of its similarity is
+larger than that of most of its null pairs.
+
+Use cases:
+# Ranked table of all genes in the combined dataset
+gene_concordance("all", "concordance.parquet")
+"""
+
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+
+from jump_deps.annotate import get_babel_table
+from jump_deps.consensus import ConsensusStore, get_consensus
+from jump_deps.feature_stats import benjamini_hochberg
+from jump_deps.similarity import normalise_rows
+
+MODALITIES = ("crispr", "orf")
+
+
+def gene_perturbations(store: ConsensusStore) -> pl.DataFrame:
+    """
+    CRISPR and ORF perturbations of every gene present in a consensus store.
+
+    Returns
+    -------
+    polars.DataFrame
+        Columns gene, crispr and orf, the last two with the JCP2022 ids of
+        each modality. Only genes with perturbations in both are kept.
+
+    """
+    return (
+        get_babel_table()
+        .filter(
+            (pl.col("pert_type") == "trt")
+            & pl.col("plate_type").is_in(MODALITIES)
+            & pl.col("standard_key").is_not_null()
+            & pl.col("JCP2022").is_in(list(store.positions))
+        )
+        .group_by("standard_key")
+        .agg(
+            pl
+            .col("JCP2022")
+            .filter(pl.col("plate_type") == modality)
+            .unique()
+            .sort()
+            .alias(modality)
+            for modality in MODALITIES
+        )
+        .filter(pl.all_horizontal(pl.col(MODALITIES).list.len() > 0))
+        .rename({"standard_key": "gene"})
+        .sort("gene")
+    )
+
+
+def gene_profiles(store: ConsensusStore, jcp_ids: pl.Series) -> np.ndarray:
+    """
+    Mean of the consensus profiles of each gene, L2-normalised.
+
+    Parameters
+    ----------
+    store : ConsensusStore
+        Consensus profiles.
+    jcp_ids : polars.Series
+        List column with the JCP2022 ids of each gene.
+
+    Returns
+    -------
+    numpy.ndarray
+        (n_genes, n_features) float32 matrix.
+
+    """
+    genes = np.repeat(np.arange(len(jcp_ids)), jcp_ids.list.len().to_numpy())
+    rows = np.array(
+        [store.positions[x] for ids in jcp_ids.to_list() for x in ids], dtype=int
+    )
+    consensus = store.matrix()
+    profiles = np.zeros((len(jcp_ids), consensus.shape[1]), dtype=np.float32)
+    np.add.at(profiles, genes, np.nan_to_num(consensus[rows]))
+    profiles /= np.bincount(genes, minlength=len(jcp_ids))[:, None]
+    return normalise_rows(profiles)
+
+
+def null_statistics(
+    a: np.ndarray, b: np.ndarray, same: np.ndarray, block_size: int = 1024
+) -> tuple[np.ndarray, ...]:
+    """
+    Compare the similarity of matching rows with those of all other pairs.
+
+    Parameters
+    ----------
+    a, b : numpy.ndarray
+        (n, n_features) normalised profiles; row i of both belong to gene i.
+    same : numpy.ndarray
+        Similarity of row i of `a` with row i of `b`.
+    block_size : int
+        Rows multiplied at a time.
+
+    Returns
+    -------
+    tuple of numpy.ndarray
+        Per row: number of null pairs whose absolute similarity is at least
+        that of the gene, and the sum and sum of squares of the null
+        similarities. Null pairs are row i of `a` with every other row of
+        `b`, and row i of `b` with every other row of `a`.
+
+    """
+    n = len(a)
+    exceed, total, squares = np.zeros(n), np.zeros(n), np.zeros(n)
+    for start in range(0, n, block_size):
+        block = np.arange(start, min(start + block_size, n))
+        for x, y in ((a, b), (b, a)):
+            sims = x[block] @ y.T
+            sims[np.arange(len(block)), block] = np.nan
+            with np.errstate(invalid="ignore"):
+                exceed[block] += (np.abs(sims) >= np.abs(same[block, None])).sum(axis=1)
+            total[block] += np.nansum(sims, axis=1)
+            squares[block] += np.nansum(sims**2, axis=1)
+    return exceed, total, squares
+
+
+def gene_concordance(
+    subset: str = "all",
+    output: str | Path | None = None,
+    block_size: int = 1024,
+    manifest: list[dict[str, str]] | None = None,
+    cache_dir: str | Path | None = None,
+) -> pl.DataFrame:
+    """
+    Rank all genes by the concordance of their CRISPR and ORF profiles.
+
+    Parameters
+    ----------
+    subset : str
+        Manifest subset with both CRISPR and ORF profiles in the same feature
+        space (e.g., "all").
+    output : str, Path or None
+        Parquet file where the table is written, if given.
+    block_size : int
+        Genes processed per block of matrix products.
+    manifest : list of dict or None
+        Manifest to resolve the subset with. If None the default one is loaded.
+    cache_dir : str, Path or None
+        Root of the local cache, see `jump_deps.manifest.get_cache_dir`.
+
+    Returns
+    -------
+    polars.DataFrame
+        One row per gene, most concordant first: gene, the JCP2022 ids of each
+        modality, cosine_similarity, the mean and standard deviation of its
+        null similarities, z_score, the empirical two-sided p_value and its
+        Benjamini-Hochberg correction. The z_score is NaN for genes whose
+        null similarities are all equal.
+
+    Raises
+    ------
+    ValueError
+        If fewer than two genes have both CRISPR and ORF profiles, since the
+        null distribution of a gene is made of the other genes.
+
+    """
+    store = get_consensus(subset, manifest, cache_dir)
+    genes = gene_perturbations(store)
+    if genes.height < 2:
+        raise ValueError(
+            f"{subset} has {genes.height} gene(s) with CRISPR and ORF profiles, "
+            "at least 2 are needed"
+        )
+    crispr = gene_profiles(store, genes.get_column("crispr"))
+    orf = gene_profiles(store, genes.get_column("orf"))
+
+    same = np.einsum("ij,ij->i", crispr, orf)
+    exceed, total, squares = null_statistics(crispr, orf, same, block_size)
+    n_null = 2 * (len(genes) - 1)
+    mean = total / n_null
+    std = np.sqrt(np.maximum(squares / n_null - mean**2, 0))
+    z_score = np.divide(same - mean, std, out=np.full_like(std, np.nan), where=std > 0)
+    p_value = (exceed + 1) / (n_null + 1)
+
+    table = (
+        genes
+        .with_columns(
+            pl.Series("cosine_similarity", same),
+            pl.Series("null_mean", mean),
+            pl.Series("null_std", std),
+            pl.Series("z_score", z_score),
+            pl.Series("p_value", p_value),
+            pl.Series("p_value_corrected", benjamini_hochberg(p_value)),
+        )
+        .sort(
+            "p_value",
+            pl.col("cosine_similarity").abs(),
+            descending=[False, True],
+        )
+        .with_row_index("rank", offset=1)
+    )
+    if output is not None:
+        table.write_parquet(output)
+    return table
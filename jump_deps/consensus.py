@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+"""
+Consensus (per-perturbation) profiles of the manifest subsets.
+
+Similarity matrices, feature comparisons and most exploratory plots work on
+one profile per perturbation rather than on every well. This module reduces
+a subset once to the median and mean profile of each Metadata_JCP2022, with
+its number of replicate wells, and stores them as float32 .npy matrices plus
+a small parquet index. The result is keyed by the ETag of the subset, so it
+is rebuilt only when the subset changes.
+
+The subset is read in blocks of feature columns, each grouped with the
+streaming engine of polars, so every column is read once and memory is
+bounded by the size of a block.
+
+`consensus_frame` is the same aggregation for profiles already in memory,
+e.g. to group wells by gene rather than by perturbation.
+
+Use cases:
+# Median profiles of the crispr dataset
+get_consensus("crispr").frame()
+# Mean profiles of a few perturbations
+get_consensus("orf").frame("mean", jcp_ids=["JCP2022_900001", "JCP2022_900002"])
+"""
+
+import json
+from collections.abc import Iterable
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+import pyarrow.parquet as pq
+
+from jump_deps.cache import ProfileCache, normalise_etag
+from jump_deps.manifest import get_cache_dir, get_entry, get_manifest
+from jump_deps.matrix import split_columns
+
+STATISTICS = ("median", "mean")
+INDEX_FILE = "index.parquet"
+
+
+class ConsensusStore:
+    """
+    Median and mean profiles per perturbation, stored as memory-mapped arrays.
+
+    Parameters
+    ----------
+    path : str or Path
+        Directory written by `build_consensus`.
+
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        table = pq.read_table(self.path / INDEX_FILE)
+        self.features = json.loads(table.schema.metadata[b"features"])
+        self.index = pl.from_arrow(table.replace_schema_metadata(None))
+        self.positions = dict(
+            zip(self.index.get_column("Metadata_JCP2022"), range(self.index.height))
+        )
+
+    def matrix(self, statistic: str = "median") -> np.ndarray:
+        """(n_perturbations, n_features) read-only float32 matrix."""
+        if statistic not in STATISTICS:
+            raise ValueError(f"Unknown statistic {statistic}")
+        return np.load(self.path / f"{statistic}.npy", mmap_mode="r")
+
+    def frame(
+        self,
+        statistic: str = "median",
+        jcp_ids: Iterable[str] | None = None,
+        features: list[str] | None = None,
+    ) -> pl.DataFrame:
+        """
+        Consensus profiles as a polars frame.
+
+        Parameters
+        ----------
+        statistic : str
+            "median" or "mean".
+        jcp_ids : collection of str or None
+            Perturbations to return, all of them if None. Unknown ids are
+            skipped.
+        features : list of str or None
+            Features to return, all of them if None.
+
+        Returns
+        -------
+        polars.DataFrame
+            Metadata_JCP2022, Metadata_n_replicates and one column per feature.
+
+        """
+        rows = np.arange(self.index.height)
+        if jcp_ids is not None:
+            rows = np.array(
+                [self.positions[x] for x in jcp_ids if x in self.positions], dtype=int
+            )
+        columns = np.arange(len(self.features))
+        if features is not None:
+            lookup = dict(zip(self.features, columns))
+            columns = np.array([lookup[x] for x in features], dtype=int)
+
+        values = self.matrix(statistic)[np.ix_(rows, columns)]
+        return pl.concat(
+            [
+                self.index[rows],
+                pl.DataFrame(values, schema=[self.features[j] for j in columns]),
+            ],
+            how="horizontal",
+        )
+
+
+def consensus_frame(
+    profiles: pl.DataFrame | pl.LazyFrame,
+    by: str = "Metadata_JCP2022",
+    statistics: tuple[str] = ("median",),
+    features: list[str] | None = None,
+) -> pl.DataFrame:
+    """
+    Aggregate well-level profiles into one consensus profile per group.
+
+    Parameters
+    ----------
+    profiles : polars.DataFrame or polars.LazyFrame
+        Well-level profiles.
+    by : str
+        Column that identifies the groups (perturbations, genes, ...).
+    statistics : tuple of str
+        Any of "median" and "mean".
+    features : list of str or None
+        Feature columns to aggregate. If None they are inferred with
+        `jump_deps.matrix.split_columns`.
+
+    Returns
+    -------
+    polars.DataFrame
+        One row per group, sorted by `by`, with its number of wells
+        (Metadata_n_replicates) and one column per feature and statistic.
+        Columns are named after the features when a single statistic is
+        requested and "{feature}_{statistic}" otherwise.
+
+    """
+    unknown = set(statistics) - set(STATISTICS)
+    if unknown:
+        raise ValueError(f"Unknown statistics {sorted(unknown)}")
+    if features is None:
+        features = split_columns(profiles)[1]
+    columns = pl.col(features)
+    aggregations = {"median": columns.median(), "mean": columns.mean()}
+    return (
+        profiles
+        .lazy()
+        .group_by(by)
+        .agg(
+            pl.len().alias("Metadata_n_replicates"),
+            *(
+                aggregations[stat].name.suffix(
+                    f"_{stat}" if len(statistics) > 1 else ""
+                )
+                for stat in statistics
+            ),
+        )
+        .sort(by)
+        .collect(engine="streaming")
+    )
+
+
+def build_consensus(
+    profiles: str | Path,
+    path: str | Path,
+    block_size: int = 128,
+) -> ConsensusStore:
+    """
+    Reduce a parquet file of well-level profiles to consensus profiles.
+
+    Parameters
+    ----------
+    profiles : str or Path
+        Local parquet file.
+    path : str or Path
+        Directory where the matrices and their index are written.
+    block_size : int
+        Feature columns aggregated per pass over the file.
+
+    Returns
+    -------
+    ConsensusStore
+        The stored profiles.
+
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    lazy = pl.scan_parquet(profiles)
+    features = split_columns(lazy)[1]
+
+    index = consensus_frame(lazy, features=[])
+
+    tmp = {stat: path / f".partial-{stat}.npy" for stat in STATISTICS}
+    matrices = {
+        stat: np.lib.format.open_memmap(
+            tmp[stat],
+            mode="w+",
+            dtype=np.float32,
+            shape=(index.height, len(features)),
+        )
+        for stat in STATISTICS
+    }
+    for start in range(0, len(features), block_size):
+        block = features[start : start + block_size]
+        aggregated = consensus_frame(lazy, statistics=STATISTICS, features=block)
+        for stat in STATISTICS:
+            matrices[stat][:, start : start + len(block)] = aggregated.select(
+                pl.col(f"{name}_{stat}").cast(pl.Float32) for name in block
+            ).to_numpy()
+
+    for matrix in matrices.values():
+        matrix.flush()
+    del matrices
+    for stat in STATISTICS:
+        tmp[stat].replace(path / f"{stat}.npy")
+
+    table = index.to_arrow().replace_schema_metadata({"features": json.dumps(features)})
+    pq.write_table(table, path / INDEX_FILE)
+    return ConsensusStore(path)
+
+
+def get_consensus(
+    subset: str,
+    manifest: list[dict[str, str]] | None = None,
+    cache_dir: str | Path | None = None,
+) -> ConsensusStore:
+    """
+    Consensus profiles of a subset, building them on first use.
+
+    Parameters
+    ----------
+    subset : str
+        Name of the subset in the manifest.
+    manifest : list of dict or None
+        Manifest to resolve subsets with. If None the default one is loaded.
+    cache_dir : str, Path or None
+        Root of the local cache, see `jump_deps.manifest.get_cache_dir`.
+
+    Returns
+    -------
+    ConsensusStore
+        Consensus of the subset in its current version.
+
+    """
+    if manifest is None:
+        manifest = get_manifest(cache_dir=cache_dir)
+    entry = get_entry(subset, manifest)
+    path = (
+        get_cache_dir(cache_dir)
+        / "consensus"
+        / f"{entry['subset']}-{normalise_etag(entry['etag'])}"
+    )
+    if (path / INDEX_FILE).exists():
+        return ConsensusStore(path)
+
+    local = ProfileCache(cache_dir=cache_dir, manifest=manifest).path(subset)
+    return build_consensus(local, path)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+"""
+Correlations between the profiles of sets of genes.
+
+The profiles of the requested genes are loaded on their own (their JCP2022
+ids are looked up in the babel table first), scaled once, and all their
+pairwise cosine similarities or Pearson correlations are obtained from
+matrix products over blocks of rows. There is no list of index pairs, so
+hundreds of genes (thousands of wells) fit in one call.
+
+Use cases:
+# Well-by-well cosine similarity of two genes in the crispr dataset
+gene_set_correlation(("CD44", "HAS2"), "crispr")
+# Pearson correlation of consensus profiles from a local file
+gene_set_correlation(genes, "profiles.parquet", method="pearson", consensus=True)
+"""
+
+from collections.abc import Iterable
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import polars as pl
+
+from jump_deps.annotate import get_babel_table
+from jump_deps.consensus import consensus_frame
+from jump_deps.matrix import feature_matrix, split_columns
+from jump_deps.rowgroup_index import read_perturbations
+from jump_deps.similarity import normalise_rows
+
+
+def gene_jcp_ids(genes: Iterable[str], plate_type: str = "crispr") -> pl.DataFrame:
+    """
+    JCP2022 ids of genes in one type of plate.
+
+    Parameters
+    ----------
+    genes : collection of str
+        Gene symbols (babel standard keys).
+    plate_type : str
+        "crispr" or "orf".
+
+    Returns
+    -------
+    polars.DataFrame
+        Columns gene and Metadata_JCP2022. Genes without a perturbation of
+        this type are left out.
+
+    """
+    return (
+        get_babel_table()
+        .filter(
+            pl.col("standard_key").is_in(list(genes))
+            & (pl.col("plate_type") == plate_type)
+        )
+        .select(
+            pl.col("standard_key").alias("gene"),
+            pl.col("JCP2022").alias("Metadata_JCP2022"),
+        )
+        .unique("Metadata_JCP2022", maintain_order=True)
+    )
+
+
+def load_gene_profiles(
+    genes: Iterable[str],
+    source: str | Path,
+    plate_type: str = "crispr",
+) -> pl.DataFrame:
+    """
+    Load only the wells of some genes.
+
+    Parameters
+    ----------
+    genes : collection of str
+        Gene symbols.
+    source : str or Path
+        Parquet file, or name of a subset in the manifest (read through its
+        row-group index).
+    plate_type : str
+        "crispr" or "orf".
+
+    Returns
+    -------
+    polars.DataFrame
+        Profiles with an additional gene column, sorted by gene.
+
+    """
+    ids = gene_jcp_ids(genes, plate_type)
+    jcp_ids = ids.get_column("Metadata_JCP2022").to_list()
+    if str(source).endswith(".parquet"):
+        profiles = (
+            pl
+            .scan_parquet(source)
+            .filter(pl.col("Metadata_JCP2022").is_in(jcp_ids))
+            .collect()
+        )
+    else:
+        profiles = read_perturbations(source, jcp_ids=jcp_ids)
+    return profiles.join(ids, on="Metadata_JCP2022").sort("gene")
+
+
+def correlation_matrix(
+    features: np.ndarray, method: str = "cosine", block_size: int = 1024
+) -> np.ndarray:
+    """
+    All pairwise similarities between the rows of a matrix.
+
+    Parameters
+    ----------
+    features : numpy.ndarray
+        (n_rows, n_features) profiles. It is modified in place.
+    method : str
+        "cosine" for cosine similarity or "pearson" for Pearson correlation
+        (cosine similarity of the row-centred profiles).
+    block_size : int
+        Rows multiplied at a time.
+
+    Returns
+    -------
+    numpy.ndarray
+        (n_rows, n_rows) float32 matrix.
+
+    Raises
+    ------
+    ValueError
+        If `method` is not "cosine" or "pearson".
+
+    """
+    if method not in ("cosine", "pearson"):
+        raise ValueError(f"Unknown method {method}")
+    if method == "pearson":
+        features -= np.nanmean(features, axis=1, keepdims=True)
+    features = normalise_rows(features)
+    n = len(features)
+    result = np.empty((n, n), dtype=np.float32)
+    for start in range(0, n, block_size):
+        result[start : start + block_size] = (
+            features[start : start + block_size] @ features.T
+        )
+    return result
+
+
+def gene_set_correlation(
+    genes: Iterable[str],
+    source: str | Path,
+    plate_type: str = "crispr",
+    method: str = "cosine",
+    consensus: bool = False,
+) -> pd.DataFrame:
+    """
+    Correlation of the profiles of a set of genes.
+
+    Parameters
+    ----------
+    genes : collection of str
+        Gene symbols.
+    source : str or Path
+        Parquet file or manifest subset, see `load_gene_profiles`.
+    plate_type : str
+        "crispr" or "orf".
+    method : str
+        "cosine" or "pearson", see `correlation_matrix`.
+    consensus : bool
+        Correlate the median profile of each gene instead of every well.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Square matrix with the genes as index and columns (repeated once per
+        well unless `consensus` is set), ready for `seaborn.heatmap`.
+
+    """
+    profiles = load_gene_profiles(genes, source, plate_type)
+    if consensus:
+        profiles = consensus_frame(profiles.drop("Metadata_JCP2022"), by="gene")
+    features = feature_matrix(profiles, split_columns(profiles)[1])
+    labels = profiles.get_column("gene").to_list()
+    return pd.DataFrame(
+        correlation_matrix(features, method), index=labels, columns=labels
+    )
@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+"""
+Feature rankings of perturbations against their plate-matched controls.
+
+The JUMP_rr "Feature Ranking" tables list, for every perturbation, the 30
+features that differ most from the negative controls, and for every
+feature, the 30 perturbations where it differs most. This module produces
+the same tables for any manifest subset (usually an interpretable one):
+
+- Treatments are grouped by the plates where they were assayed (see
+  `jump_deps.activity.plate_groups`), and each group is loaded on its own
+  through the row-group index, in a pool of processes.
+- Every treatment is compared with the negative controls on its plates
+  using Welch's t-test on all features at once, and its p-values are
+  corrected across features (Benjamini-Hochberg).
+- The k best features of each treatment are kept as the group finishes,
+  and the k best treatments of each feature are merged into a (k, n_features)
+  array, so memory does not grow with the size of the subset.
+
+Use cases:
+# Tables for the interpretable crispr profiles
+rank_features("crispr_interpretable", "crispr_ranking")
+# Top features of one gene
+ranking = pl.read_parquet("crispr_ranking/feature_ranking.parquet")
+ranking.filter(pl.col("Metadata_JCP2022") == jcp_id)
+"""
+
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+
+from jump_deps.activity import plate_groups
+from jump_deps.annotate import annotate
+from jump_deps.cache import ProfileCache
+from jump_deps.feature_stats import benjamini_hochberg, group_moments, welch_t
+from jump_deps.manifest import get_manifest
+from jump_deps.matrix import feature_matrix, split_columns
+from jump_deps.pool import map_unordered
+from jump_deps.rowgroup_index import get_rowgroup_index, read_perturbations
+
+UNASSIGNED_RANK = 999999
+STATISTICS_SCHEMA = {
+    "t_statistic": pl.Float32,
+    "p_value": pl.Float64,
+    "corrected_p_value": pl.Float64,
+}
+
+
+def rank_group(
+    subset: str,
+    plates: list[str],
+    treatments: list[str],
+    negcons: list[str],
+    features: list[str],
+    manifest: list[dict[str, str]],
+) -> tuple[list[str], np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Compare the treatments of a plate group with the controls on their plates.
+
+    Parameters
+    ----------
+    subset : str
+        Name of the subset in the manifest.
+    plates : list of str
+        Plates where the treatments were assayed.
+    treatments : list of str
+        JCP2022 ids to test.
+    negcons : list of str
+        JCP2022 ids of the negative controls of the dataset.
+    features : list of str
+        Feature columns to test.
+    manifest : list of dict
+        Manifest to resolve the subset with.
+
+    Returns
+    -------
+    list of str
+        Treatments tested (those with at least two wells and two controls).
+    numpy.ndarray
+        (n_treatments, n_features) float32 Welch t statistics.
+    numpy.ndarray
+        Two-sided p-values.
+    numpy.ndarray
+        p-values corrected across the features of each treatment.
+
+    """
+    profiles = read_perturbations(
+        subset,
+        plates=plates,
+        columns=[*features, "Metadata_Plate", "Metadata_JCP2022"],
+        manifest=manifest,
+    ).filter(pl.col("Metadata_JCP2022").is_in([*treatments, *negcons]))
+    matrix = feature_matrix(profiles, features, dtype=np.float64)
+    jcp_ids = profiles.get_column("Metadata_JCP2022").to_numpy()
+    well_plates = profiles.get_column("Metadata_Plate").to_numpy()
+    is_control = np.isin(jcp_ids, negcons)
+
+    tested, t_stats, p_values = [], [], []
+    for jcp_id in treatments:
+        wells = jcp_ids == jcp_id
+        controls = is_control & np.isin(well_plates, well_plates[wells])
+        if wells.sum() < 2 or controls.sum() < 2:
+            continue
+        t, _, p = welch_t(group_moments(matrix[wells]), group_moments(matrix[controls]))
+        tested.append(jcp_id)
+        t_stats.append(t)
+        p_values.append(p)
+
+    t_stats = np.array(t_stats, dtype=np.float32).reshape(-1, len(features))
+    p_values = np.array(p_values).reshape(-1, len(features))
+    return tested, t_stats, p_values, benjamini_hochberg(p_values)
+
+
+def top_rows(p_values: np.ndarray, t_stats: np.ndarray, k: int) -> np.ndarray:
+    """
+    Positions of the k most significant rows of every column.
+
+    Rows are ordered by p-value and then by decreasing absolute t statistic;
+    NaNs go last.
+
+    Returns
+    -------
+    numpy.ndarray
+        (min(k, n_rows), n_columns) row indices, best first.
+
+    """
+    p = np.where(np.isnan(p_values), np.inf, p_values)
+    t = np.where(np.isnan(t_stats), 0, -np.abs(t_stats))
+    return np.lexsort((t, p), axis=0)[:k]
+
+
+def rank_features(
+    subset: str,
+    output_dir: str | Path,
+    k: int = 30,
+    max_workers: int = 4,
+    max_plates: int = 16,
+    manifest: list[dict[str, str]] | None = None,
+) -> Path:
+    """
+    Write the feature and perturbation rankings of a subset.
+
+    Parameters
+    ----------
+    subset : str
+        Name of the subset in the manifest (e.g., "crispr_interpretable").
+    output_dir : str or Path
+        Directory where the tables are written.
+    k : int
+        Features kept per perturbation and perturbations kept per feature.
+    max_workers : int
+        Number of processes.
+    max_plates : int
+        Maximum number of plates per group, see
+        `jump_deps.activity.plate_groups`.
+    manifest : list of dict or None
+        Manifest to resolve the subset with. If None the default one is loaded.
+
+    Returns
+    -------
+    Path
+        The output directory, containing feature_ranking.parquet (top
+        features of each perturbation), gene_ranking.parquet (top
+        perturbations of each feature) and ranking.parquet, the union of both
+        in the layout of the JUMP_rr tables (Feature Rank and Gene Rank, with
+        999999 where an entry was not ranked).
+
+    """
+    if manifest is None:
+        manifest = get_manifest()
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    path = ProfileCache(manifest=manifest).path(subset)
+    # Build the row-group index before the workers need it
+    get_rowgroup_index(subset, manifest)
+    lazy = pl.scan_parquet(path)
+    features = split_columns(lazy)[1]
+    layout = annotate(
+        lazy.select("Metadata_JCP2022", "Metadata_Plate"), ("pert_type",)
+    ).collect()
+    negcons = (
+        layout
+        .filter(pl.col("pert_type") == "negcon")
+        .get_column("Metadata_JCP2022")
+        .unique()
+        .to_list()
+    )
+
+    best_p = np.empty((0, len(features)))
+    best_raw = np.empty((0, len(features)))
+    best_t = np.empty((0, len(features)), dtype=np.float32)
+    best_ids = np.empty((0, len(features)), dtype=object)
+    columns = np.arange(len(features))
+    per_perturbation = []
+
+    jobs = (
+        (plates, (subset, plates, treatments, negcons, features, manifest))
+        for plates, treatments in plate_groups(layout, max_plates)
+    )
+    for _, result in map_unordered(rank_group, jobs, max_workers):
+        tested, t_stats, p_values, corrected = result
+        if not tested:
+            continue
+
+        # Top features of each perturbation of the group
+        order = top_rows(corrected.T, t_stats.T, k).T
+        rows = np.arange(len(tested))[:, None]
+        per_perturbation.append(
+            pl.DataFrame({
+                "Metadata_JCP2022": np.repeat(tested, order.shape[1]),
+                "feature": np.array(features)[order].ravel(),
+                "t_statistic": t_stats[rows, order].ravel(),
+                "p_value": p_values[rows, order].ravel(),
+                "corrected_p_value": corrected[rows, order].ravel(),
+                "Feature Rank": np.tile(np.arange(1, order.shape[1] + 1), len(tested)),
+            }).filter(pl.col("corrected_p_value").is_not_nan())
+        )
+
+        # Merge into the top perturbations of each feature
+        ids = np.broadcast_to(np.array(tested, dtype=object)[:, None], t_stats.shape)
+        best_p = np.concatenate([best_p, corrected])
+        best_raw = np.concatenate([best_raw, p_values])
+        best_t = np.concatenate([best_t, t_stats])
+        best_ids = np.concatenate([best_ids, ids])
+        keep = top_rows(best_p, best_t, k)
+        best_p, best_raw, best_t, best_ids = (
+            x[keep, columns] for x in (best_p, best_raw, best_t, best_ids)
+        )
+
+    # No treatment may have enough wells and controls, e.g., in a tiny subset
+    feature_ranking = pl.concat([
+        pl.DataFrame(
+            schema={
+                "Metadata_JCP2022": pl.String,
+                "feature": pl.String,
+                **STATISTICS_SCHEMA,
+                "Feature Rank": pl.Int64,
+            }
+        ),
+        *per_perturbation,
+    ])
+    feature_ranking.write_parquet(output_dir / "feature_ranking.parquet")
+
+    valid = ~np.isnan(best_p)
+    ranks = np.broadcast_to(np.arange(1, len(best_p) + 1)[:, None], best_p.shape)
+    gene_ranking = pl.DataFrame(
+        {
+            "feature": np.broadcast_to(np.array(features), best_p.shape)[valid],
+            "Metadata_JCP2022": best_ids[valid].astype(str),
+            "t_statistic": best_t[valid],
+            "p_value": best_raw[valid],
+            "corrected_p_value": best_p[valid],
+            "Gene Rank": ranks[valid],
+        },
+        schema={
+            "feature": pl.String,
+            "Metadata_JCP2022": pl.String,
+            **STATISTICS_SCHEMA,
+            "Gene Rank": pl.Int64,
+        },
+    ).sort("feature", "Gene Rank")
+    gene_ranking.write_parquet(output_dir / "gene_ranking.parquet")
+
+    keys = ["Metadata_JCP2022", "feature"]
+    (
+        feature_ranking
+        .join(
+            gene_ranking.select(*keys, "Gene Rank"),
+            on=keys,
+            how="full",
+            coalesce=True,
+        )
+        .join(
+            gene_ranking.drop("Gene Rank"),
+            on=keys,
+            how="left",
+            suffix="_gene",
+        )
+        .with_columns(
+            pl.col(c).fill_null(pl.col(f"{c}_gene"))
+            for c in ("t_statistic", "p_value", "corrected_p_value")
+        )
+        .drop(pl.col("^.*_gene$"))
+        .with_columns(pl.col("Feature Rank", "Gene Rank").fill_null(UNASSIGNED_RANK))
+        .pipe(annotate, {"standard_key": "Perturbation"})
+        .sort("Metadata_JCP2022", "Feature Rank", "Gene Rank")
+        .write_parquet(output_dir / "ranking.parquet")
+    )
+    return output_dir
@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+"""
+Feature-by-feature statistical comparison of groups of profiles.
+
+Instead of calling `scipy.stats.ttest_ind` once per feature, every test here
+is computed for all features at once with column-wise NumPy reductions:
+Welch's t-test, the Mann-Whitney U test (normal approximation with tie
+correction), Hedges' g and the difference of medians, with Benjamini-Hochberg
+correction across features. Many pairs of clusters can be compared in one
+call; the means and variances of each cluster are computed only once. Missing
+values (NaN) are dropped feature by feature in every test.
+
+Use cases:
+# Two clusters of wells
+compare_features(cluster_a, cluster_b, features)
+# Every pair of clusters labelled in a column
+compare_clusters(profiles, "Metadata_Cluster")
+"""
+
+from collections.abc import Sequence
+from itertools import combinations
+
+import numpy as np
+import polars as pl
+from scipy import stats
+
+from jump_deps.matrix import feature_matrix, split_columns
+
+
+def benjamini_hochberg(p_values: np.ndarray) -> np.ndarray:
+    """
+    Benjamini-Hochberg adjusted p-values along the last axis.
+
+    NaNs are ignored and kept as NaN, like `statsmodels`' fdr_bh applied to
+    the non-missing values.
+    """
+    p_values = np.asarray(p_values, dtype=np.float64)
+    adjusted = np.full_like(p_values, np.nan)
+    for index in np.ndindex(p_values.shape[:-1]):
+        p = p_values[index]
+        valid = ~np.isnan(p)
+        n = valid.sum()
+        if not n:
+            continue
+        order = np.argsort(p[valid])
+        ranked = p[valid][order] * n / np.arange(1, n + 1)
+        ranked = np.minimum.accumulate(ranked[::-1])[::-1].clip(max=1)
+        result = np.empty(n)
+        result[order] = ranked
+        adjusted[index][valid] = result
+    return adjusted
+
+
+def group_moments(x: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Per-column count, mean and unbiased variance, ignoring NaNs."""
+    n = (~np.isnan(x)).sum(axis=0)
+    mean = np.nanmean(x, axis=0)
+    var = np.nansum((x - mean) ** 2, axis=0) / np.maximum(n - 1, 1)
+    return n, mean, var
+
+
+def welch_t(
+    moments_a: tuple[np.ndarray, ...], moments_b: tuple[np.ndarray, ...]
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Welch's t-test from the moments of two groups (see `group_moments`).
+
+    Returns
+    -------
+    tuple of numpy.ndarray
+        t statistic, Welch-Satterthwaite degrees of freedom and two-sided
+        p-value, per feature. Constant features get NaN.
+
+    """
+    (n_a, mean_a, var_a), (n_b, mean_b, var_b) = moments_a, moments_b
+    se_a, se_b = var_a / n_a, var_b / n_b
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (mean_a - mean_b) / np.sqrt(se_a + se_b)
+        df = (se_a + se_b) ** 2 / (se_a**2 / (n_a - 1) + se_b**2 / (n_b - 1))
+    p = 2 * stats.t.sf(np.abs(t), df)
+    return t, df, p
+
+
+def hedges_g(
+    moments_a: tuple[np.ndarray, ...], moments_b: tuple[np.ndarray, ...]
+) -> np.ndarray:
+    """Standardised mean difference with small-sample correction."""
+    (n_a, mean_a, var_a), (n_b, mean_b, var_b) = moments_a, moments_b
+    dof = n_a + n_b - 2
+    pooled = np.sqrt(((n_a - 1) * var_a + (n_b - 1) * var_b) / dof)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (mean_a - mean_b) / pooled * (1 - 3 / (4 * dof - 1))
+
+
+def tie_correction(ordered: np.ndarray) -> np.ndarray:
+    """
+    Sum of t^3 - t over the groups of t tied values of every column.
+
+    `ordered` holds the sorted ranks of each column. NaNs do not compare
+    equal, so they form groups of one and do not count.
+    """
+    n_rows, n_columns = ordered.shape
+    if not n_rows:
+        return np.zeros(n_columns)
+    ordered = ordered.T
+    starts = np.ones(ordered.shape, dtype=bool)
+    starts[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    positions = np.flatnonzero(starts)
+    runs = np.diff(positions, append=starts.size).astype(np.float64)
+    # Every column starts a new group, so its first group is found directly
+    first = np.searchsorted(positions, np.arange(n_columns) * n_rows)
+    return np.add.reduceat(runs**3 - runs, first)
+
+
+def mann_whitney_u(a: np.ndarray, b: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Two-sided Mann-Whitney U test of every column.
+
+    Uses the normal approximation with tie and continuity corrections, as
+    `scipy.stats.mannwhitneyu(method="asymptotic")`. NaNs are dropped per
+    feature, like in `group_moments`, so each column is tested on its
+    non-missing values.
+
+    Returns
+    -------
+    tuple of numpy.ndarray
+        U statistic of `a` and p-value, per feature.
+
+    """
+    n_a = (~np.isnan(a)).sum(axis=0)
+    n_b = (~np.isnan(b)).sum(axis=0)
+    n = n_a + n_b
+    ranks = stats.rankdata(np.concatenate([a, b]), axis=0, nan_policy="omit")
+    u = np.nansum(ranks[: len(a)], axis=0) - n_a * (n_a + 1) / 2
+    ties = tie_correction(np.sort(ranks, axis=0))
+
+    mu = n_a * n_b / 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sigma = np.sqrt(n_a * n_b / 12 * ((n + 1) - ties / (n * (n - 1))))
+        z = (np.abs(u - mu) - 0.5) / sigma
+    p = np.clip(2 * stats.norm.sf(z), 0, 1)
+    return u, p
+
+
+def compare_features(
+    a: np.ndarray,
+    b: np.ndarray,
+    features: Sequence[str],
+    moments_a: tuple[np.ndarray, ...] | None = None,
+    moments_b: tuple[np.ndarray, ...] | None = None,
+) -> pl.DataFrame:
+    """
+    Compare two groups of profiles feature by feature.
+
+    Parameters
+    ----------
+    a, b : numpy.ndarray
+        (n_profiles, n_features) profiles of each group.
+    features : sequence of str
+        Names of the columns.
+    moments_a, moments_b : tuple or None
+        Precomputed `group_moments` of each group.
+
+    Returns
+    -------
+    polars.DataFrame
+        One row per feature with the Welch t statistic, its degrees of
+        freedom and p-value, the Mann-Whitney U statistic and p-value,
+        Hedges' g, the difference of medians (a - b) and the
+        Benjamini-Hochberg corrected p-values of both tests.
+
+    """
+    moments_a = moments_a or group_moments(a)
+    moments_b = moments_b or group_moments(b)
+    t, df, p_t = welch_t(moments_a, moments_b)
+    u, p_u = mann_whitney_u(a, b)
+    return pl.DataFrame({
+        "feature": list(features),
+        "t_statistic": t,
+        "df": df,
+        "t_p_value": p_t,
+        "t_p_value_corrected": benjamini_hochberg(p_t),
+        "u_statistic": u,
+        "u_p_value": p_u,
+        "u_p_value_corrected": benjamini_hochberg(p_u),
+        "hedges_g": hedges_g(moments_a, moments_b),
+        "median_difference": np.nanmedian(a, axis=0) - np.nanmedian(b, axis=0),
+    })
+
+
+def compare_clusters(
+    profiles: pl.DataFrame,
+    cluster_column: str,
+    pairs: Sequence[tuple[str, str]] | None = None,
+    features: Sequence[str] | None = None,
+) -> pl.DataFrame:
+    """
+    Compare pairs of clusters of profiles feature by feature.
+
+    Parameters
+    ----------
+    profiles : polars.DataFrame
+        Profiles with a column labelling their cluster.
+    cluster_column : str
+        Column with the cluster labels.
+    pairs : sequence of tuple or None
+        (cluster_a, cluster_b) pairs to compare. If None every pair of
+        clusters is compared.
+    features : sequence of str or None
+        Features to compare. If None they are inferred with
+        `jump_deps.matrix.split_columns`.
+
+    Returns
+    -------
+    polars.DataFrame
+        Columns cluster_a and cluster_b followed by those of
+        `compare_features`. Corrections are applied within each pair.
+
+    """
+    if features is None:
+        features = split_columns(profiles.drop(cluster_column))[1]
+    labels = profiles.get_column(cluster_column).to_numpy()
+    matrix = feature_matrix(profiles, features, dtype=np.float64)
+    clusters = {label: matrix[labels == label] for label in np.unique(labels).tolist()}
+    if pairs is None:
+        pairs = list(combinations(clusters, 2))
+
+    moments = {
+        label: group_moments(clusters[label]) for pair in pairs for label in pair
+    }
+    return pl.concat([
+        compare_features(
+            clusters[a], clusters[b], features, moments[a], moments[b]
+        ).select(pl.lit(a).alias("cluster_a"), pl.lit(b).alias("cluster_b"), pl.all())
+        for a, b in pairs
+    ])
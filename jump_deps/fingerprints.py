@@ -0,0 +1,443 @@
+#!/usr/bin/env python
+"""
+Similarity search of JUMP compounds by PubChem fingerprint.
+
+The 881-bit PubChem (CACTVS) substructure fingerprint of every JUMP compound
+is fetched once from PubChem, by InChIKey and in batches, and stored as 14
+packed uint64 words per compound, sorted by the number of bits set. The
+Tanimoto (Jaccard) similarity of a query with a block of compounds is then a
+bitwise AND followed by a popcount. Because Tanimoto(a, b) can be at most
+min(|a|, |b|) / max(|a|, |b|), compounds are visited from the bit counts
+closest to that of the query outwards, and the search stops as soon as the
+remaining ones cannot reach the threshold or enter the top k.
+
+PubChem's url is a parameter, so the index can be built against a local stub
+that mimics the PUG REST JSON responses.
+
+Use cases:
+# Ten most similar JUMP compounds of a few structures
+similar_compounds(["CC(=O)OC1=CC=CC=C1C(=O)O"], k=10)
+# Many queries at once, from PubChem CIDs
+labels, queries = query_fingerprints(cids, "cid")
+get_fingerprint_index().search(queries, k=5, threshold=0.7, labels=labels)
+"""
+
+import base64
+import time
+from collections.abc import Iterable
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+import requests
+
+from jump_deps.manifest import get_cache_dir
+from jump_deps.ncbi import TokenBucket
+
+PUBCHEM_URL = "https://pubchem.ncbi.nlm.nih.gov/rest/pug"
+COMPOUND_VERSION = "v0.11.0"
+COMPOUND_URL = (
+    "https://raw.githubusercontent.com/jump-cellpainting/datasets/"
+    f"{COMPOUND_VERSION}/metadata/compound.csv.gz"
+)
+N_BITS = 881
+N_WORDS = 14  # 896 bits
+INDEX_FILE = "fingerprints.npz"
+COMPOUNDS_FILE = "compounds.parquet"
+
+if hasattr(np, "bitwise_count"):
+
+    def popcount(words: np.ndarray) -> np.ndarray:
+        """Number of bits set in each row of packed words."""
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int32)
+
+else:
+    _BYTE_COUNTS = np.array([i.bit_count() for i in range(256)], dtype=np.uint8)
+
+    def popcount(words: np.ndarray) -> np.ndarray:
+        """Number of bits set in each row of packed words."""
+        counts = _BYTE_COUNTS[np.ascontiguousarray(words).view(np.uint8)]
+        return counts.sum(axis=-1, dtype=np.int32)
+
+
+def decode_fingerprint(encoded: str) -> np.ndarray:
+    """
+    Pack a PubChem Fingerprint2D into uint64 words.
+
+    The base64 string holds a 4-byte bit count followed by the 881 bits.
+    """
+    raw = base64.b64decode(encoded)[4:]
+    padded = raw[: N_WORDS * 8].ljust(N_WORDS * 8, b"\0")
+    return np.frombuffer(padded, dtype=np.uint64)
+
+
+class PubChemClient:
+    """
+    Batched requests of PubChem properties under a rate limit.
+
+    Parameters
+    ----------
+    base_url : str
+        Root of PUG REST, replaced by a local server in tests.
+    batch_size : int
+        Identifiers per request, for the namespaces that accept lists.
+    rate : float
+        Requests per second (PubChem allows 5).
+    max_retries : int
+        Attempts per request when the server answers 503 (busy) or 5xx.
+
+    """
+
+    def __init__(
+        self,
+        base_url: str = PUBCHEM_URL,
+        batch_size: int = 100,
+        rate: float = 5,
+        max_retries: int = 3,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rate)
+        self.session = requests.Session()
+
+    def _properties(self, namespace: str, identifiers: list[str]) -> list[dict]:
+        """
+        Properties of some identifiers.
+
+        PubChem rejects a whole batch with 400 when any of its identifiers
+        cannot be parsed, so rejected batches are bisected until the invalid
+        identifiers are isolated and dropped. 404 means that none of the
+        identifiers is known.
+        """
+        for attempt in range(self.max_retries):
+            self.bucket.acquire()
+            # POST, so long identifier lists do not exceed url length limits
+            response = self.session.post(
+                f"{self.base_url}/compound/{namespace}/property/"
+                "InChIKey,Fingerprint2D/JSON",
+                data={namespace: ",".join(identifiers)},
+                timeout=60,
+            )
+            if response.status_code < 500:
+                break
+            time.sleep(2**attempt)
+        if response.status_code == 400 and len(identifiers) > 1:
+            half = len(identifiers) // 2
+            first = self._properties(namespace, identifiers[:half])
+            return first + self._properties(namespace, identifiers[half:])
+        if response.status_code in (400, 404):
+            return []
+        response.raise_for_status()
+        return response.json()["PropertyTable"]["Properties"]
+
+    def fingerprints(
+        self, identifiers: Iterable[str], namespace: str = "inchikey"
+    ) -> pl.DataFrame:
+        """
+        Fingerprints of compounds.
+
+        Parameters
+        ----------
+        identifiers : collection of str
+            Compounds to look up.
+        namespace : str
+            PubChem namespace of the identifiers: "inchikey" or "cid" are
+            sent in batches, "smiles", "inchi" or "name" one per request.
+
+        Returns
+        -------
+        polars.DataFrame
+            Columns query, CID, InChIKey and Fingerprint2D (base64), one row
+            per identifier found (the first match when there are several).
+
+        """
+        identifiers = [str(x) for x in dict.fromkeys(identifiers)]
+        batch_size = self.batch_size if namespace in ("inchikey", "cid") else 1
+        rows = []
+        for i in range(0, len(identifiers), batch_size):
+            batch = identifiers[i : i + batch_size]
+            properties = self._properties(namespace, batch)
+            if batch_size == 1:
+                for found in properties[:1]:
+                    rows.append({"query": batch[0], **found})
+                continue
+            key = "CID" if namespace == "cid" else "InChIKey"
+            rows.extend({"query": str(found[key]), **found} for found in properties)
+        return pl.DataFrame(
+            rows,
+            schema={
+                "query": pl.String,
+                "CID": pl.Int64,
+                "InChIKey": pl.String,
+                "Fingerprint2D": pl.String,
+            },
+        ).unique("query", keep="first", maintain_order=True)
+
+
+class FingerprintIndex:
+    """
+    Packed fingerprints of compounds, sorted by number of bits set.
+
+    Parameters
+    ----------
+    words : numpy.ndarray
+        (n_compounds, 14) uint64 fingerprints.
+    compounds : polars.DataFrame
+        One row per fingerprint (e.g., Metadata_JCP2022, InChIKey and CID).
+
+    """
+
+    def __init__(self, words: np.ndarray, compounds: pl.DataFrame):
+        counts = popcount(words)
+        order = np.argsort(counts, kind="stable")
+        self.words = np.ascontiguousarray(words[order])
+        self.counts = counts[order]
+        self.compounds = compounds[order]
+
+    def save(self, path: str | Path) -> None:
+        """Store the words and the compound table in a directory."""
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.savez(path / INDEX_FILE, words=self.words)
+        self.compounds.write_parquet(path / COMPOUNDS_FILE)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "FingerprintIndex":
+        """Load an index stored with `save`."""
+        path = Path(path)
+        return cls(
+            np.load(path / INDEX_FILE)["words"],
+            pl.read_parquet(path / COMPOUNDS_FILE),
+        )
+
+    def search_one(
+        self,
+        query: np.ndarray,
+        k: int = 10,
+        threshold: float = 0.0,
+        block_size: int = 4096,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Most similar compounds of one fingerprint.
+
+        Returns
+        -------
+        numpy.ndarray
+            Positions in the index, most similar first.
+        numpy.ndarray
+            Their Tanimoto similarity.
+
+        """
+        q = int(popcount(query))
+        n = len(self.counts)
+        # Compounds outside [threshold * q, q / threshold] bits cannot reach it
+        low = np.searchsorted(self.counts, np.ceil(threshold * q), "left")
+        high = (
+            np.searchsorted(self.counts, np.floor(q / threshold), "right")
+            if threshold > 0
+            else n
+        )
+        left = right = int(np.clip(np.searchsorted(self.counts, q), low, high))
+
+        best_positions = np.empty(0, dtype=int)
+        best_scores = np.empty(0)
+        while left > low or right < high:
+            # Upper bound of the similarity of the next compound on each side
+            bound_left = self.counts[left - 1] / max(q, 1) if left > low else -1
+            bound_right = q / max(self.counts[right], 1) if right < high else -1
+            if len(best_scores) == k and max(bound_left, bound_right) < best_scores[-1]:
+                break
+            if bound_left >= bound_right:
+                block = slice(max(low, left - block_size), left)
+                left = block.start
+            else:
+                block = slice(right, min(high, right + block_size))
+                right = block.stop
+
+            shared = popcount(self.words[block] & query)
+            union = q + self.counts[block] - shared
+            scores = np.divide(shared, union, out=np.ones(len(shared)), where=union > 0)
+            keep = scores >= threshold
+            best_positions = np.concatenate([
+                best_positions,
+                np.arange(block.start, block.stop)[keep],
+            ])
+            best_scores = np.concatenate([best_scores, scores[keep]])
+            order = np.argsort(-best_scores, kind="stable")[:k]
+            best_positions, best_scores = best_positions[order], best_scores[order]
+        return best_positions, best_scores
+
+    def search(
+        self,
+        queries: np.ndarray,
+        k: int = 10,
+        threshold: float = 0.0,
+        labels: list[str] | None = None,
+    ) -> pl.DataFrame:
+        """
+        Most similar compounds of many fingerprints.
+
+        Parameters
+        ----------
+        queries : numpy.ndarray
+            (n_queries, 14) uint64 fingerprints, see `decode_fingerprint`.
+        k : int
+            Compounds returned per query.
+        threshold : float
+            Minimum Tanimoto similarity.
+        labels : list of str or None
+            Name of each query. If None queries are numbered.
+
+        Returns
+        -------
+        polars.DataFrame
+            Columns query, rank, tanimoto and those of the compound table.
+
+        """
+        queries = np.atleast_2d(queries)
+        if labels is None:
+            labels = [str(i) for i in range(len(queries))]
+        results = []
+        for label, query in zip(labels, queries):
+            positions, scores = self.search_one(query, k, threshold)
+            results.append(
+                pl.DataFrame(
+                    {
+                        "query": [label] * len(scores),
+                        "rank": np.arange(1, len(scores) + 1),
+                        "tanimoto": scores,
+                    },
+                    schema={
+                        "query": pl.String,
+                        "rank": pl.Int64,
+                        "tanimoto": pl.Float64,
+                    },
+                ).hstack(self.compounds[positions])
+            )
+        if not results:
+            return pl.DataFrame(
+                schema={"query": pl.String, "rank": pl.Int64, "tanimoto": pl.Float64}
+            ).hstack(self.compounds.clear())
+        return pl.concat(results)
+
+
+def build_fingerprint_index(
+    path: str | Path,
+    compounds: pl.DataFrame | None = None,
+    client: PubChemClient | None = None,
+) -> FingerprintIndex:
+    """
+    Fetch the fingerprints of the JUMP compounds and store them.
+
+    Parameters
+    ----------
+    path : str or Path
+        Directory of the index.
+    compounds : polars.DataFrame or None
+        Columns Metadata_JCP2022 and Metadata_InChIKey. If None the compound
+        metadata of the JUMP datasets repository is used.
+    client : PubChemClient or None
+        Client to fetch with.
+
+    Returns
+    -------
+    FingerprintIndex
+        Index of the compounds found in PubChem.
+
+    """
+    if compounds is None:
+        response = requests.get(COMPOUND_URL, timeout=300)
+        response.raise_for_status()
+        compounds = pl.read_csv(
+            response.content, columns=["Metadata_JCP2022", "Metadata_InChIKey"]
+        )
+    compounds = compounds.drop_nulls("Metadata_InChIKey")
+    client = client or PubChemClient()
+    found = client.fingerprints(
+        compounds.get_column("Metadata_InChIKey").unique().sort(), "inchikey"
+    )
+    table = compounds.join(
+        found.select(
+            pl.col("query").alias("Metadata_InChIKey"), "CID", "Fingerprint2D"
+        ),
+        on="Metadata_InChIKey",
+    )
+    words = np.array(
+        [decode_fingerprint(x) for x in table.get_column("Fingerprint2D")],
+        dtype=np.uint64,
+    ).reshape(-1, N_WORDS)
+    index = FingerprintIndex(words, table.drop("Fingerprint2D"))
+    index.save(path)
+    return index
+
+
+def get_fingerprint_index(cache_dir: str | Path | None = None) -> FingerprintIndex:
+    """
+    Load the fingerprint index of the JUMP compounds, building it on first use.
+
+    The index is cached per version of the compound table (`COMPOUND_VERSION`),
+    so pinning a new version rebuilds it.
+    """
+    path = get_cache_dir(cache_dir) / "fingerprints" / COMPOUND_VERSION
+    if (path / INDEX_FILE).exists():
+        return FingerprintIndex.load(path)
+    return build_fingerprint_index(path)
+
+
+def query_fingerprints(
+    identifiers: Iterable[str],
+    namespace: str = "smiles",
+    client: PubChemClient | None = None,
+) -> tuple[list[str], np.ndarray]:
+    """
+    Fingerprints of query compounds, from PubChem.
+
+    Returns
+    -------
+    list of str
+        Identifiers found.
+    numpy.ndarray
+        (n_found, 14) uint64 fingerprints.
+
+    """
+    found = (client or PubChemClient()).fingerprints(identifiers, namespace)
+    words = np.array(
+        [decode_fingerprint(x) for x in found.get_column("Fingerprint2D")],
+        dtype=np.uint64,
+    ).reshape(-1, N_WORDS)
+    return found.get_column("query").to_list(), words
+
+
+def similar_compounds(
+    identifiers: Iterable[str],
+    namespace: str = "smiles",
+    k: int = 10,
+    threshold: float = 0.0,
+    cache_dir: str | Path | None = None,
+) -> pl.DataFrame:
+    """
+    JUMP compounds most similar to some structures.
+
+    Parameters
+    ----------
+    identifiers : collection of str
+        Query compounds.
+    namespace : str
+        PubChem namespace of the identifiers ("smiles", "inchikey", "cid",
+        "inchi" or "name").
+    k : int
+        Compounds returned per query.
+    threshold : float
+        Minimum Tanimoto similarity.
+    cache_dir : str, Path or None
+        Root of the local cache, see `jump_deps.manifest.get_cache_dir`.
+
+    Returns
+    -------
+    polars.DataFrame
+        See `FingerprintIndex.search`. Queries unknown to PubChem are left out.
+
+    """
+    labels, queries = query_fingerprints(identifiers, namespace)
+    return get_fingerprint_index(cache_dir).search(queries, k, threshold, labels)
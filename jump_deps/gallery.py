@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+"""
+Batch rendering of image panels comparing perturbations to their controls.
+
+For every gene or compound requested, a few sites are sampled from its wells
+and the same number of negative control sites are sampled from the same
+plates. All their images are downloaded concurrently into the local image
+cache (see `jump_deps.images`), and the panels are then composed as NumPy
+arrays in a pool of processes: one row per site, with one tile per channel
+followed by the merged colour image. Each panel is written as a PNG or WebP
+file.
+
+Use cases:
+# One panel per gene, 3 perturbation and 3 control sites each
+sites = render_gallery(["RAB30", "MYT1"], "gallery")
+# Compounds by JCP2022 id, as PNG
+render_gallery(["JCP2022_011844"], "gallery", input_column="JCP2022", suffix=".png")
+"""
+
+import re
+from functools import cache
+from hashlib import sha1
+from pathlib import Path
+
+import duckdb
+import numpy as np
+import polars as pl
+
+from jump_deps.annotate import get_babel_table
+from jump_deps.images import (
+    CHANNELS,
+    SITE_COLUMNS,
+    ImageCache,
+    downsample,
+    worker_kwargs,
+)
+from jump_deps.pool import map_unordered
+
+CHANNEL_COLOURS = {
+    "AGP": "#FF7F00",  # Orange
+    "DNA": "#0000FF",  # Blue
+    "ER": "#00FF00",  # Green
+    "Mito": "#FF0000",  # Red
+    "RNA": "#FFFF00",  # Yellow
+}
+
+
+@cache
+def get_well_table() -> pl.DataFrame:
+    """
+    Load the well metadata of JUMP (plate and well of every perturbation).
+
+    Returns
+    -------
+    polars.DataFrame
+        Metadata_Source, Metadata_Plate, Metadata_Well and Metadata_JCP2022
+        of every well.
+
+    """
+    from broad_babel.data import get_table
+
+    return pl.read_csv(get_table("well"), infer_schema=False)
+
+
+def select_sites(
+    items: list[str],
+    input_column: str = "standard_key",
+    n_sites: int = 3,
+    n_controls: int = 3,
+    seed: int = 0,
+    index_file: str | Path | None = None,
+) -> pl.DataFrame:
+    """
+    Sample sites of some perturbations and of the controls on their plates.
+
+    Parameters
+    ----------
+    items : list of str
+        Genes or compounds to display.
+    input_column : str
+        Babel column the items belong to ("standard_key" or "JCP2022").
+    n_sites : int
+        Number of sites sampled per item.
+    n_controls : int
+        Number of negative control sites sampled per item, spread over the
+        plates of the sampled perturbation sites.
+    seed : int
+        Random seed of the sampling.
+    index_file : str, Path or None
+        Parquet index of the images, see `jump_deps.images.site_uris`.
+
+    Returns
+    -------
+    polars.DataFrame
+        One row per sampled site with the item, its role ("trt" or
+        "negcon"), its Metadata_JCP2022 and its location columns.
+
+    """
+    if index_file is None:
+        from jump_portrait.fetch import get_index_file
+
+        index_file = get_index_file()
+
+    babel = get_babel_table()
+    targets = (
+        babel
+        .filter(pl.col(input_column).is_in(list(items)))
+        .select(pl.col(input_column).alias("item"), Metadata_JCP2022="JCP2022")
+        .unique()
+    )
+    negcons = (
+        babel.filter(pl.col("pert_type") == "negcon").get_column("JCP2022").unique()
+    )
+    wells = get_well_table()
+    target_wells = wells.join(targets, on="Metadata_JCP2022")
+
+    with duckdb.connect() as con:
+        plates = target_wells.select("Metadata_Plate").unique().to_arrow()
+        con.register("plates", plates)
+        site_table = con.sql(
+            f"SELECT {','.join(SITE_COLUMNS)} FROM read_parquet('{index_file}') "
+            "WHERE Metadata_Plate IN (SELECT Metadata_Plate FROM plates)"
+        ).to_arrow_table()
+    plate_sites = pl.from_arrow(site_table).with_columns(
+        pl.col(SITE_COLUMNS[:-1]).cast(pl.String),
+        pl.col("Metadata_Site").cast(pl.Int64),
+    )
+    on = ["Metadata_Source", "Metadata_Plate", "Metadata_Well"]
+
+    trt = (
+        target_wells
+        .join(plate_sites, on=on)
+        .sample(fraction=1, shuffle=True, seed=seed)
+        .group_by("item", maintain_order=True)
+        .head(n_sites)
+        .with_columns(role=pl.lit("trt"))
+    )
+    negcon = (
+        trt
+        .select("item", "Metadata_Source", "Metadata_Plate")
+        .unique()
+        .join(
+            wells.filter(pl.col("Metadata_JCP2022").is_in(negcons.implode())),
+            on=["Metadata_Source", "Metadata_Plate"],
+        )
+        .join(plate_sites, on=on)
+        .sample(fraction=1, shuffle=True, seed=seed)
+        # Alternate between plates so that controls come from all of them
+        .with_columns(
+            rank=pl.int_range(pl.len()).over("item", "Metadata_Plate"),
+            role=pl.lit("negcon"),
+        )
+        .sort("rank", maintain_order=True)
+        .group_by("item", maintain_order=True)
+        .head(n_controls)
+        .drop("rank")
+    )
+
+    columns = ["item", "role", "Metadata_JCP2022", *SITE_COLUMNS]
+    order = {item: i for i, item in enumerate(items)}
+    return pl.concat([trt.select(columns), negcon.select(columns)]).sort(
+        pl.col("item").replace_strict(order, return_dtype=pl.Int64),
+        pl.col("role") == "negcon",
+        maintain_order=True,
+    )
+
+
+def site_montage(
+    images: dict[str, np.ndarray],
+    channels: tuple[str] = CHANNELS,
+    percentile: float = 99.5,
+    scale: int = 4,
+    shape: tuple[int, int] | None = None,
+) -> np.ndarray:
+    """
+    Compose the channels of one site into a single RGB row.
+
+    Parameters
+    ----------
+    images : dict
+        Maps each channel to its image. Missing channels are left black.
+    channels : tuple of str
+        Channels to display, in order.
+    percentile : float
+        Each channel is rescaled from 0 to this percentile of its intensities.
+    scale : int
+        Downsampling factor applied before composing.
+    shape : tuple of int or None
+        (height, width) of the full-resolution images. If None it is taken
+        from `images`.
+
+    Returns
+    -------
+    numpy.ndarray
+        (height, width * (len(channels) + 1), 3) uint8 array with one tile per
+        channel followed by the merged image.
+
+    Raises
+    ------
+    ValueError
+        If `images` is empty and no `shape` is given.
+
+    """
+    if shape is None:
+        if not images:
+            raise ValueError("A site without images needs an explicit shape")
+        shape = next(iter(images.values())).shape
+    shape = tuple(s // scale for s in shape)
+    tiles = []
+    for channel in channels:
+        colour = CHANNEL_COLOURS.get(channel, "#FFFFFF")
+        rgb = np.array([int(colour[i : i + 2], 16) for i in (1, 3, 5)], np.float32)
+        if channel in images:
+            image = downsample(images[channel], scale)
+            vmax = np.percentile(image, percentile) or 1
+            image = np.clip(image / vmax, 0, 1)
+        else:
+            image = np.zeros(shape, dtype=np.float32)
+        tiles.append(image[..., None] * rgb)
+    tiles.append(np.clip(np.sum(tiles, axis=0), 0, 255))
+    return np.concatenate(tiles, axis=1).astype(np.uint8)
+
+
+def panel_name(item: str) -> str:
+    """
+    File name (without suffix) of the panel of an item.
+
+    Characters that are not safe in file names are replaced, and a hash of
+    the item is then appended, so that items such as "A/B" and "A_B" do not
+    overwrite each other's panel.
+    """
+    name = re.sub(r"[^\w.-]", "_", item)
+    if name != item:
+        name = f"{name}-{sha1(item.encode()).hexdigest()[:8]}"
+    return name
+
+
+def _render_panel(
+    path: Path,
+    sites: list[tuple],
+    labels: list[str],
+    channels: tuple[str],
+    percentile: float,
+    scale: int,
+    cache_kwargs: dict,
+) -> Path:
+    from PIL import Image, ImageDraw
+
+    images = ImageCache(**cache_kwargs).get(sites, channels)
+    # Sites without any image are drawn black, at the size of the others
+    shape = next(
+        (x.shape for site in sites for x in images.get(site, {}).values()), None
+    )
+    rows = []
+    for site, label in zip(sites, labels):
+        row = Image.fromarray(
+            site_montage(images.get(site, {}), channels, percentile, scale, shape)
+        )
+        ImageDraw.Draw(row).text((4, 4), label, fill="white")
+        rows.append(np.asarray(row))
+    # Sources image at different sizes, so the rows of a compound assayed in
+    # several of them are padded with black to the widest one
+    width = max(row.shape[1] for row in rows)
+    rows = [np.pad(row, ((0, 0), (0, width - row.shape[1]), (0, 0))) for row in rows]
+    Image.fromarray(np.concatenate(rows, axis=0)).save(path)
+    return path
+
+
+def render_gallery(
+    items: list[str],
+    output_dir: str | Path,
+    input_column: str = "standard_key",
+    n_sites: int = 3,
+    n_controls: int = 3,
+    channels: tuple[str] = CHANNELS,
+    percentile: float = 99.5,
+    scale: int = 4,
+    suffix: str = ".webp",
+    max_workers: int = 4,
+    seed: int = 0,
+    **cache_kwargs,
+) -> pl.DataFrame:
+    """
+    Write one panel per item comparing its sites with same-plate controls.
+
+    Parameters
+    ----------
+    items : list of str
+        Genes or compounds to display.
+    output_dir : str or Path
+        Directory where the panels are written.
+    input_column : str
+        Babel column the items belong to ("standard_key" or "JCP2022").
+    n_sites : int
+        Number of perturbation sites per panel.
+    n_controls : int
+        Number of negative control sites per panel.
+    channels : tuple of str
+        Channels to display.
+    percentile : float
+        Intensity percentile used to rescale each channel.
+    scale : int
+        Downsampling factor of the images.
+    suffix : str
+        Extension of the panels, which sets their format (e.g., ".webp",
+        ".png").
+    max_workers : int
+        Number of processes composing panels.
+    seed : int
+        Random seed of the site sampling.
+    **cache_kwargs
+        Passed on to `jump_deps.images.ImageCache`.
+
+    Returns
+    -------
+    polars.DataFrame
+        Sampled sites (see `select_sites`) with the panel they appear in.
+
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    sites = select_sites(
+        items,
+        input_column,
+        n_sites,
+        n_controls,
+        seed,
+        cache_kwargs.get("index_file"),
+    )
+    sites = sites.with_columns(
+        panel=pl.col("item").replace_strict({
+            item: str(output_dir / f"{panel_name(item)}{suffix}")
+            for item in sites.get_column("item").unique()
+        })
+    )
+
+    # Download everything at once; the workers then read the local copies
+    ImageCache(**cache_kwargs).get(sites.select(SITE_COLUMNS).rows(), channels)
+
+    jobs = []
+    for (path,), panel in sites.group_by("panel", maintain_order=True):
+        labels = [
+            f"{item} ({role})\n{plate} {well} site {site}"
+            for item, role, plate, well, site in panel.select(
+                "item", "role", "Metadata_Plate", "Metadata_Well", "Metadata_Site"
+            ).iter_rows()
+        ]
+        jobs.append((Path(path), panel.select(SITE_COLUMNS).rows(), labels))
+
+    kwargs = worker_kwargs(cache_kwargs)
+    list(
+        map_unordered(
+            _render_panel,
+            (
+                (path, (path, panel_sites, labels, channels, percentile, scale, kwargs))
+                for path, panel_sites, labels in jobs
+            ),
+            max_workers,
+        )
+    )
+
+    return sites
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+"""
+Concurrent retrieval of Cell Painting images with a local cache.
+
+`jump_portrait.fetch.get_jump_image` queries the image index and opens a new
+S3 client for every channel it fetches. Here the locations of all the
+requested sites and channels are resolved in a single query, the images are
+downloaded in a pool of threads that share one client, and the decoded
+arrays are stored on disk under source/batch/plate/well/site/channel. Images
+are evicted least-recently-used first once the cache exceeds its byte budget,
+so redrawing a site or reusing the same control wells is served locally.
+
+Use cases:
+# All channels of one site
+images = get_site_images("source_13", "20221109_Run5", "CP-CC9-R5-20", "A01", 1)
+# Many sites at once
+images = get_images([("source_13", "20221109_Run5", "CP-CC9-R5-20", "A01", 1), ...])
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+
+import duckdb
+import numpy as np
+import polars as pl
+
+from jump_deps.cache import LRUDirectory
+from jump_deps.io_trace import record_request
+from jump_deps.manifest import get_cache_dir
+
+CHANNELS = ("AGP", "DNA", "ER", "Mito", "RNA")
+SITE_COLUMNS = (
+    "Metadata_Source",
+    "Metadata_Batch",
+    "Metadata_Plate",
+    "Metadata_Well",
+    "Metadata_Site",
+)
+DEFAULT_IMAGE_MAX_BYTES = 10e9
+BUCKET = "cellpainting-gallery"
+
+SiteKey = tuple[str, str, str, str, int]
+
+
+def site_key(
+    source: str, batch: str, plate: str, well: str, site: str | int
+) -> SiteKey:
+    """Normalise the location of a site (sites are stored as integers)."""
+    return (source, batch, plate, well, int(site))
+
+
+def site_uris(
+    sites: list[SiteKey],
+    channels: tuple[str] = CHANNELS,
+    index_file: str | Path | None = None,
+) -> pl.DataFrame:
+    """
+    Resolve the S3 uris of many sites and channels with a single query.
+
+    Parameters
+    ----------
+    sites : list of tuple
+        (source, batch, plate, well, site) of each site.
+    channels : tuple of str
+        Channels to resolve.
+    index_file : str, Path or None
+        Parquet index of the images. If None the one provided by
+        `jump_portrait.fetch.get_index_file` is used.
+
+    Returns
+    -------
+    polars.DataFrame
+        One row per site and channel found in the index, with the site
+        columns, Metadata_Channel and Metadata_uri.
+
+    """
+    if index_file is None:
+        from jump_portrait.fetch import get_index_file
+
+        index_file = get_index_file()
+
+    keys = pl.DataFrame(
+        [site_key(*site) for site in sites],
+        schema=dict.fromkeys(SITE_COLUMNS[:-1], pl.String)
+        | {"Metadata_Site": pl.Int64},
+        orient="row",
+    ).unique()
+    url_columns = ",".join(f"i.URL_Orig{channel}" for channel in channels)
+    condition = " AND ".join(
+        f"CAST(i.{column} AS {'BIGINT' if column == 'Metadata_Site' else 'VARCHAR'})"
+        f" = k.{column}"
+        for column in SITE_COLUMNS
+    )
+    with duckdb.connect() as con:
+        con.register("keys", keys.to_arrow())
+        table = con.sql(
+            f"SELECT k.*, {url_columns} "
+            f"FROM read_parquet('{index_file}') i JOIN keys k ON {condition}"
+        ).to_arrow_table()
+
+    return (
+        pl
+        .from_arrow(table)
+        .unpivot(
+            index=list(SITE_COLUMNS),
+            variable_name="Metadata_Channel",
+            value_name="Metadata_uri",
+        )
+        .with_columns(pl.col("Metadata_Channel").str.strip_prefix("URL_Orig"))
+        .drop_nulls("Metadata_uri")
+    )
+
+
+def read_s3_image(uri: str, client, bucket: str = BUCKET) -> np.ndarray:
+    """
+    Download and decode one image with an existing S3 client.
+
+    Parameters
+    ----------
+    uri : str
+        S3 uri or key of the image.
+    client : botocore.client.S3
+        Client to download with. Clients are thread-safe, so one client can
+        be shared by all the threads of a pool.
+    bucket : str
+        Bucket that holds the image.
+
+    Returns
+    -------
+    numpy.ndarray
+        Decoded image.
+
+    Raises
+    ------
+    ValueError
+        If the image format is not supported.
+
+    """
+    import matplotlib.image as mpimg
+
+    key = str(uri).removeprefix(f"s3://{bucket}/")
+    started = time.perf_counter()
+    body = BytesIO(client.get_object(Bucket=bucket, Key=key)["Body"].read())
+    size = body.getbuffer().nbytes
+    record_request(
+        f"s3://{bucket}/{key}", size, time.perf_counter() - started, size, "s3"
+    )
+    if key.endswith((".tif", ".tiff")):
+        return mpimg.imread(body, format="tiff")
+    if key.endswith(".npy"):
+        return np.load(body)
+    if key.endswith(".png"):
+        return mpimg.imread(body, format="png")
+    raise ValueError(f"Format not supported for {key}")
+
+
+def downsample(image: np.ndarray, scale: int) -> np.ndarray:
+    """Shrink an image by averaging `scale` x `scale` blocks of pixels."""
+    if scale == 1:
+        return image.astype(np.float32)
+    h, w = (s - s % scale for s in image.shape)
+    return (
+        image[:h, :w]
+        .reshape(h // scale, scale, w // scale, scale)
+        .mean(axis=(1, 3), dtype=np.float32)
+    )
+
+
+def worker_kwargs(cache_kwargs: dict) -> dict:
+    """
+    `ImageCache` arguments that can be sent to worker processes.
+
+    S3 clients cannot be pickled, and workers that only read cached images do
+    not need one.
+    """
+    return {k: v for k, v in cache_kwargs.items() if k != "client"}
+
+
+class ImageCache:
+    """
+    Fetch Cell Painting images concurrently, keeping decoded copies on disk.
+
+    Parameters
+    ----------
+    cache_dir : str, Path or None
+        Root of the local cache, see `jump_deps.manifest.get_cache_dir`.
+    max_bytes : float or None
+        Disk budget for images. If None it is read from the environment
+        variable JUMP_DEPS_IMAGE_CACHE_MAX_BYTES, falling back to 10 GB.
+    max_workers : int
+        Number of images downloaded concurrently.
+    client : botocore.client.S3 or None
+        S3 client. If None an anonymous one is created on first use.
+    index_file : str, Path or None
+        Parquet index of the images, see `site_uris`.
+
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | Path | None = None,
+        max_bytes: float | None = None,
+        max_workers: int = 16,
+        client=None,
+        index_file: str | Path | None = None,
+    ):
+        if max_bytes is None:
+            max_bytes = float(
+                os.environ.get(
+                    "JUMP_DEPS_IMAGE_CACHE_MAX_BYTES", DEFAULT_IMAGE_MAX_BYTES
+                )
+            )
+        self.files = LRUDirectory(get_cache_dir(cache_dir) / "images", max_bytes)
+        self.max_workers = max_workers
+        self.client = client
+        self.index_file = index_file
+
+    @staticmethod
+    def filename(site: SiteKey, channel: str) -> str:
+        """Name of the cached copy of one channel of a site."""
+        return "/".join(map(str, (*site, f"{channel}.npy")))
+
+    def _download(self, uri: str, name: str) -> np.ndarray:
+        image = read_s3_image(uri, self.client)
+        tmp = self.files.tempfile()
+        try:
+            with open(tmp, "wb") as f:
+                np.save(f, image)
+            self.files.put(name, tmp, evict=False)
+        finally:
+            tmp.unlink(missing_ok=True)
+        return image
+
+    def get(
+        self, sites: list[SiteKey], channels: tuple[str] = CHANNELS
+    ) -> dict[SiteKey, dict[str, np.ndarray]]:
+        """
+        Return all the requested channels of many sites.
+
+        Parameters
+        ----------
+        sites : list of tuple
+            (source, batch, plate, well, site) of each site.
+        channels : tuple of str
+            Channels to return.
+
+        Returns
+        -------
+        dict
+            Maps each site (with its site number as an integer) to a
+            dictionary from channel to image. Channels missing from the index
+            are left out.
+
+        """
+        sites = list(dict.fromkeys(site_key(*site) for site in sites))
+        images = {site: {} for site in sites}
+        missing = set()
+        for site in sites:
+            for channel in channels:
+                path = self.files.get(self.filename(site, channel))
+                if path is None:
+                    missing.add(site)
+                else:
+                    images[site][channel] = np.load(path)
+        if not missing:
+            return images
+
+        uris = site_uris(sorted(missing), channels, self.index_file)
+        todo = [
+            (tuple(site), channel, uri)
+            for *site, channel, uri in uris.iter_rows()
+            if channel not in images[tuple(site)]
+        ]
+        if self.client is None:
+            from jump_portrait.s3 import s3client
+
+            self.client = s3client()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            fetched = executor.map(
+                lambda x: self._download(x[2], self.filename(x[0], x[1])), todo
+            )
+            for (site, channel, _), image in zip(todo, fetched):
+                images[site][channel] = image
+        self.files.evict()
+        return images
+
+
+def get_images(
+    sites: list[SiteKey], channels: tuple[str] = CHANNELS, **kwargs
+) -> dict[SiteKey, dict[str, np.ndarray]]:
+    """
+    Fetch many sites using the default image cache.
+
+    Parameters
+    ----------
+    sites : list of tuple
+        (source, batch, plate, well, site) of each site.
+    channels : tuple of str
+        Channels to fetch.
+    **kwargs
+        Passed on to `ImageCache`.
+
+    Returns
+    -------
+    dict
+        See `ImageCache.get`.
+
+    """
+    return ImageCache(**kwargs).get(sites, channels)
+
+
+def get_site_images(
+    source: str,
+    batch: str,
+    plate: str,
+    well: str,
+    site: str | int,
+    channels: tuple[str] = CHANNELS,
+    **kwargs,
+) -> dict[str, np.ndarray]:
+    """Fetch all the channels of one site, see `get_images`."""
+    key = site_key(source, batch, plate, well, site)
+    return get_images([key], channels, **kwargs)[key]
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+"""
+Tracing of the remote reads and cache lookups made by jump_deps.
+
+Whether a query is usable over a slow link depends on how many requests it
+makes and how many bytes they carry. While a trace is active, every HTTP
+range request (`jump_deps.remote.fetch_range`), profile download, S3 image
+read and lookup in a local cache (`jump_deps.cache.LRUDirectory`) is
+recorded with its size and latency, under the name of the query that was
+running. Outside of a trace recording costs a single check.
+
+A trace can be opened around any block of code, or for the whole process by
+setting the environment variable JUMP_DEPS_TRACE to the JSON file where the
+events are written at exit (worker processes add their pid to its name).
+
+Reads that polars performs itself on urls (`pl.scan_parquet("https://...")`)
+bypass jump_deps and are only visible as the duration of their query.
+
+Use cases:
+with trace_io() as trace, trace.query("gene slice"):
+    read_perturbations("crispr", jcp_ids=["JCP2022_805264"])
+trace.summary()
+# Whole script
+JUMP_DEPS_TRACE=trace.json python scripts/12_add_metadata.py
+"""
+
+import atexit
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+
+# Upper edges of the latency histogram, in milliseconds
+LATENCY_BUCKETS_MS = (
+    1,
+    2,
+    5,
+    10,
+    20,
+    50,
+    100,
+    200,
+    500,
+    1000,
+    2000,
+    5000,
+    float("inf"),
+)
+
+_active: list["IOTrace"] = []
+_lock = threading.Lock()
+
+
+class IOTrace:
+    """
+    Requests and cache lookups recorded while the trace is active.
+
+    Events are attributed to the innermost open `query`, or to "(none)".
+    """
+
+    def __init__(self):
+        self.requests: list[dict] = []
+        self.lookups: list[dict] = []
+        self.queries: list[dict] = []
+        self.file_sizes: dict[str, int] = {}
+        self.current = "(none)"
+
+    @contextmanager
+    def query(self, name: str) -> Iterator["IOTrace"]:
+        """Attribute the events of a block of code to `name` and time it."""
+        previous, self.current = self.current, name
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.queries.append({
+                "query": name,
+                "seconds": time.perf_counter() - start,
+            })
+            self.current = previous
+
+    def summary(self) -> pl.DataFrame:
+        """
+        Per-query totals.
+
+        Returns
+        -------
+        polars.DataFrame
+            Wall time, number of requests, bytes fetched, total size of the
+            remote files touched and the fraction of it that was fetched,
+            latency percentiles, and cache hits, misses and hit rate.
+
+        """
+        queries = (
+            pl
+            .DataFrame(self.queries, schema={"query": pl.String, "seconds": pl.Float64})
+            .group_by("query", maintain_order=True)
+            .agg(pl.col("seconds").sum())
+        )
+        requests = (
+            self
+            .request_frame()
+            .group_by("query")
+            .agg(
+                pl.len().alias("requests"),
+                pl.col("bytes").sum().alias("bytes_fetched"),
+                pl
+                .col("url")
+                .unique()
+                .replace_strict(self.file_sizes, default=None, return_dtype=pl.Int64)
+                .sum()
+                .alias("file_bytes"),
+                *(
+                    pl
+                    .col("seconds")
+                    .quantile(q)
+                    .mul(1000)
+                    .alias(f"latency_p{int(q * 100)}_ms")
+                    for q in (0.5, 0.9, 0.99)
+                ),
+            )
+            .with_columns(
+                (pl.col("bytes_fetched") / pl.col("file_bytes")).alias(
+                    "fetched_fraction"
+                )
+            )
+        )
+        lookups = (
+            pl
+            .DataFrame(
+                self.lookups,
+                schema={"query": pl.String, "cache": pl.String, "hit": pl.Boolean},
+            )
+            .group_by("query")
+            .agg(
+                pl.col("hit").sum().alias("cache_hits"),
+                (~pl.col("hit")).sum().alias("cache_misses"),
+                pl.col("hit").mean().alias("cache_hit_rate"),
+            )
+        )
+        names = pl.concat([
+            queries.select("query"),
+            requests.select("query"),
+            lookups.select("query"),
+        ]).unique(maintain_order=True)
+        return (
+            names
+            .join(queries, on="query", how="left")
+            .join(requests, on="query", how="left")
+            .join(lookups, on="query", how="left")
+            .with_columns(
+                pl.col(
+                    "requests", "bytes_fetched", "cache_hits", "cache_misses"
+                ).fill_null(0)
+            )
+        )
+
+    def request_frame(self) -> pl.DataFrame:
+        """One row per request: query, url, bytes, seconds and kind."""
+        return pl.DataFrame(
+            self.requests,
+            schema={
+                "query": pl.String,
+                "url": pl.String,
+                "bytes": pl.Int64,
+                "seconds": pl.Float64,
+                "kind": pl.String,
+            },
+        )
+
+    def latency_histogram(self) -> pl.DataFrame:
+        """Number of requests of each query per latency bucket (upper edge in ms)."""
+        requests = self.request_frame()
+        edges = np.array(LATENCY_BUCKETS_MS)
+        buckets = edges[np.searchsorted(edges, requests.get_column("seconds") * 1000)]
+        return (
+            requests
+            .with_columns(pl.Series("le_ms", buckets, dtype=pl.Float64))
+            .group_by("query", "le_ms")
+            .agg(pl.len().alias("requests"))
+            .sort("query", "le_ms")
+        )
+
+    def to_dict(self) -> dict:
+        """Raw events and summary, ready to be serialised as JSON."""
+        return {
+            "summary": self.summary().to_dicts(),
+            "latency_histogram": self.latency_histogram().to_dicts(),
+            "requests": self.requests,
+            "lookups": self.lookups,
+            "queries": self.queries,
+            "file_sizes": self.file_sizes,
+        }
+
+    def to_json(self, path: str | Path) -> Path:
+        """Write `to_dict` to a JSON file."""
+        path = Path(path)
+        path.write_text(json.dumps(self.to_dict(), indent=1, default=str))
+        return path
+
+
+@contextmanager
+def trace_io() -> Iterator[IOTrace]:
+    """Record the I/O of jump_deps made inside the block."""
+    trace = IOTrace()
+    with _lock:
+        _active.append(trace)
+    try:
+        yield trace
+    finally:
+        with _lock:
+            _active.remove(trace)
+
+
+def record_request(
+    url: str,
+    n_bytes: int,
+    seconds: float,
+    file_size: int | None = None,
+    kind: str = "range",
+) -> None:
+    """Record a request in the active traces."""
+    if not _active:
+        return
+    with _lock:
+        for trace in _active:
+            trace.requests.append({
+                "query": trace.current,
+                "url": url,
+                "bytes": n_bytes,
+                "seconds": seconds,
+                "kind": kind,
+            })
+            if file_size is not None:
+                trace.file_sizes[url] = file_size
+
+
+def record_lookup(cache: str, hit: bool) -> None:
+    """Record a cache lookup in the active traces."""
+    if not _active:
+        return
+    with _lock:
+        for trace in _active:
+            trace.lookups.append({"query": trace.current, "cache": cache, "hit": hit})
+
+
+def _trace_process(path: str) -> None:
+    """Trace the whole process and write the events to `path` at exit."""
+    path = Path(path)
+    if multiprocessing.parent_process() is not None:
+        # Workers of a pool write their own file next to the main one
+        path = path.with_name(f"{path.stem}-{os.getpid()}{path.suffix}")
+    trace = IOTrace()
+    with _lock:
+        _active.append(trace)
+    atexit.register(trace.to_json, path)
+
+
+if os.environ.get("JUMP_DEPS_TRACE"):
+    _trace_process(os.environ["JUMP_DEPS_TRACE"])
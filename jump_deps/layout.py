@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+"""
+Plate layout of the manifest subsets: which perturbation is in which well.
+
+Selecting a perturbation together with the negative controls on its plates
+used to take two passes over the profiles: one to find its plates and another
+one to load those plates. The layout index answers the first step from
+memory: it stores the source, plate, well, Metadata_JCP2022 and pert_type of
+every well of a subset (a few MB, dictionary-encoded), keyed by the ETag of
+the subset, and keeps dictionaries from perturbations to plates and from
+plates to perturbations and control wells. The profiles are then loaded in a
+single targeted read through the row-group index.
+
+Use cases:
+# Plates of a gene and the negative controls on them
+layout = get_layout_index("crispr")
+plates, controls = layout.matched_controls(["JCP2022_805264"])
+# Profiles of the gene and its plate-matched controls in one read
+read_with_controls("crispr", ["JCP2022_805264"])
+"""
+
+import os
+from collections.abc import Iterable
+from pathlib import Path
+
+import polars as pl
+
+from jump_deps.annotate import annotate
+from jump_deps.cache import ProfileCache, index_path
+from jump_deps.manifest import get_entry, get_manifest
+from jump_deps.remote import read_parquet
+from jump_deps.rowgroup_index import read_perturbations
+
+LAYOUT_COLUMNS = (
+    "Metadata_Source",
+    "Metadata_Plate",
+    "Metadata_Well",
+    "Metadata_JCP2022",
+)
+
+
+class LayoutIndex:
+    """
+    Wells of a subset with lookups by perturbation and by plate.
+
+    Parameters
+    ----------
+    wells : polars.DataFrame
+        One row per well with the `LAYOUT_COLUMNS` and pert_type.
+
+    """
+
+    def __init__(self, wells: pl.DataFrame):
+        self.wells = wells
+        self.plates_of: dict[str, list[str]] = dict(
+            wells
+            .group_by("Metadata_JCP2022")
+            .agg(pl.col("Metadata_Plate").unique().sort())
+            .iter_rows()
+        )
+        self.perturbations_on: dict[str, list[str]] = dict(
+            wells
+            .group_by("Metadata_Plate")
+            .agg(pl.col("Metadata_JCP2022").unique().sort())
+            .iter_rows()
+        )
+        self.controls_on: dict[str, pl.DataFrame] = {
+            plate: frame
+            for (plate,), frame in wells
+            .filter(pl.col("pert_type") == "negcon")
+            .partition_by("Metadata_Plate", as_dict=True)
+            .items()
+        }
+
+    @classmethod
+    def build(cls, path: str | Path) -> "LayoutIndex":
+        """
+        Index a local or remote parquet file reading only its metadata columns.
+
+        Parameters
+        ----------
+        path : str or Path
+            Local path or url of the profiles.
+
+        Returns
+        -------
+        LayoutIndex
+            Layout of the file.
+
+        """
+        wells = read_parquet(path, columns=list(LAYOUT_COLUMNS))
+        wells = annotate(wells, ("pert_type",)).with_columns(
+            pl.col("pert_type").fill_null("unknown")
+        )
+        return cls(wells.sort("Metadata_Plate", "Metadata_Well"))
+
+    def save(self, path: str | Path) -> None:
+        """
+        Store the wells as a single compressed parquet file.
+
+        The file is written under a temporary name and renamed, so a crash or
+        a concurrent build never leaves a truncated index at `path`.
+        """
+        path = Path(path)
+        tmp = path.with_name(f".partial-{os.getpid()}-{path.name}")
+        try:
+            self.wells.write_parquet(tmp, compression="zstd")
+            tmp.replace(path)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "LayoutIndex":
+        """Load an index stored with `save`."""
+        return cls(pl.read_parquet(path))
+
+    def plates(self, jcp_ids: Iterable[str]) -> list[str]:
+        """Sorted plates where any of the perturbations was assayed."""
+        return sorted({
+            plate for jcp_id in jcp_ids for plate in self.plates_of.get(jcp_id, ())
+        })
+
+    def positions(self, jcp_ids: Iterable[str]) -> pl.DataFrame:
+        """Source, plate and well of every well of some perturbations."""
+        return self.wells.filter(pl.col("Metadata_JCP2022").is_in(list(jcp_ids)))
+
+    def control_wells(
+        self, plates: Iterable[str], controls: Iterable[str] | None = None
+    ) -> pl.DataFrame:
+        """Negative control wells of some plates, optionally of some controls."""
+        frames = [self.controls_on[p] for p in plates if p in self.controls_on]
+        wells = pl.concat(frames) if frames else self.wells.clear()
+        if controls is not None:
+            wells = wells.filter(pl.col("Metadata_JCP2022").is_in(list(controls)))
+        return wells
+
+    def matched_controls(
+        self, jcp_ids: Iterable[str], controls: Iterable[str] | None = None
+    ) -> tuple[list[str], list[str]]:
+        """
+        Plates of some perturbations and the negative controls on those plates.
+
+        Parameters
+        ----------
+        jcp_ids : collection of str
+            Perturbations (Metadata_JCP2022).
+        controls : collection of str or None
+            Negative controls to consider (e.g., only "JCP2022_800002"). If
+            None every negative control on the plates is returned.
+
+        Returns
+        -------
+        list of str
+            Plates where any of the perturbations was assayed.
+        list of str
+            JCP2022 ids of the negative controls on those plates.
+
+        """
+        plates = self.plates(jcp_ids)
+        wells = self.control_wells(plates, controls)
+        return plates, wells.get_column("Metadata_JCP2022").unique().sort().to_list()
+
+
+def get_layout_index(
+    subset: str,
+    manifest: list[dict[str, str]] | None = None,
+    cache_dir: str | Path | None = None,
+) -> LayoutIndex:
+    """
+    Load the layout index of a subset, building it on first use.
+
+    Parameters
+    ----------
+    subset : str
+        Name of the subset in the manifest.
+    manifest : list of dict or None
+        Manifest to resolve subsets with. If None the default one is loaded.
+    cache_dir : str, Path or None
+        Root of the local cache, see `jump_deps.manifest.get_cache_dir`.
+
+    Returns
+    -------
+    LayoutIndex
+        Layout of the subset in its current version.
+
+    """
+    if manifest is None:
+        manifest = get_manifest(cache_dir=cache_dir)
+    entry = get_entry(subset, manifest)
+    path = index_path(entry, "layout", cache_dir)
+    if path.exists():
+        return LayoutIndex.load(path)
+
+    local = ProfileCache(cache_dir=cache_dir, manifest=manifest).local(subset)
+    index = LayoutIndex.build(local or entry["url"])
+    index.save(path)
+    return index
+
+
+def read_with_controls(
+    subset: str,
+    jcp_ids: Iterable[str],
+    columns: list[str] | None = None,
+    manifest: list[dict[str, str]] | None = None,
+    cache_dir: str | Path | None = None,
+    controls: Iterable[str] | None = None,
+) -> pl.DataFrame:
+    """
+    Load some perturbations and the negative controls on their plates.
+
+    Parameters
+    ----------
+    subset : str
+        Name of the subset in the manifest.
+    jcp_ids : collection of str
+        Perturbations (Metadata_JCP2022) to load.
+    columns : list of str or None
+        Columns to read. If None all columns are read.
+    manifest : list of dict or None
+        Manifest to resolve subsets with. If None the default one is loaded.
+    cache_dir : str, Path or None
+        Root of the local cache, see `jump_deps.manifest.get_cache_dir`.
+    controls : collection of str or None
+        Negative controls to load. If None every negative control on the
+        plates of the perturbations is loaded.
+
+    Returns
+    -------
+    polars.DataFrame
+        Wells of the perturbations and of the controls on the same plates.
+
+    """
+    if manifest is None:
+        manifest = get_manifest(cache_dir=cache_dir)
+    jcp_ids = list(jcp_ids)
+    plates, controls = get_layout_index(subset, manifest, cache_dir).matched_controls(
+        jcp_ids, controls
+    )
+    return read_perturbations(
+        subset, plates=plates, columns=columns, manifest=manifest, cache_dir=cache_dir
+    ).filter(pl.col("Metadata_JCP2022").is_in([*jcp_ids, *controls]))
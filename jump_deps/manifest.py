@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""
+Access to the versioned profile manifest of the JUMP datasets.
+
+The manifest is a JSON list with one entry per profile subset (e.g., crispr,
+orf, compound, all and their interpretable versions). Each entry carries the
+url of the parquet file, its ETag and the permalinks to the recipe and
+configuration that produced it.
+
+The manifest is stored locally and only revalidated with a conditional GET
+once it is older than `max_age`, so warm runs do not touch the network.
+"""
+
+import json
+import os
+import time
+from hashlib import sha1
+from pathlib import Path
+
+import requests
+
+INDEX_FILE = "https://raw.githubusercontent.com/jump-cellpainting/datasets/v0.11.0/manifests/profile_index.json"
+
+
+def get_cache_dir(cache_dir: str | Path | None = None) -> Path:
+    """
+    Return the root directory of the local jump_deps cache.
+
+    Parameters
+    ----------
+    cache_dir : str, Path or None
+        Explicit location. If None it is read from the environment variable
+        JUMP_DEPS_CACHE_DIR, falling back to ~/.cache/jump_deps.
+
+    Returns
+    -------
+    Path
+        Existing directory.
+
+    """
+    if cache_dir is None:
+        cache_dir = os.environ.get(
+            "JUMP_DEPS_CACHE_DIR", Path.home() / ".cache" / "jump_deps"
+        )
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+
+def get_manifest(
+    index_url: str = INDEX_FILE,
+    cache_dir: str | Path | None = None,
+    max_age: float = 24 * 3600,
+) -> list[dict[str, str]]:
+    """
+    Load the profile manifest, reusing the local copy whenever possible.
+
+    Parameters
+    ----------
+    index_url : str
+        Location of the manifest json file.
+    cache_dir : str, Path or None
+        Root of the local cache, see `get_cache_dir`.
+    max_age : float
+        Seconds after which the local copy is revalidated against the server
+        using its HTTP ETag. If the server cannot be reached the local copy is
+        used regardless of its age.
+
+    Returns
+    -------
+    list of dict
+        One dictionary per subset with (at least) the keys subset, url and etag.
+
+    """
+    manifest_dir = get_cache_dir(cache_dir) / "manifests"
+    manifest_dir.mkdir(exist_ok=True)
+    local = manifest_dir / f"{sha1(index_url.encode()).hexdigest()}.json"
+    etag_file = local.with_suffix(".etag")
+
+    if local.exists() and (time.time() - local.stat().st_mtime) < max_age:
+        return json.loads(local.read_text())
+
+    headers = {}
+    if local.exists() and etag_file.exists():
+        headers["If-None-Match"] = etag_file.read_text()
+
+    try:
+        response = requests.get(index_url, headers=headers, timeout=30)
+        response.raise_for_status()
+    except requests.RequestException:
+        if local.exists():
+            return json.loads(local.read_text())
+        raise
+
+    if response.status_code == 304:
+        local.touch()
+    else:
+        local.write_text(response.text)
+        if "ETag" in response.headers:
+            etag_file.write_text(response.headers["ETag"])
+
+    return json.loads(local.read_text())
+
+
+def get_entry(subset: str, manifest: list[dict[str, str]] | None = None) -> dict:
+    """
+    Return the manifest entry of one subset.
+
+    Parameters
+    ----------
+    subset : str
+        Name of the subset (e.g., "crispr" or "orf_interpretable").
+    manifest : list of dict or None
+        Manifest to search in. If None the default one is loaded.
+
+    Returns
+    -------
+    dict
+        Manifest entry.
+
+    Raises
+    ------
+    KeyError
+        If the subset is not part of the manifest.
+
+    """
+    if manifest is None:
+        manifest = get_manifest()
+    for entry in manifest:
+        if entry["subset"] == subset:
+            return entry
+    raise KeyError(
+        f"Subset {subset} not found, available: {[x['subset'] for x in manifest]}"
+    )
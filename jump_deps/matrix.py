@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+Conversion of polars profiles into the inputs expected by copairs.
+
+`DataFrame.to_numpy()` on a frame with hundreds of feature columns builds a
+float64 matrix, and `to_pandas()` converts every column, features included.
+Here the feature matrix is allocated once as contiguous float32 and filled
+column by column from the Arrow buffers, and only the metadata columns are
+handed to pandas, as categoricals.
+
+Use cases:
+meta, feats = copairs_inputs(profiles)
+average_precision(meta, feats, ...)
+"""
+
+from collections.abc import Sequence
+
+import numpy as np
+import pandas as pd
+import polars as pl
+
+
+def split_columns(
+    profiles: pl.DataFrame | pl.LazyFrame,
+    metadata_prefixes: tuple[str] = ("Metadata",),
+) -> tuple[list[str], list[str]]:
+    """
+    Separate metadata from feature columns.
+
+    Parameters
+    ----------
+    profiles : polars.DataFrame or polars.LazyFrame
+        Profiles to inspect; only the schema is used.
+    metadata_prefixes : tuple of str
+        Columns starting with any of these are metadata.
+
+    Returns
+    -------
+    list of str
+        Metadata columns: the prefixed ones plus any non-numeric column
+        (e.g., annotations such as pert_type).
+    list of str
+        Feature columns.
+
+    """
+    schema = (
+        profiles.collect_schema()
+        if isinstance(profiles, pl.LazyFrame)
+        else profiles.schema
+    )
+    metadata, features = [], []
+    for name, dtype in schema.items():
+        if name.startswith(metadata_prefixes) or not dtype.is_numeric():
+            metadata.append(name)
+        else:
+            features.append(name)
+    return metadata, features
+
+
+def feature_matrix(
+    profiles: pl.DataFrame,
+    columns: Sequence[str] | None = None,
+    dtype: np.dtype = np.float32,
+) -> np.ndarray:
+    """
+    Build a C-contiguous feature matrix without intermediate float64 copies.
+
+    Parameters
+    ----------
+    profiles : polars.DataFrame
+        Profiles to convert.
+    columns : sequence of str or None
+        Feature columns. If None they are inferred with `split_columns`.
+    dtype : numpy.dtype
+        Data type of the matrix.
+
+    Returns
+    -------
+    numpy.ndarray
+        (n_rows, n_features) matrix. Nulls become NaN.
+
+    """
+    if columns is None:
+        columns = split_columns(profiles)[1]
+    target = pl.Float64 if np.dtype(dtype) == np.float64 else pl.Float32
+    matrix = np.empty((profiles.height, len(columns)), dtype=dtype)
+    for j, name in enumerate(columns):
+        # Arrow-backed view when the column already has the target type
+        matrix[:, j] = profiles.get_column(name).cast(target).to_numpy()
+    return matrix
+
+
+def metadata_frame(
+    profiles: pl.DataFrame, columns: Sequence[str] | None = None
+) -> pd.DataFrame:
+    """
+    Convert only the metadata columns to pandas, with strings as categoricals.
+
+    Parameters
+    ----------
+    profiles : polars.DataFrame
+        Profiles to convert.
+    columns : sequence of str or None
+        Metadata columns. If None they are inferred with `split_columns`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Metadata accepted by copairs.
+
+    """
+    if columns is None:
+        columns = split_columns(profiles)[0]
+    return (
+        profiles
+        .select(columns)
+        .with_columns(pl.col(pl.String).cast(pl.Categorical))
+        .to_pandas()
+    )
+
+
+def copairs_inputs(
+    profiles: pl.DataFrame,
+    metadata_prefixes: tuple[str] = ("Metadata",),
+    dtype: np.dtype = np.float32,
+) -> tuple[pd.DataFrame, np.ndarray]:
+    """
+    Metadata and feature matrix for copairs from a polars frame.
+
+    Parameters
+    ----------
+    profiles : polars.DataFrame
+        Profiles to convert.
+    metadata_prefixes : tuple of str
+        Prefixes of the metadata columns, see `split_columns`.
+    dtype : numpy.dtype
+        Data type of the feature matrix.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Metadata, see `metadata_frame`.
+    numpy.ndarray
+        Features, see `feature_matrix`.
+
+    """
+    metadata, features = split_columns(profiles, metadata_prefixes)
+    return metadata_frame(profiles, metadata), feature_matrix(profiles, features, dtype)
@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+"""
+Gene summaries from NCBI E-utilities, fetched in batches and cached locally.
+
+Calling `Bio.Entrez.esummary` once per gene costs one round-trip per gene.
+Here ids are sent comma-joined, many per request, under a token bucket that
+keeps within the E-utilities rate limit (3 requests per second, 10 with an
+API key). Every summary is stored in a SQLite database keyed by NCBI Gene ID,
+so genes that were already annotated are served without the network.
+
+The server url is a parameter, so the fetcher can be pointed at a local stub
+that mimics the esummary JSON responses.
+
+Use cases:
+# Name, description and summary of some genes
+fetch_gene_summaries([1131, 57506])
+# Same, starting from gene symbols
+gene_summaries(("CHRM4", "SCAPER", "GPR176", "LY6K"))
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import closing, contextmanager
+from pathlib import Path
+
+import polars as pl
+import requests
+
+from jump_deps.annotate import get_translation
+from jump_deps.manifest import get_cache_dir
+
+EUTILS_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
+FIELDS = ("Name", "Description", "Summary", "OtherDesignations")
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+
+    Parameters
+    ----------
+    rate : float
+        Tokens added per second.
+    capacity : float
+        Maximum number of tokens, i.e. the largest burst allowed.
+
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Take one token, waiting until one is available."""
+        with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                time.sleep((1 - self.tokens) / self.rate)
+
+
+class GeneSummaryCache:
+    """
+    Fetch NCBI gene summaries, keeping every document in SQLite.
+
+    Parameters
+    ----------
+    path : str, Path or None
+        SQLite database. If None it is stored in the jump_deps cache.
+    email : str or None
+        Contact address sent to NCBI, as requested by their usage policy.
+    api_key : str or None
+        NCBI API key, which raises the rate limit from 3 to 10 requests per
+        second.
+    base_url : str
+        Root of the E-utilities, replaced by a local server in tests.
+    batch_size : int
+        Ids per request.
+    max_retries : int
+        Attempts per batch when the server answers 429 or 5xx.
+
+    """
+
+    def __init__(
+        self,
+        path: str | Path | None = None,
+        email: str | None = None,
+        api_key: str | None = None,
+        base_url: str = EUTILS_URL,
+        batch_size: int = 200,
+        max_retries: int = 3,
+    ):
+        if path is None:
+            path = get_cache_dir() / "ncbi_gene.sqlite"
+        self.path = Path(path)
+        self.email = email
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(10 if api_key else 3)
+        self.session = requests.Session()
+        with self._connect() as con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS gene_summary "
+                "(gene_id INTEGER PRIMARY KEY, document TEXT, fetched REAL)"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Connection that commits on success and is always closed."""
+        with closing(sqlite3.connect(self.path)) as con, con:
+            yield con
+
+    def cached(self, gene_ids: Iterable[int]) -> dict[int, dict]:
+        """Documents of the requested genes that are already stored."""
+        gene_ids = list(gene_ids)
+        with self._connect() as con:
+            con.execute("CREATE TEMP TABLE wanted (gene_id INTEGER)")
+            con.executemany("INSERT INTO wanted VALUES (?)", ((x,) for x in gene_ids))
+            rows = con.execute(
+                "SELECT gene_id, document FROM gene_summary JOIN wanted USING(gene_id)"
+            ).fetchall()
+        return {gene_id: json.loads(document) for gene_id, document in rows}
+
+    def _esummary(self, gene_ids: list[int]) -> dict[int, dict]:
+        params = {"db": "gene", "id": ",".join(map(str, gene_ids)), "retmode": "json"}
+        if self.email is not None:
+            params["email"] = self.email
+        if self.api_key is not None:
+            params["api_key"] = self.api_key
+
+        for attempt in range(self.max_retries):
+            self.bucket.acquire()
+            # POST, so long id lists do not exceed url length limits
+            response = self.session.post(
+                f"{self.base_url}/esummary.fcgi", data=params, timeout=60
+            )
+            if response.status_code != 429 and response.status_code < 500:
+                break
+            time.sleep(2**attempt)
+        response.raise_for_status()
+
+        result = response.json()["result"]
+        return {
+            int(uid): result[uid]
+            for uid in result.get("uids", [])
+            if "error" not in result[uid]
+        }
+
+    def get(self, gene_ids: Iterable[int]) -> dict[int, dict]:
+        """
+        Return the esummary documents of some genes.
+
+        Parameters
+        ----------
+        gene_ids : collection of int
+            NCBI Gene IDs.
+
+        Returns
+        -------
+        dict
+            Maps each gene id to its document. Ids unknown to NCBI are left
+            out and requested again next time.
+
+        """
+        gene_ids = list(dict.fromkeys(int(x) for x in gene_ids))
+        documents = self.cached(gene_ids)
+        missing = [x for x in gene_ids if x not in documents]
+        for i in range(0, len(missing), self.batch_size):
+            fetched = self._esummary(missing[i : i + self.batch_size])
+            with self._connect() as con:
+                con.executemany(
+                    "INSERT OR REPLACE INTO gene_summary VALUES (?, ?, ?)",
+                    (
+                        (gene_id, json.dumps(document), time.time())
+                        for gene_id, document in fetched.items()
+                    ),
+                )
+            documents.update(fetched)
+        return {x: documents[x] for x in gene_ids if x in documents}
+
+
+def fetch_gene_summaries(
+    gene_ids: Iterable[int], fields: tuple[str] = FIELDS, **kwargs
+) -> pl.DataFrame:
+    """
+    Table of gene summaries using the default cache.
+
+    Parameters
+    ----------
+    gene_ids : collection of int
+        NCBI Gene IDs.
+    fields : tuple of str
+        Esummary fields to keep, as named by `Bio.Entrez` (the JSON keys are
+        the same in lower case).
+    **kwargs
+        Passed on to `GeneSummaryCache`.
+
+    Returns
+    -------
+    polars.DataFrame
+        One row per gene found, with NCBI_Gene_ID and the requested fields.
+
+    """
+    documents = GeneSummaryCache(**kwargs).get(gene_ids)
+    return pl.DataFrame(
+        [
+            {
+                "NCBI_Gene_ID": gene_id,
+                **{field: document.get(field.lower()) for field in fields},
+            }
+            for gene_id, document in documents.items()
+        ],
+        schema={"NCBI_Gene_ID": pl.Int64, **dict.fromkeys(fields, pl.String)},
+    )
+
+
+def gene_summaries(
+    genes: Iterable[str], fields: tuple[str] = FIELDS, **kwargs
+) -> pl.DataFrame:
+    """
+    Gene summaries of gene symbols, translated with the babel table.
+
+    See `fetch_gene_summaries`; the output gains a standard_key column.
+    """
+    ids = (
+        get_translation(("NCBI_Gene_ID",), "standard_key")
+        .filter(pl.col("standard_key").is_in(list(genes)))
+        .with_columns(pl.col("NCBI_Gene_ID").cast(pl.Int64, strict=False))
+        .drop_nulls("NCBI_Gene_ID")
+    )
+    return ids.join(
+        fetch_gene_summaries(ids.get_column("NCBI_Gene_ID"), fields, **kwargs),
+        on="NCBI_Gene_ID",
+    )
@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+"""
+Top-k neighbour index of the perturbation similarity matrices.
+
+The full cosine distance matrices published on Zenodo
+("{crispr,orf}_cosinesim_full.parquet") hold one row and one column per
+perturbation, so finding the perturbations closest to one of them means
+scanning the whole matrix. Most questions only need the closest and the most
+distant perturbations, so this module reads the matrix once, in batches of
+rows, and keeps the k smallest and k largest distances of every row.
+
+The index is a parquet file sorted by perturbation with small row groups,
+stored in the local cache, so a lookup reads a few kilobytes. Once an index
+exists lookups do not contact Zenodo; pass `refresh=True` to follow a new
+version of the record.
+
+Use cases:
+# Most similar and most anticorrelated genes to RAB30
+nearest_neighbours(["RAB30"], "crispr_cosinesim_full.parquet")
+# Index with more neighbours per perturbation
+get_neighbour_index("orf_cosinesim_full.parquet", k=200)
+# Rebuild the index if the record has a new version
+get_neighbour_index("orf_cosinesim_full.parquet", refresh=True)
+"""
+
+import os
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+import requests
+
+from jump_deps.annotate import get_babel_table, get_translation
+from jump_deps.cache import LRUDirectory, download
+from jump_deps.manifest import get_cache_dir
+from jump_deps.matrix import feature_matrix, split_columns
+from jump_deps.remote import open_parquet, read_footer
+
+ZENODO_RECORD = "15029005"
+KINDS = ("similar", "anticorrelated")
+
+
+def zenodo_url(filename: str, record: str = ZENODO_RECORD) -> tuple[str, str]:
+    """
+    Resolve the url of a file in the latest version of a Zenodo record.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the file in the record (e.g., "crispr_cosinesim_full.parquet").
+    record : str
+        Any version of the Zenodo record.
+
+    Returns
+    -------
+    str
+        Url of the file content.
+    str
+        Id of the latest version, which identifies its contents.
+
+    """
+    latest_id = requests.get(
+        f"https://zenodo.org/api/records/{record}/versions/latest", timeout=30
+    ).json()["id"]
+    return (
+        f"https://zenodo.org/api/records/{latest_id}/files/{filename}/content",
+        str(latest_id),
+    )
+
+
+def top_k(distances: np.ndarray, k: int, offset: int = 0) -> tuple[np.ndarray, ...]:
+    """
+    Columns with the k smallest and k largest distances of every row.
+
+    Parameters
+    ----------
+    distances : numpy.ndarray
+        (n_rows, n_columns) block of a square distance matrix.
+    k : int
+        Number of neighbours of each kind.
+    offset : int
+        Position of the first row of the block in the full matrix. The
+        diagonal (each perturbation to itself) is ignored, as are NaNs.
+
+    Returns
+    -------
+    numpy.ndarray
+        (n_rows, k) columns of the smallest distances, closest first.
+    numpy.ndarray
+        (n_rows, k) columns of the largest distances, farthest first.
+
+    """
+    n_rows, n_cols = distances.shape
+    k = min(k, n_cols - 1)
+    rows = np.arange(n_rows)
+    diagonal = rows + offset
+    on_matrix = diagonal < n_cols
+
+    result = []
+    for sign in (1, -1):
+        # Negating turns the largest distances into the smallest ones
+        values = sign * distances
+        values[np.isnan(values)] = np.inf
+        values[rows[on_matrix], diagonal[on_matrix]] = np.inf
+        part = np.argpartition(values, k - 1, axis=1)[:, :k]
+        order = np.argsort(np.take_along_axis(values, part, axis=1), axis=1)
+        result.append(np.take_along_axis(part, order, axis=1))
+    return tuple(result)
+
+
+def build_neighbour_index(
+    path: str | Path, k: int = 50, batch_size: int = 512
+) -> pl.DataFrame:
+    """
+    Extract the nearest and farthest neighbours from a square distance matrix.
+
+    Parameters
+    ----------
+    path : str or Path
+        Local path or url of the matrix. Its numeric columns are perturbations
+        and its rows follow the same order. A remote matrix is fetched with
+        a few concurrent range requests and held in memory while it is read;
+        `get_neighbour_index` downloads it to the cache instead.
+    k : int
+        Number of neighbours of each kind per perturbation.
+    batch_size : int
+        Rows held in memory at a time.
+
+    Returns
+    -------
+    polars.DataFrame
+        Columns query, kind ("similar" or "anticorrelated"), rank (from 1),
+        neighbour and distance, sorted by query, kind and rank.
+
+    """
+    metadata, _ = read_footer(path)
+    schema = pl.from_arrow(metadata.schema.to_arrow_schema().empty_table())
+    columns = split_columns(schema)[1]
+    pf = open_parquet(path, columns=columns)
+    labels = np.array(columns)
+
+    parts, offset = [], 0
+    for batch in pf.iter_batches(batch_size=batch_size, columns=columns):
+        distances = feature_matrix(pl.from_arrow(batch), columns)
+        n = len(distances)
+        rows = np.arange(n)[:, None]
+        for kind, neighbours in zip(KINDS, top_k(distances, k, offset)):
+            n_neighbours = neighbours.shape[1]
+            parts.append(
+                pl.DataFrame({
+                    "query": np.repeat(labels[offset : offset + n], n_neighbours),
+                    "kind": kind,
+                    "rank": np.tile(np.arange(1, n_neighbours + 1, dtype=np.int16), n),
+                    "neighbour": labels[neighbours].ravel(),
+                    "distance": distances[rows, neighbours].ravel(),
+                })
+            )
+        offset += n
+
+    return pl.concat(parts).sort("query", "kind", "rank")
+
+
+def get_neighbour_index(
+    filename: str = "crispr_cosinesim_full.parquet",
+    k: int = 50,
+    record: str = ZENODO_RECORD,
+    cache_dir: str | Path | None = None,
+    refresh: bool = False,
+) -> Path:
+    """
+    Path of the neighbour index of a Zenodo matrix, building it on first use.
+
+    The most recently built index of the matrix is used without contacting
+    Zenodo. The latest version of the record is only resolved when there is
+    no index yet or when `refresh` is set.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the distance matrix in the Zenodo record.
+    k : int
+        Number of neighbours of each kind per perturbation.
+    record : str
+        Any version of the Zenodo record; the index follows the latest one.
+    cache_dir : str, Path or None
+        Root of the local cache, see `jump_deps.manifest.get_cache_dir`.
+    refresh : bool
+        Resolve the latest version of the record and build its index if it
+        is not in the cache yet.
+
+    Returns
+    -------
+    Path
+        Parquet file with the columns described in `build_neighbour_index`.
+
+    """
+    cache_dir = get_cache_dir(cache_dir)
+    index_dir = cache_dir / "indices"
+    index_dir.mkdir(exist_ok=True)
+    stem = Path(filename).stem
+    built = sorted(
+        index_dir.glob(f"{stem}-*-k{k}.neighbours.parquet"),
+        key=lambda p: p.stat().st_mtime,
+    )
+    if built and not refresh:
+        return built[-1]
+
+    url, version = zenodo_url(filename, record)
+    path = index_dir / f"{stem}-{version}-k{k}.neighbours.parquet"
+    if path.exists():
+        # Mark it as the most recent index of the matrix
+        os.utime(path)
+        return path
+
+    # The matrix is read in full, so one download beats many range requests;
+    # it is kept to build indices with other values of k
+    matrices = LRUDirectory(cache_dir / "matrices")
+    index = build_neighbour_index(
+        download(url, matrices, f"{stem}-{version}.parquet"), k
+    )
+    tmp = path.with_suffix(".partial")
+    # Row groups of a few queries, so lookups skip the rest via statistics
+    index.write_parquet(tmp, row_group_size=2 * k * 16)
+    tmp.replace(path)
+    return path
+
+
+def nearest_neighbours(
+    items: list[str],
+    filename: str = "crispr_cosinesim_full.parquet",
+    n: int = 10,
+    kinds: tuple[str] = KINDS,
+    k: int = 50,
+    cache_dir: str | Path | None = None,
+    plate_type: str | None = None,
+) -> pl.DataFrame:
+    """
+    Closest and farthest perturbations of genes or compounds.
+
+    Parameters
+    ----------
+    items : list of str
+        Gene symbols or compound names (babel standard keys), or JCP2022 ids.
+    filename : str
+        Name of the distance matrix in the Zenodo record.
+    n : int
+        Neighbours of each kind to return, at most `k`.
+    kinds : tuple of str
+        Any of "similar" and "anticorrelated".
+    k : int
+        Neighbours per perturbation stored in the index, see
+        `get_neighbour_index`.
+    cache_dir : str, Path or None
+        Root of the local cache, see `jump_deps.manifest.get_cache_dir`.
+    plate_type : str or None
+        Babel plate type of the perturbations in the matrix, used to resolve
+        names. If None it is the prefix of `filename` (e.g., "crispr").
+
+    Returns
+    -------
+    polars.DataFrame
+        Columns query, kind, rank, neighbour and distance, plus the babel
+        names of the query and the neighbour (query_name, neighbour_name).
+        A name with several perturbations in the matrix (e.g., different
+        guides or compound batches) gets the neighbours of all of them.
+
+    Raises
+    ------
+    ValueError
+        If `n` is larger than `k`.
+
+    """
+    if n > k:
+        raise ValueError(f"Only {k} neighbours are stored, requested {n}")
+    if plate_type is None:
+        plate_type = Path(filename).name.split("_", 1)[0]
+    jcp_ids = get_babel_table().filter(
+        pl.col("standard_key").is_in(items) & (pl.col("plate_type") == plate_type)
+    )
+    queries = [x for x in items if x.startswith("JCP2022_")]
+    queries += jcp_ids.get_column("JCP2022").drop_nulls().unique().to_list()
+
+    path = get_neighbour_index(filename, k, cache_dir=cache_dir)
+    neighbours = (
+        pl
+        .scan_parquet(path)
+        .filter(
+            pl.col("query").is_in(queries)
+            & pl.col("kind").is_in(kinds)
+            & (pl.col("rank") <= n)
+        )
+        .collect()
+    )
+    names = get_translation(("standard_key",))
+    for column in ("query", "neighbour"):
+        neighbours = neighbours.join(
+            names.rename({"JCP2022": column, "standard_key": f"{column}_name"}),
+            on=column,
+            how="left",
+        )
+    return neighbours
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Process pools for the jobs that jump_deps splits into independent chunks.
+
+Workers are always spawned rather than forked: polars' thread pool is not
+fork-safe, so a forked worker can deadlock as soon as it touches a frame.
+Jobs are submitted a few at a time, so that the inputs of the jobs waiting
+for a worker do not pile up in memory, and their results are returned as
+they finish.
+
+Use cases:
+# A fresh process for one call
+with spawn_pool(1) as executor:
+    executor.submit(run_stage, name, path, repeat).result()
+# Many jobs, handling each result as soon as it is ready
+for part, result in map_unordered(score_group, jobs, max_workers=4):
+    result.write_parquet(part)
+"""
+
+import multiprocessing
+from collections.abc import Callable, Hashable, Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+
+
+def spawn_pool(max_workers: int) -> ProcessPoolExecutor:
+    """Process pool whose workers are spawned, see the module docstring."""
+    return ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+def map_unordered(
+    function: Callable,
+    jobs: Iterable[tuple[Hashable, tuple]],
+    max_workers: int = 4,
+) -> Iterator[tuple[Hashable, object]]:
+    """
+    Call a function on the arguments of many jobs in a spawned pool.
+
+    Parameters
+    ----------
+    function : callable
+        Module-level function, so that workers can import it.
+    jobs : iterable of tuple
+        (key, arguments) pairs. The key identifies the job in the results and
+        is not sent to the workers.
+    max_workers : int
+        Number of processes. At most twice as many jobs are submitted at once.
+
+    Yields
+    ------
+    tuple
+        (key, result) pairs, in the order in which the jobs finish. Errors
+        raised by a job are raised here.
+
+    """
+    jobs = iter(jobs)
+    with spawn_pool(max_workers) as executor:
+        running = {
+            executor.submit(function, *args): key
+            for key, args in islice(jobs, 2 * max_workers)
+        }
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = running.pop(future)
+                for next_key, args in islice(jobs, 1):
+                    running[executor.submit(function, *args)] = next_key
+                yield key, future.result()
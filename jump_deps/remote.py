@@ -0,0 +1,468 @@
+#!/usr/bin/env python
+"""
+Byte-range access to remote parquet files.
+
+Parquet files store their metadata at the end of the file, so a single suffix
+range request that is large enough to contain the footer is all that is
+needed to know the schema, the number of rows and the row-group layout.
+
+With the footer in hand, the byte span of every column chunk is known before
+reading any data. Selective reads of wide files (hundreds of columns) are
+therefore planned upfront: the spans of the requested chunks are merged when
+they are close to each other, split into pieces of bounded size and fetched
+concurrently over a pool of keep-alive connections, so that they are limited
+by bandwidth rather than by the latency of one request per column chunk.
+
+Use cases:
+# Three columns of a remote file
+read_parquet(url, columns=["JCP2022_800001", "JCP2022_800002", "JCP2022_800003"])
+# Two row groups of a profile file
+open_parquet(url, row_groups=[0, 5]).read_row_groups([0, 5])
+"""
+
+import io
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import polars as pl
+import pyarrow.parquet as pq
+import requests
+from requests.adapters import HTTPAdapter
+
+from jump_deps.io_trace import record_request
+
+FOOTER_PREFETCH = 1 << 20  # 1 MiB covers the footer of all JUMP profiles
+MAX_GAP = 1 << 20  # Ranges closer than this are fetched as one
+MAX_REQUEST = 16 << 20  # Larger spans are split to be fetched concurrently
+MAX_CONNECTIONS = 8
+
+
+def is_remote(path: str | Path) -> bool:
+    """Whether a path is an http(s) url rather than a local file."""
+    return str(path).startswith(("http://", "https://"))
+
+
+def get_session(max_connections: int = MAX_CONNECTIONS) -> requests.Session:
+    """Session that keeps up to `max_connections` connections alive per host."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=max_connections)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def fetch_range(
+    url: str,
+    start: int,
+    end: int | None = None,
+    session: requests.Session | None = None,
+) -> tuple[bytes, int]:
+    """
+    Fetch a byte range of a remote file.
+
+    Parameters
+    ----------
+    url : str
+        Location of the file.
+    start : int
+        First byte to fetch. Negative values request the last -start bytes.
+    end : int or None
+        Last byte to fetch (inclusive). Ignored for suffix requests.
+    session : requests.Session or None
+        Session to reuse connections with.
+
+    Returns
+    -------
+    bytes
+        Content of the range.
+    int
+        Total size of the file.
+
+    """
+    if start < 0:
+        byte_range = f"bytes={start}"
+    else:
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+    started = time.perf_counter()
+    response = (session or requests).get(url, headers={"Range": byte_range}, timeout=60)
+    response.raise_for_status()
+    content = response.content
+    if response.status_code == 206:
+        total = int(response.headers["Content-Range"].rsplit("/", 1)[1])
+    else:
+        total = len(content)
+    record_request(url, len(content), time.perf_counter() - started, total)
+    if response.status_code == 206:
+        return content, total
+
+    # The server ignored the range and sent the whole file
+    if start < 0:
+        return content[start:], total
+    return content[start : None if end is None else end + 1], total
+
+
+def read_footer(
+    path: str | Path,
+    prefetch: int = FOOTER_PREFETCH,
+    session: requests.Session | None = None,
+) -> tuple[pq.FileMetaData, int]:
+    """
+    Read the metadata of a parquet file without reading its data.
+
+    Parameters
+    ----------
+    path : str or Path
+        Local path or url of the parquet file.
+    prefetch : int
+        Number of trailing bytes requested speculatively. If the footer is
+        larger a second request fetches the remainder.
+    session : requests.Session or None
+        Session to reuse connections with.
+
+    Returns
+    -------
+    pyarrow.parquet.FileMetaData
+        Parsed metadata.
+    int
+        Size of the file in bytes.
+
+    """
+    if not is_remote(path):
+        return pq.read_metadata(path), Path(path).stat().st_size
+
+    tail, total = fetch_range(str(path), -prefetch, session=session)
+    if tail[-4:] != b"PAR1":
+        raise ValueError(f"{path} is not a parquet file")
+    footer_len = struct.unpack("<I", tail[-8:-4])[0]
+    missing = footer_len + 8 - len(tail)
+    if missing > 0:
+        head, _ = fetch_range(
+            str(path), total - len(tail) - missing, total - len(tail) - 1, session
+        )
+        tail = head + tail
+
+    return pq.read_metadata(io.BytesIO(tail[-(footer_len + 8) :])), total
+
+
+def coalesce_ranges(
+    ranges: list[tuple[int, int]], max_gap: int = MAX_GAP
+) -> list[tuple[int, int]]:
+    """
+    Merge byte ranges that overlap or are less than `max_gap` bytes apart.
+
+    Parameters
+    ----------
+    ranges : list of tuple of int
+        (start, end) pairs, end exclusive, in any order.
+    max_gap : int
+        Largest number of unrequested bytes fetched to save a request.
+
+    Returns
+    -------
+    list of tuple of int
+        Sorted, disjoint (start, end) pairs covering every input range.
+
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start - merged[-1][1] <= max_gap:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def fetch_ranges(
+    url: str,
+    ranges: list[tuple[int, int]],
+    session: requests.Session | None = None,
+    max_gap: int = MAX_GAP,
+    max_request: int = MAX_REQUEST,
+    max_connections: int = MAX_CONNECTIONS,
+) -> dict[int, bytes]:
+    """
+    Fetch many byte ranges of a remote file concurrently.
+
+    Parameters
+    ----------
+    url : str
+        Location of the file.
+    ranges : list of tuple of int
+        (start, end) pairs, end exclusive.
+    session : requests.Session or None
+        Session to share connections with. If None a pooled one is created.
+    max_gap : int
+        Ranges closer than this are merged, see `coalesce_ranges`.
+    max_request : int
+        Largest number of bytes requested at once.
+    max_connections : int
+        Requests in flight.
+
+    Returns
+    -------
+    dict
+        Maps the start of each merged range to its content.
+
+    """
+    spans = coalesce_ranges(ranges, max_gap)
+    # (start of the merged span, first byte, last byte) of each request
+    pieces = [
+        (start, offset, min(offset + max_request, end) - 1)
+        for start, end in spans
+        for offset in range(start, end, max_request)
+    ]
+    session = session or get_session(max_connections)
+    with ThreadPoolExecutor(max_workers=max_connections) as executor:
+        contents = executor.map(
+            lambda piece: fetch_range(url, piece[1], piece[2], session)[0], pieces
+        )
+        blocks: dict[int, list[bytes]] = {}
+        for (start, _, _), content in zip(pieces, contents):
+            blocks.setdefault(start, []).append(content)
+    return {start: b"".join(parts) for start, parts in blocks.items()}
+
+
+class RangeFile(io.RawIOBase):
+    """
+    Read-only, seekable file object over a remote file.
+
+    Every read is served by an HTTP range request, unless it falls inside a
+    block fetched beforehand (and concurrently) with `prefetch`. Wrapping it in
+    `pyarrow.parquet.ParquetFile` therefore reads only the footer and the
+    column chunks that are requested.
+
+    Parameters
+    ----------
+    url : str
+        Location of the file.
+    size : int or None
+        Size of the file in bytes. If None it is obtained from the server.
+    session : requests.Session or None
+        Session to reuse connections with. If None a pooled one is created.
+
+    """
+
+    def __init__(
+        self,
+        url: str,
+        size: int | None = None,
+        session: requests.Session | None = None,
+    ):
+        self.url = url
+        self.session = session or get_session()
+        if size is None:
+            _, size = fetch_range(url, 0, 0, self.session)
+        self.size = size
+        self.position = 0
+        self.blocks: dict[int, bytes] = {}
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        else:
+            self.position = self.size + offset
+        return self.position
+
+    def prefetch(self, ranges: list[tuple[int, int]], **kwargs) -> None:
+        """
+        Fetch byte ranges ahead of the reads that will need them.
+
+        Parameters
+        ----------
+        ranges : list of tuple of int
+            (start, end) pairs, end exclusive.
+        **kwargs
+            Passed on to `fetch_ranges`.
+
+        """
+        self.blocks.update(fetch_ranges(self.url, ranges, self.session, **kwargs))
+
+    def readinto(self, buffer) -> int:
+        n = min(len(buffer), self.size - self.position)
+        if n <= 0:
+            return 0
+        start, end = self.position, self.position + n
+        # Parts of the read are served from the prefetched blocks and only
+        # the bytes between them are requested
+        parts = []
+        while start < end:
+            for block_start, block in self.blocks.items():
+                if block_start <= start < block_start + len(block):
+                    stop = min(end, block_start + len(block))
+                    parts.append(block[start - block_start : stop - block_start])
+                    break
+            else:
+                stop = min([x for x in self.blocks if start < x < end], default=end)
+                data, _ = fetch_range(self.url, start, stop - 1, self.session)
+                parts.append(data)
+            start = stop
+        data = b"".join(parts)
+        buffer[: len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+def open_parquet(
+    path: str | Path,
+    session: requests.Session | None = None,
+    prefetch: list[tuple[int, int]] | None = None,
+    row_groups: list[int] | None = None,
+    columns: list[str] | None = None,
+) -> pq.ParquetFile:
+    """
+    Open a local or remote parquet file reading only its footer.
+
+    When `row_groups` or `columns` are given for a remote file, the column
+    chunks that reading them requires are fetched upfront with
+    `fetch_ranges`, together with the metadata columns of those row groups,
+    which are small and needed by almost every query.
+
+    Parameters
+    ----------
+    path : str or Path
+        Local path or url of the parquet file.
+    session : requests.Session or None
+        Session to reuse connections with.
+    prefetch : list of tuple of int or None
+        Additional byte ranges (start, end exclusive) of a remote file to
+        fetch upfront.
+    row_groups : list of int or None
+        Row groups that will be read. If None, and `columns` is given, all of
+        them.
+    columns : list of str or None
+        Columns that will be read. If None, and `row_groups` is given, all of
+        them.
+
+    Returns
+    -------
+    pyarrow.parquet.ParquetFile
+        File whose row groups and columns can be read selectively.
+
+    """
+    if not is_remote(path):
+        return pq.ParquetFile(path)
+    metadata, size = read_footer(path, session=session)
+    source = RangeFile(str(path), size=size, session=session)
+    ranges = list(prefetch or [])
+    if row_groups is not None or columns is not None:
+        names = metadata.schema.to_arrow_schema().names
+        if columns is not None:
+            columns = {*columns, *(x for x in names if x.startswith("Metadata"))}
+        ranges += column_chunk_ranges(metadata, row_groups, columns)
+    if ranges:
+        source.prefetch(ranges)
+    return pq.ParquetFile(source, metadata=metadata)
+
+
+def read_parquet(
+    path: str | Path,
+    columns: list[str],
+    row_groups: list[int] | None = None,
+    session: requests.Session | None = None,
+) -> pl.DataFrame:
+    """
+    Read some columns of a local or remote parquet file.
+
+    A remote file is read with a handful of concurrent, coalesced range
+    requests (see `open_parquet`) instead of one request per column chunk.
+
+    Parameters
+    ----------
+    path : str or Path
+        Local path or url of the parquet file.
+    columns : list of str
+        Columns to read.
+    row_groups : list of int or None
+        Row groups to read. If None all row groups are read.
+    session : requests.Session or None
+        Session to reuse connections with.
+
+    Returns
+    -------
+    polars.DataFrame
+        Requested columns, in the requested order.
+
+    """
+    pf = open_parquet(path, session=session, row_groups=row_groups, columns=columns)
+    if row_groups is None:
+        row_groups = range(pf.metadata.num_row_groups)
+    return pl.from_arrow(pf.read_row_groups(list(row_groups), columns=columns))
+
+
+def column_chunk_ranges(
+    metadata: pq.FileMetaData,
+    row_groups: list[int] | None = None,
+    columns=None,
+) -> list[tuple[int, int]]:
+    """
+    Byte span of every column chunk of some row groups.
+
+    Parameters
+    ----------
+    metadata : pyarrow.parquet.FileMetaData
+        Metadata of the file.
+    row_groups : list of int or None
+        Indices of the row groups. If None all of them are included.
+    columns : collection of str or None
+        Restrict the spans to these columns. If None all columns are included.
+
+    Returns
+    -------
+    list of tuple of int
+        (start, end) pairs with end exclusive.
+
+    """
+    if row_groups is None:
+        row_groups = range(metadata.num_row_groups)
+    if columns is not None:
+        columns = set(columns)
+    ranges = []
+    for i in row_groups:
+        rg = metadata.row_group(i)
+        for j in range(rg.num_columns):
+            chunk = rg.column(j)
+            if columns is not None and chunk.path_in_schema not in columns:
+                continue
+            start = (
+                chunk.dictionary_page_offset
+                if chunk.has_dictionary_page
+                else chunk.data_page_offset
+            )
+            ranges.append((start, start + chunk.total_compressed_size))
+    return ranges
+
+
+def column_chunk_range(metadata: pq.FileMetaData, row_group: int, columns=None):
+    """
+    Byte span of the column chunks of one row group.
+
+    Parameters
+    ----------
+    metadata : pyarrow.parquet.FileMetaData
+        Metadata of the file.
+    row_group : int
+        Index of the row group.
+    columns : collection of str or None
+        Restrict the span to these columns. If None all columns are included.
+
+    Returns
+    -------
+    tuple of int
+        (start, end) with end exclusive.
+
+    """
+    ranges = column_chunk_ranges(metadata, [row_group], columns)
+    return min(start for start, _ in ranges), max(end for _, end in ranges)
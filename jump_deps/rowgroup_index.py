@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+"""
+Sidecar index from perturbations and plates to the row groups holding them.
+
+Profiles are not sorted by perturbation, so the min/max statistics stored in
+parquet cannot rule out any row group when filtering by JCP2022 id. This
+index records which row groups contain each Metadata_JCP2022 and
+Metadata_Plate value, so that selective loads fetch only those row groups.
+
+The index is built once per subset and ETag and stored next to the profile
+cache.
+
+Use cases:
+# All profiles of one gene plus the negative control
+read_perturbations("crispr", jcp_ids=("JCP2022_805264", "JCP2022_800002"))
+# All profiles in a set of plates
+read_perturbations("crispr", plates=("CP-CC9-R1-04",))
+"""
+
+import json
+import os
+from collections.abc import Iterable
+from pathlib import Path
+
+import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from jump_deps.cache import ProfileCache, index_path
+from jump_deps.manifest import get_entry, get_manifest
+from jump_deps.remote import column_chunk_range, open_parquet
+
+INDEX_COLUMNS = ("Metadata_JCP2022", "Metadata_Plate")
+
+
+class RowGroupIndex:
+    """
+    Mapping from metadata values to the row groups of a parquet file.
+
+    Parameters
+    ----------
+    keys : polars.DataFrame
+        Table with columns "column", "value" and "row_group".
+    row_groups : polars.DataFrame
+        Table with columns "row_group", "num_rows", "start" and "end" (the
+        byte span of each row group, end exclusive).
+
+    """
+
+    def __init__(self, keys: pl.DataFrame, row_groups: pl.DataFrame):
+        self.keys = keys
+        self.row_groups = row_groups
+
+    @classmethod
+    def build(
+        cls, path: str | Path, columns: tuple[str] = INDEX_COLUMNS
+    ) -> "RowGroupIndex":
+        """
+        Index a local or remote parquet file reading only the indexed columns.
+
+        Parameters
+        ----------
+        path : str or Path
+            Local path or url of the parquet file.
+        columns : tuple of str
+            Columns whose values are indexed.
+
+        Returns
+        -------
+        RowGroupIndex
+            Index of the file.
+
+        """
+        # The indexed columns of every row group are fetched in a few requests
+        pf = open_parquet(path, columns=list(columns))
+        metadata = pf.metadata
+        keys, row_groups = [], []
+        for i in range(metadata.num_row_groups):
+            values = pl.from_arrow(pf.read_row_group(i, columns=list(columns)))
+            for column in columns:
+                keys.append(
+                    values.select(
+                        pl.lit(column).alias("column"),
+                        pl.col(column).unique().cast(pl.String).alias("value"),
+                        pl.lit(i, dtype=pl.Int32).alias("row_group"),
+                    )
+                )
+            start, end = column_chunk_range(metadata, i)
+            row_groups.append({
+                "row_group": i,
+                "num_rows": metadata.row_group(i).num_rows,
+                "start": start,
+                "end": end,
+            })
+
+        return cls(
+            pl.concat(keys).sort("column", "value", "row_group"),
+            pl.DataFrame(row_groups, schema_overrides={"row_group": pl.Int32}),
+        )
+
+    def save(self, path: str | Path) -> None:
+        """
+        Store the index as a single parquet file.
+
+        The file is written under a temporary name and renamed, so a crash or
+        a concurrent build never leaves a truncated index at `path`.
+        """
+        path = Path(path)
+        table = self.keys.to_arrow()
+        table = table.replace_schema_metadata({
+            "row_groups": json.dumps(self.row_groups.to_dicts())
+        })
+        tmp = path.with_name(f".partial-{os.getpid()}-{path.name}")
+        try:
+            pq.write_table(table, tmp)
+            tmp.replace(path)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "RowGroupIndex":
+        """Load an index stored with `save`."""
+        table = pq.read_table(path)
+        row_groups = json.loads(table.schema.metadata[b"row_groups"])
+        return cls(
+            pl.from_arrow(table.replace_schema_metadata(None)),
+            pl.DataFrame(row_groups, schema_overrides={"row_group": pl.Int32}),
+        )
+
+    def values(self, column: str = "Metadata_JCP2022") -> pl.Series:
+        """All distinct values of an indexed column."""
+        return (
+            self.keys
+            .filter(pl.col("column") == column)
+            .get_column("value")
+            .unique()
+            .sort()
+        )
+
+    def lookup(
+        self,
+        jcp_ids: Iterable[str] | None = None,
+        plates: Iterable[str] | None = None,
+    ) -> list[int]:
+        """
+        Row groups that contain any of the requested perturbations or plates.
+
+        Parameters
+        ----------
+        jcp_ids : collection of str or None
+            Values of Metadata_JCP2022.
+        plates : collection of str or None
+            Values of Metadata_Plate.
+
+        Returns
+        -------
+        list of int
+            Sorted row-group indices.
+
+        """
+        found = set()
+        for column, values in zip(INDEX_COLUMNS, (jcp_ids, plates)):
+            if values is None:
+                continue
+            found.update(
+                self.keys
+                .filter(
+                    (pl.col("column") == column) & pl.col("value").is_in(list(values))
+                )
+                .get_column("row_group")
+                .to_list()
+            )
+        return sorted(found)
+
+    def byte_ranges(self, row_groups: Iterable[int]) -> list[tuple[int, int]]:
+        """Byte spans (start, end exclusive) of the given row groups."""
+        return (
+            self.row_groups
+            .filter(pl.col("row_group").is_in(list(row_groups)))
+            .select("start", "end")
+            .rows()
+        )
+
+
+def get_rowgroup_index(
+    subset: str,
+    manifest: list[dict[str, str]] | None = None,
+    cache_dir: str | Path | None = None,
+) -> RowGroupIndex:
+    """
+    Load the row-group index of a subset, building it on first use.
+
+    Parameters
+    ----------
+    subset : str
+        Name of the subset in the manifest.
+    manifest : list of dict or None
+        Manifest to resolve subsets with. If None the default one is loaded.
+    cache_dir : str, Path or None
+        Root of the local cache, see `jump_deps.manifest.get_cache_dir`.
+
+    Returns
+    -------
+    RowGroupIndex
+        Index of the subset in its current version.
+
+    """
+    if manifest is None:
+        manifest = get_manifest(cache_dir=cache_dir)
+    entry = get_entry(subset, manifest)
+    path = index_path(entry, "rowgroups", cache_dir)
+    if path.exists():
+        return RowGroupIndex.load(path)
+
+    local = ProfileCache(cache_dir=cache_dir, manifest=manifest).local(subset)
+    index = RowGroupIndex.build(local or entry["url"])
+    index.save(path)
+    return index
+
+
+def read_perturbations(
+    subset: str,
+    jcp_ids: Iterable[str] | None = None,
+    plates: Iterable[str] | None = None,
+    columns: list[str] | None = None,
+    manifest: list[dict[str, str]] | None = None,
+    cache_dir: str | Path | None = None,
+) -> pl.DataFrame:
+    """
+    Load the profiles of some perturbations and/or plates.
+
+    Only the row groups that contain them are read: from the local copy if
+    the subset has been cached, otherwise by fetching the byte ranges of
+    their column chunks.
+
+    Parameters
+    ----------
+    subset : str
+        Name of the subset in the manifest.
+    jcp_ids : collection of str or None
+        Perturbations (Metadata_JCP2022) to load.
+    plates : collection of str or None
+        Plates (Metadata_Plate) to load.
+    columns : list of str or None
+        Columns to read. If None all columns are read.
+    manifest : list of dict or None
+        Manifest to resolve subsets with. If None the default one is loaded.
+    cache_dir : str, Path or None
+        Root of the local cache, see `jump_deps.manifest.get_cache_dir`.
+
+    Returns
+    -------
+    polars.DataFrame
+        Rows that match any of the requested perturbations or plates.
+
+    Raises
+    ------
+    ValueError
+        If neither perturbations nor plates are requested.
+
+    """
+    if jcp_ids is None and plates is None:
+        raise ValueError("At least one of jcp_ids or plates must be provided")
+    # Both are used twice, so one-shot iterables are materialised first
+    jcp_ids = None if jcp_ids is None else list(jcp_ids)
+    plates = None if plates is None else list(plates)
+    if manifest is None:
+        manifest = get_manifest(cache_dir=cache_dir)
+    index = get_rowgroup_index(subset, manifest, cache_dir)
+    row_groups = index.lookup(jcp_ids, plates)
+
+    if columns is not None:
+        columns = list(dict.fromkeys([*INDEX_COLUMNS, *columns]))
+
+    local = ProfileCache(cache_dir=cache_dir, manifest=manifest).local(subset)
+    if local is not None:
+        pf = open_parquet(local)
+    else:
+        # Only the column chunks to be read are fetched, concurrently
+        pf = open_parquet(
+            get_entry(subset, manifest)["url"], row_groups=row_groups, columns=columns
+        )
+    if row_groups:
+        data = pl.from_arrow(pf.read_row_groups(row_groups, columns=columns))
+    else:
+        data = pl.from_arrow(pa.Table.from_batches([], pf.schema_arrow)).select(
+            columns or pl.all()
+        )
+
+    predicate = pl.lit(False)
+    if jcp_ids is not None:
+        predicate |= pl.col("Metadata_JCP2022").is_in(jcp_ids)
+    if plates is not None:
+        predicate |= pl.col("Metadata_Plate").is_in(plates)
+    return data.filter(predicate)
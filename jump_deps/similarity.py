@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+"""
+Cosine similarity matrices computed block by block into memory-mapped files.
+
+Comparing every perturbation against every other one with a single matrix
+product needs the whole N x N result in memory. Here consensus profiles (from
+`jump_deps.consensus`) are normalised once, the product is computed in blocks of rows by a pool of
+threads (NumPy releases the GIL during matrix products) and every block is
+written straight into a memory-mapped .npy file. The labels of the rows and
+columns are stored next to it, so any row, column or submatrix can be read
+later without loading the rest of the matrix.
+
+Use cases:
+# Similarity of all crispr perturbations, stored as float16
+store = build_similarity_store(get_consensus("crispr"), "crispr_sim")
+# Read the similarities between a few perturbations
+SimilarityStore("crispr_sim").submatrix(["JCP2022_805264", "JCP2022_800002"])
+"""
+
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+
+from jump_deps.consensus import ConsensusStore
+from jump_deps.matrix import feature_matrix, split_columns
+
+MATRIX_FILE = "similarity.npy"
+LABELS_FILE = "labels.parquet"
+
+
+def normalise_rows(features: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length in place; NaNs and null rows become zeros."""
+    np.nan_to_num(features, copy=False)
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    np.divide(features, norms, out=features, where=norms > 0)
+    return features
+
+
+class SimilarityStore:
+    """
+    Memory-mapped square similarity matrix with labelled rows and columns.
+
+    Parameters
+    ----------
+    path : str or Path
+        Directory written by `build_similarity_store`.
+
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.matrix = np.load(self.path / MATRIX_FILE, mmap_mode="r")
+        self.labels = pl.read_parquet(self.path / LABELS_FILE)
+        self.label_column = self.labels.columns[0]
+        self.positions = dict(
+            zip(self.labels.get_column(self.label_column), range(self.labels.height))
+        )
+
+    def locate(self, labels: Sequence[str] | None) -> np.ndarray:
+        """Positions of some labels in the matrix, all of them if None."""
+        if labels is None:
+            return np.arange(self.labels.height)
+        missing = [x for x in labels if x not in self.positions]
+        if missing:
+            raise KeyError(f"Labels not found in {self.path}: {missing}")
+        return np.array([self.positions[x] for x in labels])
+
+    def row(self, label: str) -> pl.DataFrame:
+        """Similarity of one perturbation to all the others."""
+        return self.labels.with_columns(
+            similarity=pl.Series(self.matrix[self.positions[label]])
+        )
+
+    def submatrix(
+        self,
+        rows: Sequence[str] | None = None,
+        columns: Sequence[str] | None = None,
+    ) -> pl.DataFrame:
+        """
+        Similarities between two sets of perturbations.
+
+        Parameters
+        ----------
+        rows : sequence of str or None
+            Labels of the rows. If None all rows are read.
+        columns : sequence of str or None
+            Labels of the columns. If None the rows are used.
+
+        Returns
+        -------
+        polars.DataFrame
+            One row per requested row label, in the first column, and one
+            column per requested column label.
+
+        """
+        if columns is None:
+            columns = rows
+        i, j = self.locate(rows), self.locate(columns)
+        values = self.matrix[np.ix_(i, j)]
+        names = self.labels.get_column(self.label_column)
+        return pl.DataFrame(values, schema=names.gather(j).to_list()).insert_column(
+            0, names.gather(i)
+        )
+
+
+def _write_similarity(
+    features: np.ndarray,
+    path: Path,
+    dtype: np.dtype,
+    block_size: int,
+    max_workers: int,
+) -> None:
+    """Write the products of the rows of `features` into a .npy file."""
+    n = len(features)
+    matrix = np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(n, n))
+
+    def compute_block(start: int) -> None:
+        end = min(start + block_size, n)
+        matrix[start:end] = features[start:end] @ features.T
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(compute_block, range(0, n, block_size)))
+    matrix.flush()
+
+
+def build_similarity_store(
+    profiles: ConsensusStore | pl.DataFrame,
+    path: str | Path,
+    label_column: str = "Metadata_JCP2022",
+    statistic: str = "median",
+    dtype: np.dtype = np.float16,
+    block_size: int = 2048,
+    max_workers: int = 4,
+) -> SimilarityStore:
+    """
+    Compute the cosine similarity of all pairs of profiles in blocks.
+
+    Parameters
+    ----------
+    profiles : ConsensusStore or polars.DataFrame
+        Consensus profiles of a subset (see `jump_deps.consensus.get_consensus`),
+        or a frame with one profile per row.
+    path : str or Path
+        Directory where the matrix and its labels are written.
+    label_column : str
+        Column that labels the rows and columns of a frame. The rows of a
+        ConsensusStore are labelled by Metadata_JCP2022.
+    statistic : str
+        Consensus profiles compared when `profiles` is a ConsensusStore,
+        "median" or "mean".
+    dtype : numpy.dtype
+        Data type of the stored matrix (float16 halves its size).
+    block_size : int
+        Rows computed per task; each task holds a block_size x N float32
+        array in memory.
+    max_workers : int
+        Number of threads computing blocks.
+
+    Returns
+    -------
+    SimilarityStore
+        The stored matrix, opened in read-only mode.
+
+    Raises
+    ------
+    ValueError
+        If the labels of a frame are not unique.
+
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    if isinstance(profiles, ConsensusStore):
+        features = np.array(profiles.matrix(statistic))
+        labels = profiles.index
+    else:
+        if not profiles.get_column(label_column).is_unique().all():
+            raise ValueError(f"{label_column} must identify one profile per row")
+        metadata, columns = split_columns(profiles)
+        features = feature_matrix(profiles, columns)
+        labels = profiles.select(list(dict.fromkeys([label_column, *metadata])))
+
+    tmp = path / f".partial-{MATRIX_FILE}"
+    _write_similarity(normalise_rows(features), tmp, dtype, block_size, max_workers)
+    tmp.replace(path / MATRIX_FILE)
+    labels.write_parquet(path / LABELS_FILE)
+    return SimilarityStore(path)
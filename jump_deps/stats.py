@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""
+Dataset statistics obtained from parquet footers alone.
+
+Row counts, column names and byte sizes are all recorded in the footer of a
+parquet file, so summarising the whole manifest requires about one request
+per file instead of a scan of every dataset.
+
+Use cases:
+# Summary of the standard profiles
+dataset_statistics(("crispr", "orf", "compound"))
+# Row-group layout of one file
+row_group_layout(get_entry("crispr")["url"])
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import polars as pl
+import pyarrow.parquet as pq
+import requests
+
+from jump_deps.cache import ProfileCache
+from jump_deps.manifest import get_entry, get_manifest
+from jump_deps.remote import column_chunk_range, read_footer
+
+
+def footer_statistics(
+    path: str | Path, session: requests.Session | None = None
+) -> dict[str, int]:
+    """
+    Summarise a parquet file using its footer.
+
+    Parameters
+    ----------
+    path : str or Path
+        Local path or url of the parquet file.
+    session : requests.Session or None
+        Session to reuse connections with.
+
+    Returns
+    -------
+    dict
+        Exact number of rows and columns, how many of the columns are metadata
+        or features, the file size, the compressed and uncompressed size of the
+        column data and the number and size of the row groups.
+
+    """
+    metadata, file_size = read_footer(path, session=session)
+    return summarise_metadata(metadata, file_size)
+
+
+def summarise_metadata(metadata: pq.FileMetaData, file_size: int) -> dict[str, int]:
+    """Reduce parquet metadata to the values reported by `footer_statistics`."""
+    names = metadata.schema.to_arrow_schema().names
+    n_meta = sum(name.startswith("Metadata") for name in names)
+    row_groups = [metadata.row_group(i) for i in range(metadata.num_row_groups)]
+    compressed = sum(
+        rg.column(j).total_compressed_size
+        for rg in row_groups
+        for j in range(rg.num_columns)
+    )
+    rows_per_group = [rg.num_rows for rg in row_groups] or [0]
+
+    return {
+        "#rows": metadata.num_rows,
+        "#cols": len(names),
+        "#Metadata cols": n_meta,
+        "#Feature cols": len(names) - n_meta,
+        "#row groups": metadata.num_row_groups,
+        "min rows/group": min(rows_per_group),
+        "max rows/group": max(rows_per_group),
+        "File size (MB)": round(file_size / 1e6, 1),
+        "Compressed (MB)": round(compressed / 1e6, 1),
+        "Uncompressed (MB)": round(
+            sum(rg.total_byte_size for rg in row_groups) / 1e6, 1
+        ),
+    }
+
+
+def dataset_statistics(
+    subsets: tuple[str] | None = None,
+    manifest: list[dict[str, str]] | None = None,
+    max_workers: int = 8,
+    use_cache: bool = True,
+) -> pl.DataFrame:
+    """
+    Summarise manifest subsets by reading their footers in parallel.
+
+    Parameters
+    ----------
+    subsets : tuple of str or None
+        Subsets to summarise. If None all the subsets in the manifest are used.
+    manifest : list of dict or None
+        Manifest to resolve subsets with. If None the default one is loaded.
+    max_workers : int
+        Number of footers fetched concurrently.
+    use_cache : bool
+        Read the footer of the local copy of a subset when it has already been
+        downloaded by `jump_deps.cache.ProfileCache`, instead of its url.
+
+    Returns
+    -------
+    polars.DataFrame
+        One row per subset, see `footer_statistics` for the columns.
+
+    """
+    if manifest is None:
+        manifest = get_manifest()
+    if subsets is None:
+        subsets = [entry["subset"] for entry in manifest]
+
+    cache = ProfileCache(manifest=manifest) if use_cache else None
+    paths = [
+        (cache and cache.local(subset)) or get_entry(subset, manifest)["url"]
+        for subset in subsets
+    ]
+
+    with requests.Session() as session:
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max_workers)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            stats = list(
+                executor.map(lambda p: footer_statistics(p, session=session), paths)
+            )
+
+    return pl.DataFrame([{"dataset": k, **v} for k, v in zip(subsets, stats)])
+
+
+def row_group_layout(path: str | Path) -> pl.DataFrame:
+    """
+    Describe the row groups of a parquet file.
+
+    Parameters
+    ----------
+    path : str or Path
+        Local path or url of the parquet file.
+
+    Returns
+    -------
+    polars.DataFrame
+        One row per row group with its number of rows, the byte offset where
+        its data starts and its compressed and uncompressed sizes.
+
+    """
+    metadata, _ = read_footer(path)
+    layout = []
+    for i in range(metadata.num_row_groups):
+        rg = metadata.row_group(i)
+        columns = [rg.column(j) for j in range(rg.num_columns)]
+        layout.append({
+            "row_group": i,
+            "num_rows": rg.num_rows,
+            "offset": column_chunk_range(metadata, i)[0],
+            "compressed_bytes": sum(c.total_compressed_size for c in columns),
+            "uncompressed_bytes": rg.total_byte_size,
+        })
+    return pl.DataFrame(layout)
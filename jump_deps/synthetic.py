@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+"""
+Synthetic profiles and images with the shape of the JUMP datasets.
+
+Benchmarks and offline checks need data that looks like the real subsets
+without downloading them: Metadata_Source, Metadata_Plate, Metadata_Well and
+Metadata_JCP2022 columns, hundreds of float32 CellProfiler-like features,
+384-well plates except for sources 1 and 9, which use 1536-well plates (see
+explanations/quirks_details.md), negative controls on every plate and
+treatments replicated across plates. Features carry a per-plate offset and a
+sparse effect for a fraction of the treatments, so activity and feature tests
+have something to find.
+
+The file is written one row group at a time, so its size is not bounded by
+memory.
+
+Use cases:
+# 100k wells with 500 features
+synthetic_profiles("synthetic.parquet", n_rows=100_000, n_features=500)
+# Five channels of one site
+synthetic_site()
+"""
+
+from collections.abc import Sequence
+from itertools import product
+from pathlib import Path
+
+import numpy as np
+import polars as pl
+import pyarrow.parquet as pq
+
+from jump_deps.images import CHANNELS
+
+# DMSO, the negative control of the compound plates
+NEGCON_ID = "JCP2022_033924"
+HIGH_DENSITY_SOURCES = ("source_1", "source_9")
+COMPARTMENTS = ("Cells", "Cytoplasm", "Nuclei")
+MEASUREMENTS = (
+    "Intensity_MeanIntensity",
+    "Intensity_IntegratedIntensity",
+    "Texture_Contrast",
+    "Texture_Entropy",
+    "Granularity_1",
+    "RadialDistribution_FracAtD_1of4",
+    "Correlation_Correlation",
+)
+SHAPE_FEATURES = (
+    "AreaShape_Area",
+    "AreaShape_Eccentricity",
+    "AreaShape_FormFactor",
+    "AreaShape_Solidity",
+    "Neighbors_NumberOfNeighbors_Adjacent",
+)
+
+
+def well_names(n_wells: int) -> list[str]:
+    """Well names of a 384- or 1536-well plate, row by row (A01 ... AF48)."""
+    n_rows, n_columns = {384: (16, 24), 1536: (32, 48)}[n_wells]
+    letters = [chr(ord("A") + i) for i in range(26)]
+    rows = (letters + ["A" + x for x in letters])[:n_rows]
+    return [
+        f"{row}{column:02d}" for row, column in product(rows, range(1, n_columns + 1))
+    ]
+
+
+def feature_names(n_features: int) -> list[str]:
+    """CellProfiler-like feature names, cycling suffixes when more are needed."""
+    base = [
+        f"{compartment}_{name}"
+        for compartment, name in product(COMPARTMENTS, SHAPE_FEATURES)
+    ] + [
+        f"{compartment}_{name}_{channel}"
+        for compartment, name, channel in product(COMPARTMENTS, MEASUREMENTS, CHANNELS)
+    ]
+    return [
+        base[i % len(base)] + (f"_{i // len(base)}" if i >= len(base) else "")
+        for i in range(n_features)
+    ]
+
+
+def synthetic_layout(
+    n_rows: int,
+    n_sources: int = 4,
+    control_fraction: float = 0.1,
+    replicates: int = 4,
+    jcp_ids: Sequence[str] | None = None,
+    seed: int = 0,
+) -> pl.DataFrame:
+    """
+    Metadata of synthetic wells.
+
+    Parameters
+    ----------
+    n_rows : int
+        Number of wells. The last plate is truncated to reach it exactly.
+    n_sources : int
+        Number of sources; plates are assigned to them in turn.
+    control_fraction : float
+        Fraction of the wells of each plate that are negative controls.
+    replicates : int
+        Wells per treatment, spread over different plates.
+    jcp_ids : sequence of str or None
+        Identifiers of the treatments, e.g. real ones sampled from babel so
+        that annotation joins find them. They are reused in turn if there are
+        more treatments. If None treatments are numbered JCP2022_9xxxxx.
+    seed : int
+        Seed of the random generator.
+
+    Returns
+    -------
+    polars.DataFrame
+        Metadata_Source, Metadata_Plate, Metadata_Well and Metadata_JCP2022.
+
+    """
+    rng = np.random.default_rng(seed)
+    sources = [f"source_{i}" for i in range(1, n_sources + 1)]
+    plates = []
+    total = 0
+    while total < n_rows:
+        source = sources[len(plates) % n_sources]
+        n_wells = 1536 if source in HIGH_DENSITY_SOURCES else 384
+        wells = well_names(n_wells)[: n_rows - total]
+        plates.append(
+            pl.DataFrame({
+                "Metadata_Source": source,
+                "Metadata_Plate": f"SYN{len(plates):05d}",
+                "Metadata_Well": wells,
+                "Metadata_Control": rng.random(len(wells)) < control_fraction,
+            })
+        )
+        total += len(wells)
+    layout = pl.concat(plates)
+
+    # Consecutive shuffled slots share a treatment, so replicates land on
+    # random plates
+    n_treatments = layout.height - layout.get_column("Metadata_Control").sum()
+    treatment = rng.permutation(n_treatments) // replicates
+    if jcp_ids is None:
+        names = [f"JCP2022_9{i:05d}" for i in range(treatment.max(initial=-1) + 1)]
+    else:
+        names = list(jcp_ids)
+    wells = np.full(layout.height, NEGCON_ID, dtype=object)
+    wells[~layout.get_column("Metadata_Control").to_numpy()] = [
+        names[i % len(names)] for i in treatment
+    ]
+    return layout.drop("Metadata_Control").with_columns(
+        pl.Series("Metadata_JCP2022", wells, dtype=pl.String)
+    )
+
+
+def synthetic_profiles(
+    path: str | Path,
+    n_rows: int = 100_000,
+    n_features: int = 500,
+    n_sources: int = 4,
+    active_fraction: float = 0.2,
+    row_group_size: int = 16_384,
+    seed: int = 0,
+    **layout_kwargs,
+) -> Path:
+    """
+    Write a parquet file of synthetic well-level profiles.
+
+    Parameters
+    ----------
+    path : str or Path
+        Output parquet file.
+    n_rows : int
+        Number of wells.
+    n_features : int
+        Number of float32 feature columns.
+    n_sources : int
+        Number of sources, see `synthetic_layout`.
+    active_fraction : float
+        Fraction of the treatments that shift some of their features.
+    row_group_size : int
+        Rows generated and written at a time.
+    seed : int
+        Seed of the random generator.
+    **layout_kwargs
+        Passed on to `synthetic_layout`.
+
+    Returns
+    -------
+    Path
+        The written file.
+
+    """
+    path = Path(path)
+    rng = np.random.default_rng(seed)
+    layout = synthetic_layout(n_rows, n_sources, seed=seed, **layout_kwargs)
+    features = feature_names(n_features)
+
+    plate_codes = np.unique(layout.get_column("Metadata_Plate"), return_inverse=True)[1]
+    plate_shift = rng.normal(0, 0.3, (plate_codes.max() + 1, n_features))
+    jcp_codes = np.unique(layout.get_column("Metadata_JCP2022"), return_inverse=True)[1]
+    n_perturbations = jcp_codes.max() + 1
+    # Sparse effects: active perturbations shift about 5% of the features
+    effects = rng.normal(0, 1.5, (n_perturbations, n_features)) * (
+        (rng.random((n_perturbations, n_features)) < 0.05)
+        & (rng.random((n_perturbations, 1)) < active_fraction)
+    )
+    is_control = (layout.get_column("Metadata_JCP2022") == NEGCON_ID).to_numpy()
+    effects[np.unique(jcp_codes[is_control])] = 0
+    plate_shift, effects = plate_shift.astype(np.float32), effects.astype(np.float32)
+
+    writer = None
+    try:
+        for start in range(0, layout.height, row_group_size):
+            rows = slice(start, start + row_group_size)
+            values = rng.standard_normal((len(jcp_codes[rows]), n_features), np.float32)
+            values += plate_shift[plate_codes[rows]] + effects[jcp_codes[rows]]
+            table = (
+                layout[rows].hstack(pl.DataFrame(values, schema=features)).to_arrow()
+            )
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table, row_group_size=row_group_size)
+    finally:
+        if writer is not None:
+            writer.close()
+    return path
+
+
+def synthetic_site(
+    size: int = 1080,
+    channels: tuple[str] = CHANNELS,
+    n_cells: int = 60,
+    seed: int = 0,
+) -> dict[str, np.ndarray]:
+    """
+    Images of one synthetic site: noisy background with bright round cells.
+
+    Parameters
+    ----------
+    size : int
+        Height and width in pixels (JUMP sites are 1080 x 1080).
+    channels : tuple of str
+        Channels to generate.
+    n_cells : int
+        Number of cells.
+    seed : int
+        Seed of the random generator.
+
+    Returns
+    -------
+    dict
+        Maps each channel to a (size, size) uint16 image.
+
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.ogrid[:size, :size]
+    cells = np.zeros((size, size), dtype=np.float32)
+    for cy, cx, radius in zip(
+        rng.integers(0, size, n_cells),
+        rng.integers(0, size, n_cells),
+        rng.integers(size // 60, size // 25, n_cells),
+    ):
+        cells[(y - cy) ** 2 + (x - cx) ** 2 <= radius**2] = 1
+    return {
+        channel: (
+            rng.gamma(2, 150, (size, size)) + cells * rng.uniform(2000, 8000)
+        ).astype(np.uint16)
+        for channel in channels
+    }
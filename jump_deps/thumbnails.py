@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+"""
+Multi-resolution thumbnails and intensity percentiles of Cell Painting sites.
+
+Displaying a site at a few hundred pixels does not require its full-resolution
+images, nor recomputing their intensity percentiles every time. This module
+preprocesses each site once: every channel is reduced into a pyramid of
+images (from half resolution down, each level half the size of the previous
+one) and its percentiles are computed at full resolution. Both are stored in
+one compressed .npz file per site, where each level of each channel is a
+separate member, so a preview only decompresses the level it needs. Previews
+larger than half resolution are served from the image cache.
+
+Use cases:
+# Preprocess many sites (full-resolution images are fetched concurrently)
+thumbs = ThumbnailCache()
+thumbs.build(sites)
+# Smallest level at least 256 pixels wide plus the stored percentiles
+images, percentiles = get_site_preview("source_13", "20221109_Run5", "CP-CC9-R5-20", "A01", 1, 256)
+"""
+
+import os
+from pathlib import Path
+
+import numpy as np
+
+from jump_deps.cache import LRUDirectory
+from jump_deps.images import (
+    CHANNELS,
+    ImageCache,
+    SiteKey,
+    downsample,
+    site_key,
+    worker_kwargs,
+)
+from jump_deps.manifest import get_cache_dir
+from jump_deps.pool import map_unordered
+
+PERCENTILES = (0.1, 1.0, 50.0, 99.0, 99.5, 99.9)
+DEFAULT_THUMBNAIL_MAX_BYTES = 2e9
+
+
+def build_pyramid(image: np.ndarray, min_size: int = 64) -> list[np.ndarray]:
+    """
+    Halve an image repeatedly.
+
+    Parameters
+    ----------
+    image : numpy.ndarray
+        Full-resolution image.
+    min_size : int
+        No level is made whose shorter side would be below this size.
+
+    Returns
+    -------
+    list of numpy.ndarray
+        Levels from half resolution to the smallest one, with the data type
+        of the input image. The full-resolution image is left out, as it is
+        already in the image cache.
+
+    """
+    levels = []
+    level = image
+    while min(level.shape) // 2 >= min_size:
+        level = downsample(level, 2).astype(image.dtype)
+        levels.append(level)
+    return levels
+
+
+def _build_site(
+    site: SiteKey,
+    channels: tuple[str],
+    min_size: int,
+    percentiles: tuple[float],
+    cache_dir: str | Path | None,
+    max_bytes: float,
+    image_kwargs: dict,
+) -> None:
+    thumbnails = LRUDirectory(get_cache_dir(cache_dir) / "thumbnails", max_bytes)
+    name = ThumbnailCache.filename(site)
+    arrays = {"percentiles": np.array(percentiles), "channels": np.array([], str)}
+    # Channels processed before are kept, unless other percentiles were stored
+    path = thumbnails.get(name)
+    if path is not None:
+        with np.load(path) as data:
+            if "channels" in data and np.array_equal(
+                data["percentiles"], arrays["percentiles"]
+            ):
+                arrays.update(data)
+    done = arrays["channels"].tolist()
+    channels = tuple(c for c in channels if c not in done)
+    arrays["channels"] = np.array([*done, *channels], dtype=str)
+
+    images = ImageCache(cache_dir=cache_dir, **image_kwargs).get([site], channels)
+    for channel, image in images[site].items():
+        arrays[f"{channel}_percentiles"] = np.percentile(image, percentiles)
+        pyramid = build_pyramid(image, min_size)
+        arrays[f"{channel}_shapes"] = np.array(
+            [level.shape for level in pyramid], dtype=np.int64
+        ).reshape(-1, 2)
+        for i, level in enumerate(pyramid):
+            arrays[f"{channel}_{i}"] = level
+
+    tmp = thumbnails.tempfile()
+    try:
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        thumbnails.put(name, tmp, evict=False)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+class ThumbnailCache:
+    """
+    Build and read image pyramids and percentiles of sites.
+
+    Parameters
+    ----------
+    cache_dir : str, Path or None
+        Root of the local cache, see `jump_deps.manifest.get_cache_dir`.
+    max_bytes : float or None
+        Disk budget for thumbnails. If None it is read from the environment
+        variable JUMP_DEPS_THUMBNAIL_CACHE_MAX_BYTES, falling back to 2 GB.
+    min_size : int
+        Size of the smallest level of the pyramids, see `build_pyramid`.
+    percentiles : tuple of float
+        Intensity percentiles stored for every channel.
+    **image_kwargs
+        Passed on to `jump_deps.images.ImageCache` to fetch the
+        full-resolution images.
+
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | Path | None = None,
+        max_bytes: float | None = None,
+        min_size: int = 64,
+        percentiles: tuple[float] = PERCENTILES,
+        **image_kwargs,
+    ):
+        if max_bytes is None:
+            max_bytes = float(
+                os.environ.get(
+                    "JUMP_DEPS_THUMBNAIL_CACHE_MAX_BYTES", DEFAULT_THUMBNAIL_MAX_BYTES
+                )
+            )
+        self.cache_dir = cache_dir
+        self.files = LRUDirectory(get_cache_dir(cache_dir) / "thumbnails", max_bytes)
+        self.min_size = min_size
+        self.percentiles = percentiles
+        self.image_kwargs = image_kwargs
+
+    @staticmethod
+    def filename(site: SiteKey) -> str:
+        """Name of the thumbnails of a site."""
+        return "/".join(map(str, site)) + ".npz"
+
+    def missing_channels(self, site: SiteKey, channels: tuple[str]) -> tuple[str]:
+        """
+        Channels of a site that have not been processed yet.
+
+        Channels that were processed but are missing from the image index
+        count as processed, so they are not looked up again.
+        """
+        path = self.files.get(self.filename(site))
+        if path is None:
+            return tuple(channels)
+        with np.load(path) as data:
+            done = set(data["channels"].tolist()) if "channels" in data else set()
+        return tuple(c for c in channels if c not in done)
+
+    def build(
+        self,
+        sites: list[SiteKey],
+        channels: tuple[str] = CHANNELS,
+        max_workers: int = 4,
+    ) -> None:
+        """
+        Preprocess the channels of the sites that have not been processed yet.
+
+        The full-resolution images are first downloaded concurrently into the
+        image cache, then reduced in a pool of processes. A single site is
+        reduced in the calling process, which is faster than starting a pool.
+
+        Parameters
+        ----------
+        sites : list of tuple
+            (source, batch, plate, well, site) of each site.
+        channels : tuple of str
+            Channels to process.
+        max_workers : int
+            Number of processes.
+
+        """
+        sites = list(dict.fromkeys(site_key(*site) for site in sites))
+        todo = [site for site in sites if self.missing_channels(site, channels)]
+        if not todo:
+            return
+        images = ImageCache(cache_dir=self.cache_dir, **self.image_kwargs)
+        images.get(todo, channels)
+        if len(todo) == 1 or max_workers == 1:
+            for site in todo:
+                _build_site(
+                    site,
+                    channels,
+                    self.min_size,
+                    self.percentiles,
+                    self.cache_dir,
+                    self.files.max_bytes,
+                    self.image_kwargs,
+                )
+            self.files.evict()
+            return
+
+        kwargs = worker_kwargs(self.image_kwargs)
+        jobs = (
+            (
+                site,
+                (
+                    site,
+                    channels,
+                    self.min_size,
+                    self.percentiles,
+                    self.cache_dir,
+                    self.files.max_bytes,
+                    kwargs,
+                ),
+            )
+            for site in todo
+        )
+        list(map_unordered(_build_site, jobs, max_workers))
+        self.files.evict()
+
+    def get(
+        self,
+        site: SiteKey,
+        size: int = 256,
+        channels: tuple[str] = CHANNELS,
+    ) -> tuple[dict[str, np.ndarray], dict[str, dict[float, float]]]:
+        """
+        Return the smallest pyramid level that fits a target size.
+
+        The site is preprocessed first if needed.
+
+        Parameters
+        ----------
+        site : tuple
+            (source, batch, plate, well, site).
+        size : int
+            Minimum size, in pixels, of the shorter side of the images. The
+            full-resolution image, from the image cache, is returned when no
+            level of the pyramid is this large.
+        channels : tuple of str
+            Channels to return.
+
+        Returns
+        -------
+        dict
+            Maps each channel to its image.
+        dict
+            Maps each channel to its percentiles, as a dictionary from
+            percentile to intensity (computed at full resolution).
+
+        """
+        site = site_key(*site)
+        if self.missing_channels(site, channels):
+            self.build([site], channels)
+        path = self.files.get(self.filename(site))
+
+        images, percentiles, full = {}, {}, []
+        with np.load(path) as data:
+            levels = data["percentiles"].tolist()
+            for channel in channels:
+                if f"{channel}_shapes" not in data:
+                    continue
+                n_fit = int((data[f"{channel}_shapes"].min(axis=1) >= size).sum())
+                if n_fit:
+                    images[channel] = data[f"{channel}_{n_fit - 1}"]
+                else:
+                    full.append(channel)
+                percentiles[channel] = dict(
+                    zip(levels, data[f"{channel}_percentiles"].tolist())
+                )
+        if full:
+            cache = ImageCache(cache_dir=self.cache_dir, **self.image_kwargs)
+            images.update(cache.get([site], tuple(full))[site])
+        return {c: images[c] for c in channels if c in images}, percentiles
+
+
+def get_site_preview(
+    source: str,
+    batch: str,
+    plate: str,
+    well: str,
+    site: str | int,
+    size: int = 256,
+    channels: tuple[str] = CHANNELS,
+    **kwargs,
+) -> tuple[dict[str, np.ndarray], dict[str, dict[float, float]]]:
+    """
+    Preview images and percentiles of one site with the default cache.
+
+    See `ThumbnailCache.get`; `kwargs` are passed on to `ThumbnailCache`.
+    """
+    return ThumbnailCache(**kwargs).get(
+        (source, batch, plate, well, site), size, channels
+    )
@@ -16,7 +16,9 @@
 
 # %% Imports
 import polars as pl
-import requests
+from jump_deps.cache import scan_profiles
+from jump_deps.manifest import INDEX_FILE, get_manifest
+from jump_deps.stats import dataset_statistics
 
 # %% [markdown]
 #
@@ -43,14 +45,14 @@ import requests
 # For details on creating your own profile manifests, see the [manifest guide](https://github.com/broadinstitute/jump_hub/blob/main/howto/2_create_project_manifest.md).
 
 # %% Paths
-INDEX_FILE = "https://raw.githubusercontent.com/jump-cellpainting/datasets/v0.11.0/manifests/profile_index.json"
+INDEX_FILE
+
 # %% [markdown]
-# We use the version-controlled manifest above to release the latest corrected profiles
+# We use the version-controlled manifest above to release the latest corrected profiles. `get_manifest` keeps a local copy of it, so subsequent runs do not need to download it again.
 
 # %%
 # Load the JSON manifest
-response = requests.get(INDEX_FILE)
-profile_index = response.json()
+profile_index = get_manifest()
 
 # Display the manifest data
 for dataset in profile_index:
@@ -96,30 +98,25 @@ for subset, url in filepaths.items():
     print(f"  {subset}: {url.split('/')[-1]}")
 
 # %% [markdown]
-# We will lazy-load the dataframes and print the number of rows and columns
+# Parquet files record their number of rows, their columns and their size in a footer at the end of the file. We read only these footers, for all datasets in parallel, to get an overview without loading any data.
+
+# %%
+dataset_statistics(tuple(filepaths))
+
+# %% [markdown]
+# The same approach summarises every subset in the manifest in about one request per file.
 
 # %%
-info = {k: [] for k in ("dataset", "#rows", "#cols", "#Metadata cols", "Size (MB)")}
-for name, path in filepaths.items():
-    data = pl.scan_parquet(path)
-    n_rows = data.select(pl.len()).collect().item()
-    schema = data.collect_schema()
-    metadata_cols = [col for col in schema.keys() if col.startswith("Metadata")]
-    n_cols = schema.len()
-    n_meta_cols = len(metadata_cols)
-    estimated_size = int(round(4.03 * n_rows * n_cols / 1e6, 0))  # B -> MB
-    for k, v in zip(info.keys(), (name, n_rows, n_cols, n_meta_cols, estimated_size)):
-        info[k].append(v)
-
-pl.DataFrame(info)
+dataset_statistics()
 
 # %% [markdown]
 # Let us now focus on the `crispr` dataset and use a regex to select the metadata columns.
 # We will then sample rows and display the overview.
+# `scan_profiles` downloads the file once into a local cache keyed by the ETag in the manifest; later runs (and the other notebooks) reuse the local copy without touching the network. You can change its location with the `JUMP_DEPS_CACHE_DIR` environment variable and its disk budget with `JUMP_DEPS_CACHE_MAX_BYTES`.
 # Note that the collect() method enforces loading some data into memory.
 
 # %%
-data = pl.scan_parquet(filepaths["crispr"])
+data = scan_profiles("crispr")
 data.select(pl.col("^Metadata.*$").sample(n=5, seed=1)).collect()
 
 # %% [markdown]
@@ -20,30 +20,22 @@
 
 # %% Imports
 import polars as pl
-import requests
 from broad_babel.query import get_mapper
+from jump_deps.annotate import annotate
+from jump_deps.io_trace import trace_io
+from jump_deps.rowgroup_index import get_rowgroup_index, read_perturbations
 
 # %% [markdown]
-# We will be using the CRISPR dataset specificed in our json index file.
+# We will be using the CRISPR dataset specificed in our json index file. Instead of downloading it, we load its row-group index: a small table, built once from the Parquet footer and the identifier columns and then kept in the local cache, that knows which JUMP ids are in the dataset and where their rows are.
 
-# %% Fetch the CRISPR dataset
-INDEX_FILE = "https://raw.githubusercontent.com/jump-cellpainting/datasets/v0.11.0/manifests/profile_index.json"
-response = requests.get(INDEX_FILE)
-profile_index = response.json()
-
-CRISPR_URL = (
-    pl.DataFrame(profile_index).filter(pl.col("subset") == "crispr").item(0, "url")
-)
-profiles = pl.scan_parquet(CRISPR_URL)
-print(profiles.collect_schema().names()[:6])
+# %% Index the CRISPR dataset
+index = get_rowgroup_index("crispr")
 
 # %% [markdown]
 # For simplicity the contents of our processed profiles are minimal: "The profile origin" (source, plate and well) and the unique JUMP identifier for that perturbation. We will use broad-babel to further expand on this metadata, but for simplicity's sake let us sample subset of data.
 
 # %% Subset data
-jcp_ids = (
-    profiles.select(pl.col("Metadata_JCP2022")).unique().collect().to_series().sort()
-)
+jcp_ids = index.values("Metadata_JCP2022")
 subsample = jcp_ids.sample(10, seed=42)
 # Add a well-known control
 subsample = (*subsample, "JCP2022_800002")
@@ -63,27 +55,26 @@ pert_mapper
 # - these must be fed tuples, as these are cached and provide significant speed-ups for repeated calls
 # - 'get-mapper' works for datasets for up to a few tens of thousands of samples. If you try to use it to get a mapper for the entirety of the 'compounds' dataset it is likely to fail. For these cases we suggest the more general function 'run_query'. You can read more on this and other use-cases on Babel's [readme](https://github.com/broadinstitute/monorepo/tree/main/libs/jump_babel).
 #
-# We will now repeat the process to get their 'standard' name
-
-# %% Fetch standard name
-name_mapper = get_mapper(
-    (*subsample, "JCP2022_800002"),
-    input_column="JCP2022",
-    output_columns="JCP2022,standard_key",
-)
-name_mapper
+# To add several columns at once we do not need one mapper per column. `annotate` loads the whole babel table once and adds any number of its columns with a single join. It accepts both eager and lazy dataframes, so it also works on entire datasets.
 
 # %% [markdown]
-# To wrap up, we will fetch all the available profiles for these perturbations and use the mappers to add the missing metadata. We also select a few features to showcase how how selection can be performed in polars.
+# To wrap up, we will fetch all the available profiles for these perturbations and add the perturbation type and their 'standard' name. We also select a few features to showcase how how selection can be performed in polars.
+#
+# Profiles are not sorted by perturbation, so a filter on `Metadata_JCP2022` has to read that column in every chunk (row group) of the file. `read_perturbations` uses an index, built once per dataset version, that records which row groups contain each perturbation and reads only those.
 
 # %% Filter profiles and merge metadata
-subsample_profiles = profiles.filter(
-    pl.col("Metadata_JCP2022").is_in(subsample)
-).collect()
-profiles_with_meta = subsample_profiles.with_columns(
-    pl.col("Metadata_JCP2022").replace(pert_mapper).alias("pert_type"),
-    pl.col("Metadata_JCP2022").replace(name_mapper).alias("name"),
+subsample_profiles = read_perturbations("crispr", jcp_ids=subsample)
+profiles_with_meta = annotate(
+    subsample_profiles, {"pert_type": "pert_type", "standard_key": "name"}
 )
 profiles_with_meta.select(
     pl.col(("name", "pert_type", "^Metadata.*$", "^X_[0-3]$"))
 ).sort(by="pert_type")
+
+# %% [markdown]
+# How much a query costs over the network can be measured with `trace_io`: every range request, download and cache lookup made by `jump_deps` inside the block is recorded under the name of the running query. The summary reports the number of requests, the bytes fetched compared to the size of the files, latency percentiles and cache hit rates (`trace.to_json` saves the raw events). Setting the environment variable `JUMP_DEPS_TRACE=trace.json` traces a whole script instead.
+
+# %% Trace the I/O of a query
+with trace_io() as trace, trace.query("subsample"):
+    read_perturbations("crispr", jcp_ids=subsample)
+trace.summary()
@@ -19,53 +19,35 @@
 
 # %% Imports
 import polars as pl
-import polars.selectors as cs
-import requests
 import seaborn as sns
-from broad_babel.query import get_mapper
 from copairs.map import average_precision
+from jump_deps.annotate import annotate
+from jump_deps.layout import read_with_controls
+from jump_deps.matrix import copairs_inputs
+from jump_deps.rowgroup_index import get_rowgroup_index
 
 # %% [markdown]
 # We will be using the CRISPR dataset specificed in our kson index, but we will select a subset of perturbations and the controls present.
-
-# %% Fetch the CRISPR dataset
-INDEX_FILE = "https://raw.githubusercontent.com/jump-cellpainting/datasets/v0.11.0/manifests/profile_index.json"
-response = requests.get(INDEX_FILE)
-profile_index = response.json()
-
-CRISPR_URL = (
-    pl.DataFrame(profile_index).filter(pl.col("subset") == "crispr").item(0, "url")
-)
-profiles = pl.scan_parquet(CRISPR_URL)
-
-# %% [markdown]
-# Sample perturbations and add known negative control.
+#
+# Sample perturbations and load them together with the negative controls on their plates. The perturbations in the dataset are listed by its row-group index, which is built once and then kept in the local cache, so the dataset is not downloaded.
 
 # %%
-jcp_ids = (
-    profiles.select(pl.col("Metadata_JCP2022")).unique().collect().to_series().sort()
-)
+jcp_ids = get_rowgroup_index("crispr").values()
 subsample = jcp_ids.sample(10, seed=42)
-subsample = (*subsample, "JCP2022_800002")  # Add the only control in CRISPR data
-profiles_subset = profiles.filter(pl.col("Metadata_JCP2022").is_in(subsample)).collect()
-unique_plates = profiles_subset.filter(pl.col("Metadata_JCP2022") != subsample[-1])[
-    "Metadata_Plate"
-].unique()
-perts_controls = profiles_subset.filter(pl.col("Metadata_Plate").is_in(unique_plates))
+# The layout index knows the plates of every perturbation and the negative
+# controls on them, so both are loaded in a single targeted read. Without
+# `controls` every negative control on those plates would be loaded; we keep
+# the non-targeting control used so far
+perts_controls = read_with_controls("crispr", subsample, controls=["JCP2022_800002"])
 with pl.Config() as cfg:
     cfg.set_tbl_cols(7)  # Limit the number of columns printed
     print(perts_controls.head())
 
 # %% [markdown]
-# Now we create a mapper to label treatments and controls. See the previous tutorial for details on fetching metadata.
+# Now we label treatments and controls. See the previous tutorial for details on fetching metadata.
 
 # %%
-pert_mapper = get_mapper(
-    subsample, input_column="JCP2022", output_columns="JCP2022,pert_type"
-)
-perts_controls_annotated = perts_controls.with_columns(
-    pl.col("Metadata_JCP2022").replace(pert_mapper).alias("pert_type")
-)
+perts_controls_annotated = annotate(perts_controls, ("pert_type",))
 
 # %% [markdown]
 # Finally we use the parameters from . See the [copairs wiki](https://github.com/cytomining/copairs/wiki/Defining-parameters) for more details on the parameters that copairs requires.
@@ -77,21 +59,20 @@ neg_sameby = []
 neg_diffby = ["pert_type"]
 batch_size = 20000
 
-metadata_selector = cs.starts_with(("Metadata", "pert_type"))
-meta = perts_controls_annotated.select(metadata_selector)
-features = perts_controls_annotated.select(~metadata_selector)
+# Metadata as a compact pandas frame and features as a float32 matrix, without converting everything to pandas
+meta, features = copairs_inputs(perts_controls_annotated)
 
 result = average_precision(
-    meta.to_pandas(),
-    features.to_numpy(),
+    meta,
+    features,
     pos_sameby,
     pos_diffby,
     neg_sameby,
     neg_diffby,
     batch_size,
 )
-result = pl.DataFrame(
-    result
+result = pl.from_pandas(result).with_columns(
+    pl.col(pl.Categorical).cast(pl.String)
 )  # We convert back to polars because we prefer how it prints dataframes
 result.head()
 
@@ -101,12 +82,8 @@ result.head()
 # To wrap up we pull the standard gene symbol and plot the distribution of average precision.
 
 # %%
-name_mapper = get_mapper(
-    subsample, input_column="JCP2022", output_columns="JCP2022,standard_key"
-)
-
-to_plot = result.filter(pl.col("pert_type") == "trt").with_columns(
-    pl.col("Metadata_JCP2022").replace(name_mapper).alias("Perturbed gene")
+to_plot = annotate(
+    result.filter(pl.col("pert_type") == "trt"), {"standard_key": "Perturbed gene"}
 )
 
 # Plotting
@@ -115,3 +92,12 @@ sns.stripplot(data=to_plot.to_pandas(), x="average_precision", y="Perturbed gene
 # %% [markdown]
 # We can see that only some perturbations can be easily retrieved when compared to negative controls, in this case KIF16B and CDK20.
 # For a deeper dive into how mean Average Precision (mAP) works, you can explore [this](https://github.com/alxndrkalinin/copairs/blob/v0.4.2/examples/demo.ipynb) notebook.
+#
+# This notebook scores a small sample in memory. To score every perturbation in a dataset, `jump_deps.activity.dataset_activity` processes it group of plates by group of plates, each with the negative controls on those plates, in a pool of processes and writes the results to disk as it goes:
+#
+# ```python
+# from jump_deps.activity import dataset_activity, summarise_activity
+#
+# ap_dir = dataset_activity("crispr", "crispr_activity", max_workers=8)
+# activity = summarise_activity(ap_dir)
+# ```
@@ -20,9 +20,11 @@
 import duckdb
 import matplotlib.colors as mpl  # noqa: CPY001
 import numpy as np
-from jump_portrait.fetch import get_item_location_metadata, get_jump_image
+from jump_portrait.fetch import get_item_location_metadata
 from matplotlib import pyplot as plt
 
+from jump_deps.thumbnails import get_site_preview
+
 #
 
 # %% [markdown]
@@ -48,6 +50,8 @@ print(cmpd_info_byjcp.shape)
 # %% [markdown]
 # There are 34 sites corresponding to this compound.
 # We've written a function to display all channels for a specific image. Note that this is just one possible way to display images - we've included the function here so that you can modify it to suit your own needs.
+# All channels are fetched concurrently with `jump_deps.images.get_site_images`, which keeps a local copy of every image (see `JUMP_DEPS_IMAGE_CACHE_MAX_BYTES`), so redrawing a site does not download it again.
+# Panels are only a few hundred pixels wide, so `jump_deps.thumbnails.get_site_preview` reads the smallest precomputed level that fits them, together with intensity percentiles computed once at full resolution.
 
 
 # %%
@@ -95,12 +99,21 @@ def display_site(
         "RNA": "#FFFF00",  # Yellow
     }
 
+    # Smallest precomputed level that fills a panel at the default resolution
+    size = int(2.6 * plt.rcParams["figure.dpi"])
+    images, percentiles = get_site_preview(
+        source, batch, plate, well, site, size, tuple(channel_rgb)
+    )
+
     for ax, (channel, rgb) in zip(axes, channel_rgb.items()):
         cmap = mpl.LinearSegmentedColormap.from_list(channel, ("#000", rgb))
 
-        img = get_jump_image(source, batch, plate, well, channel, site)
+        img = images[channel]
+        vmax = percentiles[channel].get(int_percentile)
+        if vmax is None:
+            vmax = np.percentile(img, int_percentile)
 
-        ax.imshow(img, vmin=0, vmax=np.percentile(img, int_percentile), cmap=cmap)
+        ax.imshow(img, vmin=0, vmax=vmax, cmap=cmap)
         ax.axis("off")
 
         # Add channel name label in the top left corner
@@ -227,3 +240,12 @@ display_site(
     label.format("RAB30 (CRISPR)", plate, well, site),
     99.5,
 )
+
+# %% [markdown]
+# To review many perturbations at once, `jump_deps.gallery.render_gallery` samples sites of each gene or compound together with negative control sites from the same plates, and writes one panel per perturbation (one row per site: the five channels and their merge). Images are downloaded concurrently and the panels are composed in parallel, so hundreds of panels can be produced in one call.
+#
+# ```python
+# from jump_deps.gallery import render_gallery
+#
+# gallery_sites = render_gallery(["RAB30", "MYT1"], "gallery", n_sites=3, n_controls=3)
+# ```
@@ -35,6 +35,7 @@ from random import choices, seed
 import matplotlib.pyplot as plt
 import polars as pl
 import seaborn as sns
+from jump_deps.remote import read_parquet
 
 # %% [markdown]
 # We select the CRISPR dataset for this example. As with previous examples, this is a lazy-loaded data frame. This enables us to download very big datasets without worrying about whether or not they will fill into memory. In these datasets, the values range between 0 and 2, where 0 means that two profiles are the same, 1 means that they are orthogonal (completely uncorrelated) and 2 means that they are completely anticorrelated.
@@ -43,13 +44,14 @@ import seaborn as sns
 latest_id = requests.get(
     "https://zenodo.org/api/records/15029005/versions/latest"
 ).json()["id"]
-distances = pl.scan_parquet(
-    f"https://zenodo.org/api/records/{latest_id}/files/crispr_cosinesim_full.parquet/content"
-)
+url = f"https://zenodo.org/api/records/{latest_id}/files/crispr_cosinesim_full.parquet/content"
+distances = pl.scan_parquet(url)
 distances.head().collect()
 
 # %% [markdown]
 # Note that the only metadata information in this matrix are the column names as JUMP IDs (JCP2022_X), meaning that we will need to use a mapper from these JUMP ids to conventional names; feel free to look at the previous how-to that demonstrates that. We will now select three features at random and look at their correlation matrix
+#
+# The matrix has thousands of columns. Reading a few of them with `read_parquet` from `jump_deps.remote` plans the byte ranges of those columns from the file footer, merges the nearby ones and fetches them concurrently over pooled connections, instead of sending one request per column chunk.
 
 # %%
 seed(42)
@@ -59,10 +61,10 @@ sampled_col_idx = sorted(choices(range(ncols), k=3))
 sampled_cols = [cols[ix] for ix in sampled_col_idx]
 
 sampled_distances = (
-    distances.with_row_index()
+    read_parquet(url, columns=sampled_cols)
+    .with_row_index()
     .filter(pl.col("index").is_in(sampled_col_idx))
-    .select(pl.col(sampled_cols))
-    .collect()
+    .drop("index")
 )
 sampled_distances
 
@@ -85,3 +87,22 @@ plt.tight_layout()
 
 # %% [markdown]
 # Whilst in this case it is not a terribly interesting result, this shows that we see no correlation between three randomly selected perturbations.
+
+# %% [markdown]
+# Most of the time we only want the perturbations that look most similar (or most anticorrelated) to ours. `jump_deps.neighbours.nearest_neighbours` answers this from an index of the 50 closest and 50 farthest perturbations of every row, built once in a single pass over the matrix and kept in the local cache. Genes can be queried by their symbol, and each lookup only reads a few kilobytes.
+
+# %%
+from jump_deps.neighbours import nearest_neighbours
+
+nearest_neighbours(["RAB30", "MYT1"], "crispr_cosinesim_full.parquet", n=5)
+
+# %% [markdown]
+# The Zenodo matrices cover the standard datasets. For any other set of profiles (e.g., a different manifest subset), `jump_deps.similarity.build_similarity_store` computes the cosine similarities of the consensus profiles block by block into a memory-mapped file on disk. Rows, columns or submatrices can then be read without loading the whole matrix. The consensus (median) profiles of a subset are computed once by `jump_deps.consensus.get_consensus` and kept in the local cache:
+#
+# ```python
+# from jump_deps.consensus import get_consensus
+# from jump_deps.similarity import SimilarityStore, build_similarity_store
+#
+# build_similarity_store(get_consensus("orf"), "orf_similarity")
+# SimilarityStore("orf_similarity").submatrix(sampled_cols)
+# ```
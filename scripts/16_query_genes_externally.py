@@ -21,14 +21,14 @@
 
 # %% Imports
 import polars as pl
-from Bio import Entrez
-from broad_babel.query import get_mapper
+
+from jump_deps.ncbi import fetch_gene_summaries, gene_summaries
 
 # %% [markdown]
 # We define the fields that we need and an email to provide to the server we will query.
 
 # %%
-Entrez.email = "example@email.com"
+email = "example@email.com"
 fields = (
     "Name",
     "Description",
@@ -43,28 +43,20 @@ fields = (
 genes = ("CHRM4", "SCAPER", "GPR176", "LY6K")
 
 # %% [markdown]
-# Get a dictionary that maps Gene symbols to Entrez IDs
+# Get a table that maps Gene symbols to Entrez IDs and fetch the summaries of all of them. `jump_deps.ncbi` sends the ids in batches, stays within the NCBI rate limit and stores every summary locally, so annotating the same genes again does not query NCBI.
 
 # %%
-ids = get_mapper(
-    query=genes,
-    input_column="standard_key",
-    output_columns="standard_key,NCBI_Gene_ID",
-)
+summaries = gene_summaries(genes, fields, email=email)
 
-# Fetch the summaries for these genes
-entries = []
-for id_ in ids.values():
-    stream = Entrez.esummary(db="gene", id=id_)
-    record = Entrez.read(stream)
+# %% [markdown]
+# Genes can also be queried directly by their NCBI ID.
 
-    entries.append({
-        k: record["DocumentSummarySet"]["DocumentSummary"][0][k] for k in fields
-    })
+# %%
+fetch_gene_summaries(summaries["NCBI_Gene_ID"], ("Name",), email=email)
 
 # %%
 # Show the resultant information in a human-readable format
 
 # %%
 with pl.Config(fmt_str_lengths=1000):
-    print(pl.DataFrame(entries))
+    print(summaries)
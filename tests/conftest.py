@@ -0,0 +1,132 @@
+"""
+Shared fixtures: local HTTP servers and small synthetic profile files.
+"""
+
+import re
+import threading
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from jump_deps.synthetic import synthetic_profiles
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.respond(self)
+
+    do_POST = do_PUT = do_HEAD = do_GET
+
+    def log_message(self, *args):
+        pass
+
+
+def reply(
+    handler: BaseHTTPRequestHandler,
+    body: bytes = b"",
+    status: int = 200,
+    headers: dict[str, str] | None = None,
+) -> None:
+    """Send a complete response from a stub server."""
+    handler.send_response(status)
+    for key, value in (headers or {}).items():
+        handler.send_header(key, value)
+    handler.send_header("Content-Length", str(len(body)))
+    handler.end_headers()
+    if handler.command != "HEAD":
+        handler.wfile.write(body)
+
+
+def read_body(handler: BaseHTTPRequestHandler) -> bytes:
+    """Body of the request a stub server is answering."""
+    return handler.rfile.read(int(handler.headers.get("Content-Length", 0)))
+
+
+@pytest.fixture
+def serve() -> Callable[[Callable[[BaseHTTPRequestHandler], None]], str]:
+    """
+    Start local HTTP servers that answer every request with a function.
+
+    The function receives the request handler and must reply with `reply`.
+    Returns the root url of the server.
+    """
+    servers = []
+
+    def start(respond: Callable[[BaseHTTPRequestHandler], None]) -> str:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        server.daemon_threads = True
+        server.respond = respond
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def serve_bytes(serve) -> Callable[..., tuple[str, list[str | None]]]:
+    """
+    Serve some bytes at a url, honouring Range headers unless told not to.
+
+    Returns the url and the list of Range headers received, in order.
+    """
+
+    def start(content: bytes, honour_range: bool = True):
+        ranges = []
+
+        def respond(handler):
+            header = handler.headers.get("Range")
+            ranges.append(header)
+            match = re.fullmatch(r"bytes=(\d*)-(\d*)", header or "")
+            if not honour_range or match is None:
+                reply(handler, content)
+                return
+            first, last = match.groups()
+            if first:
+                start = int(first)
+                end = min(int(last) + 1, len(content)) if last else len(content)
+            else:
+                start, end = max(len(content) - int(last), 0), len(content)
+            reply(
+                handler,
+                content[start:end],
+                206,
+                {"Content-Range": f"bytes {start}-{end - 1}/{len(content)}"},
+            )
+
+        return f"{serve(respond)}/profiles.parquet", ranges
+
+    return start
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """Keep the jump_deps cache of every test in its own directory."""
+    path = tmp_path / "cache"
+    monkeypatch.setenv("JUMP_DEPS_CACHE_DIR", str(path))
+    return path
+
+
+@pytest.fixture(scope="session")
+def profiles_path(tmp_path_factory):
+    """Small synthetic profile file with several row groups."""
+    return synthetic_profiles(
+        tmp_path_factory.mktemp("profiles") / "profiles.parquet",
+        n_rows=6000,
+        n_features=24,
+        n_sources=2,
+        row_group_size=1000,
+    )
+
+
+@pytest.fixture
+def manifest(serve_bytes, profiles_path) -> list[dict[str, str]]:
+    """Manifest with the synthetic profiles served as the crispr subset."""
+    url, _ = serve_bytes(profiles_path.read_bytes())
+    return [{"subset": "crispr", "url": url, "etag": '"synthetic-1"'}]
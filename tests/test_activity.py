@@ -0,0 +1,36 @@
+import polars as pl
+import pytest
+
+from jump_deps.activity import RUN_FILE, _check_run, plate_groups
+
+
+def test_plate_groups_keep_treatments_with_all_their_plates():
+    layout = pl.DataFrame({
+        "Metadata_JCP2022": ["a", "a", "b", "c", "c", "ctl", "ctl"],
+        "Metadata_Plate": ["p1", "p2", "p2", "p3", "p4", "p1", "p3"],
+        "pert_type": ["trt"] * 5 + ["negcon"] * 2,
+    })
+    assert plate_groups(layout, max_plates=2) == [
+        (["p1", "p2"], ["a", "b"]),
+        (["p3", "p4"], ["c"]),
+    ]
+    assert plate_groups(layout, max_plates=16) == [
+        (["p1", "p2", "p3", "p4"], ["a", "b", "c"])
+    ]
+
+
+def test_runs_are_not_mixed(tmp_path):
+    run = {"subset": "crispr", "etag": "abc", "max_plates": 16}
+    _check_run(tmp_path, run)
+    assert (tmp_path / RUN_FILE).exists()
+    # Resuming the same run is allowed
+    _check_run(tmp_path, dict(run))
+
+    with pytest.raises(ValueError, match="another run"):
+        _check_run(tmp_path, {**run, "etag": "def"})
+
+
+def test_unrecorded_parts_are_refused(tmp_path):
+    (tmp_path / "part-0123.parquet").touch()
+    with pytest.raises(ValueError, match="unrecorded"):
+        _check_run(tmp_path, {"subset": "crispr"})
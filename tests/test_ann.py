@@ -0,0 +1,59 @@
+import numpy as np
+import polars as pl
+import pytest
+
+from jump_deps.ann import AnnIndex
+
+
+@pytest.fixture(scope="module")
+def index():
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=(3000, 16)).astype(np.float32)
+    features = [f"f{i}" for i in range(16)]
+    index = AnnIndex.train(x, features, n_lists=32, n_subspaces=8, n_iter=5)
+    for i in range(0, len(x), 700):
+        batch = x[i : i + 700]
+        index.add(
+            batch,
+            pl.DataFrame({
+                "row": np.arange(i, i + len(batch)),
+                "group": np.arange(i, i + len(batch)) % 10,
+            }),
+        )
+    index.finalise()
+    index.x = x
+    return index
+
+
+def test_add_sorts_codes_by_list(index):
+    assert index.offsets[-1] == len(index.codes) == index.metadata.height == 3000
+    assert sorted(index.ids) == list(range(3000))
+    lists, codes = index.encode(index.x[index.ids])
+    assert np.all(np.diff(lists) >= 0)
+    assert np.array_equal(codes, index.codes)
+
+
+def test_search_finds_exact_neighbours(index):
+    queries = index.x[:20]
+    result = index.search(queries, k=5, n_probe=len(index.centroids))
+    assert result.columns[:3] == ["query", "rank", "similarity"]
+    assert result.group_by("query").len().get_column("len").to_list() == [5] * 20
+
+    unit = index.x / np.linalg.norm(index.x, axis=1, keepdims=True)
+    exact = np.argsort(-(unit[:20] @ unit.T), axis=1)[:, :5]
+    found = result.sort("query", "rank").get_column("row").to_numpy().reshape(20, 5)
+    # Product quantization is lossy: most, not all, true neighbours are found
+    recall = np.mean([len(set(a) & set(b)) / 5 for a, b in zip(exact, found)])
+    assert recall > 0.5
+    assert (found[:, 0] == np.arange(20)).mean() > 0.9
+
+
+def test_filters_return_k_results(index):
+    result = index.search(index.x[:10], k=20, n_probe=1, filters={"group": [3]})
+    assert result.group_by("query").len().get_column("len").to_list() == [20] * 10
+    assert result.get_column("group").unique().to_list() == [3]
+    assert result.get_column("rank").max() == 20
+
+    # Fewer matching profiles than k: all of them are returned
+    result = index.search(index.x[:1], k=500, filters={"row": list(range(30))})
+    assert result.height == 30
@@ -0,0 +1,8 @@
+import pytest
+
+from jump_deps.annotate import get_translation
+
+
+def test_invalid_babel_columns():
+    with pytest.raises(ValueError, match="Invalid babel column"):
+        get_translation(("pert_type", "colour"))
@@ -0,0 +1,39 @@
+import polars as pl
+
+from jump_deps.benchmark import compare_benchmarks
+from jump_deps.synthetic import NEGCON_ID, synthetic_layout
+
+
+def test_synthetic_layout_uses_given_ids():
+    layout = synthetic_layout(
+        2000, n_sources=2, jcp_ids=["JCP2022_000001", "JCP2022_000002"]
+    )
+    assert set(layout.get_column("Metadata_JCP2022")) == {
+        NEGCON_ID,
+        "JCP2022_000001",
+        "JCP2022_000002",
+    }
+    assert (
+        synthetic_layout(2000)
+        .get_column("Metadata_JCP2022")
+        .str.starts_with("JCP2022_9")
+        .sum()
+        > 1500
+    )
+
+
+def test_regressions_are_flagged_on_stage_memory():
+    baseline = pl.DataFrame({
+        "stage": ["a", "b", "c"],
+        "seconds": [1.0, 1.0, 1.0],
+        "peak_rss_mb": [500.0, 500.0, 500.0],
+        "stage_rss_mb": [100.0, 100.0, 0.0],
+    })
+    current = baseline.with_columns(
+        seconds=pl.Series([1.1, 2.0, 1.0]),
+        # A larger process peak alone (e.g. heavier imports) is not flagged
+        peak_rss_mb=pl.Series([900.0, 500.0, 500.0]),
+        stage_rss_mb=pl.Series([110.0, 100.0, 0.5]),
+    )
+    result = compare_benchmarks(current, baseline)
+    assert result.get_column("regression").to_list() == [False, True, False]
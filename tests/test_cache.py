@@ -0,0 +1,95 @@
+import os
+
+import pytest
+from conftest import reply
+
+from jump_deps.cache import LRUDirectory, ProfileCache, download
+
+CONTENT = bytes(range(256)) * 16
+
+
+@pytest.fixture
+def origin(serve):
+    """Stub server for one file, answering conditional requests with 304."""
+    state = {"etag": '"v1"', "requests": []}
+
+    def respond(handler):
+        condition = handler.headers.get("If-None-Match")
+        state["requests"].append(condition)
+        if condition == state["etag"]:
+            reply(handler, status=304)
+        else:
+            reply(handler, CONTENT, headers={"ETag": state["etag"]})
+
+    state["url"] = f"{serve(respond)}/crispr.parquet"
+    return state
+
+
+def fill(files: LRUDirectory, names: list[str], size: int = 100) -> None:
+    """Add files of `size` bytes, the first name being the least recently used."""
+    for age, name in enumerate(reversed(names)):
+        path = files.root / name
+        path.write_bytes(b"x" * size)
+        os.utime(path, (1000 - age, 1000 - age))
+
+
+def test_lru_eviction(tmp_path):
+    files = LRUDirectory(tmp_path / "files", max_bytes=250)
+    fill(files, ["a", "b", "c"])
+    assert [p.name for p in files.entries()] == ["a", "b", "c"]
+
+    # Reading a file makes it the most recently used
+    files.get("a")
+    assert [p.name for p in files.evict()] == ["b"]
+    assert files.size() == 200
+
+    # The file just added survives, even when it is alone over the budget
+    src = tmp_path / "big"
+    src.write_bytes(b"x" * 300)
+    files.put("d", src)
+    assert [p.name for p in files.entries()] == ["d"]
+
+
+def test_evict_keeps_given_file(tmp_path):
+    files = LRUDirectory(tmp_path / "files", max_bytes=150)
+    fill(files, ["a", "b", "c"])
+    removed = files.evict(keep=files.root / "a")
+    assert [p.name for p in removed] == ["b", "c"]
+    assert [p.name for p in files.entries()] == ["a"]
+
+
+def test_download_once(origin, tmp_path):
+    files = LRUDirectory(tmp_path / "files")
+    path = download(origin["url"], files, "crispr.parquet")
+    assert path.read_bytes() == CONTENT
+    assert download(origin["url"], files, "crispr.parquet") == path
+    assert len(origin["requests"]) == 1
+    assert list(files.root.glob(".partial-*")) == []
+
+
+def test_warm_path_makes_no_request(origin, cache_dir):
+    manifest = [{"subset": "crispr", "url": origin["url"], "etag": origin["etag"]}]
+    cache = ProfileCache(manifest=manifest)
+    path = cache.path("crispr")
+    assert path.name == "crispr-v1.parquet"
+    assert path.read_bytes() == CONTENT
+    assert ProfileCache(manifest=manifest).path("crispr") == path
+    assert origin["requests"] == [None]
+    assert cache.cached().get_column("file").to_list() == ["crispr-v1.parquet"]
+
+
+def test_revalidate(origin):
+    manifest = [{"subset": "crispr", "url": origin["url"], "etag": origin["etag"]}]
+    cache = ProfileCache(manifest=manifest)
+    path = cache.path("crispr")
+
+    # An unchanged file is answered with 304 and the local copy is kept
+    assert cache.path("crispr", revalidate=True) == path
+    assert origin["requests"] == [None, '"v1"']
+
+    # A server that moved on to another release does not match the manifest
+    origin["etag"] = 'W/"v2"'
+    with pytest.raises(ValueError, match="ETag v2"):
+        cache.path("crispr", revalidate=True)
+    assert path.read_bytes() == CONTENT
+    assert list(cache.files.root.glob(".partial-*")) == []
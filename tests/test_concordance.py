@@ -0,0 +1,57 @@
+import numpy as np
+import polars as pl
+import pytest
+
+from jump_deps import concordance
+
+
+class Store:
+    """Consensus store with one perturbation per gene and modality."""
+
+    def __init__(self, profiles: np.ndarray):
+        self.profiles = profiles
+        self.positions = {f"JCP2022_{i:06d}": i for i in range(len(profiles))}
+
+    def matrix(self, statistic="median"):
+        return self.profiles
+
+
+@pytest.fixture
+def concordant(monkeypatch):
+    def setup(profiles: np.ndarray):
+        n_genes = len(profiles) // 2
+        genes = pl.DataFrame({
+            "gene": [f"G{i}" for i in range(n_genes)],
+            "crispr": [[f"JCP2022_{i:06d}"] for i in range(n_genes)],
+            "orf": [[f"JCP2022_{i + n_genes:06d}"] for i in range(n_genes)],
+        })
+        store = Store(profiles)
+        monkeypatch.setattr(concordance, "get_consensus", lambda *args: store)
+        monkeypatch.setattr(concordance, "gene_perturbations", lambda store: genes)
+
+    return setup
+
+
+def test_concordant_genes_rank_first(concordant):
+    rng = np.random.default_rng(0)
+    crispr = rng.normal(size=(30, 20)).astype(np.float32)
+    orf = rng.normal(size=(30, 20)).astype(np.float32)
+    orf[:3] = crispr[:3] + 0.1 * orf[:3]  # Concordant
+    orf[3] = -crispr[3]  # Opposite effects
+    concordant(np.concatenate([crispr, orf]))
+
+    table = concordance.gene_concordance(block_size=7)
+    assert set(table.head(4).get_column("gene")) == {"G0", "G1", "G2", "G3"}
+    assert table.filter(gene="G3").get_column("cosine_similarity")[0] < -0.99
+    assert table.get_column("p_value").min() == pytest.approx(1 / 59)
+
+
+def test_constant_null_and_too_few_genes(concordant):
+    concordant(np.ones((4, 5), np.float32))
+    table = concordance.gene_concordance()
+    assert table.get_column("null_std").to_list() == [0, 0]
+    assert table.get_column("z_score").is_nan().all()
+
+    concordant(np.ones((2, 5), np.float32))
+    with pytest.raises(ValueError, match="at least 2"):
+        concordance.gene_concordance()
@@ -0,0 +1,18 @@
+import numpy as np
+import pytest
+
+from jump_deps.correlation import correlation_matrix
+
+
+def test_correlation_matrix_methods():
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=(30, 12))
+    np.testing.assert_allclose(
+        correlation_matrix(x.copy(), "pearson", block_size=7), np.corrcoef(x), atol=1e-5
+    )
+    unit = x / np.linalg.norm(x, axis=1, keepdims=True)
+    np.testing.assert_allclose(
+        correlation_matrix(x.copy(), block_size=7), unit @ unit.T, atol=1e-5
+    )
+    with pytest.raises(ValueError, match="Unknown method"):
+        correlation_matrix(x, "spearman")
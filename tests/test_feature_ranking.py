@@ -0,0 +1,143 @@
+import numpy as np
+import polars as pl
+import pytest
+from scipy import stats
+
+from jump_deps import annotate, feature_ranking
+from jump_deps.feature_ranking import rank_features, top_rows
+from jump_deps.matrix import split_columns
+from jump_deps.synthetic import NEGCON_ID
+
+K = 3
+
+
+@pytest.fixture
+def babel(profiles_path, monkeypatch):
+    """Babel table of the synthetic perturbations, with one negative control."""
+    jcp_ids = pl.read_parquet(profiles_path).get_column("Metadata_JCP2022").unique()
+    table = pl.DataFrame({"JCP2022": jcp_ids}).select(
+        pl.format("gene_{}", "JCP2022").alias("standard_key"),
+        "JCP2022",
+        plate_type=pl.lit("crispr"),
+        NCBI_Gene_ID=pl.lit(None, pl.String),
+        broad_sample=pl.lit(None, pl.String),
+        pert_type=pl
+        .when(pl.col("JCP2022") == NEGCON_ID)
+        .then(pl.lit("negcon"))
+        .otherwise(pl.lit("trt")),
+    )
+    monkeypatch.setattr(annotate, "get_babel_table", lambda: table)
+    return table
+
+
+@pytest.fixture
+def in_process(monkeypatch):
+    """Score the plate groups in the test process, where the babel stub lives."""
+    monkeypatch.setattr(
+        feature_ranking,
+        "map_unordered",
+        lambda function, jobs, max_workers: (
+            (key, function(*args)) for key, args in jobs
+        ),
+    )
+
+
+def brute_force(profiles: pl.DataFrame, k: int) -> tuple[list[tuple], list[tuple]]:
+    """Welch tests and Benjamini-Hochberg correction, one treatment at a time."""
+    features = split_columns(profiles)[1]
+    jcp_ids = profiles.get_column("Metadata_JCP2022").to_numpy()
+    plates = profiles.get_column("Metadata_Plate").to_numpy()
+    matrix = profiles.select(features).to_numpy()
+    tested = []
+    for jcp_id in sorted(set(jcp_ids) - {NEGCON_ID}):
+        wells = jcp_ids == jcp_id
+        controls = (jcp_ids == NEGCON_ID) & np.isin(plates, plates[wells])
+        if wells.sum() < 2 or controls.sum() < 2:
+            continue
+        t, p = stats.ttest_ind(matrix[wells], matrix[controls], equal_var=False)
+        corrected = stats.false_discovery_control(p)
+        tested += [
+            (jcp_id, feature, t[i], p[i], corrected[i])
+            for i, feature in enumerate(features)
+        ]
+
+    def best(rows):
+        return sorted(rows, key=lambda x: (x[4], -abs(x[2])))[:k]
+
+    by_perturbation, by_feature = [], []
+    for jcp_id in {x[0] for x in tested}:
+        ranked = best(x for x in tested if x[0] == jcp_id)
+        by_perturbation += [(*x, rank) for rank, x in enumerate(ranked, 1)]
+    for feature in features:
+        ranked = best(x for x in tested if x[1] == feature)
+        by_feature += [(*x, rank) for rank, x in enumerate(ranked, 1)]
+    return by_perturbation, by_feature
+
+
+def assert_rows_equal(frame: pl.DataFrame, expected: list[tuple]) -> None:
+    rows = sorted(frame.rows())
+    expected = sorted(expected)
+    assert [(x[0], x[1], x[-1]) for x in rows] == [
+        (x[0], x[1], x[-1]) for x in expected
+    ]
+    for i in (2, 3, 4):
+        assert [x[i] for x in rows] == pytest.approx([x[i] for x in expected], rel=1e-4)
+
+
+def test_top_rows():
+    p = np.array([[0.1, np.nan], [0.01, 0.2], [0.1, 0.2], [np.nan, 0.3]])
+    t = np.array([[1.0, 5.0], [2.0, -1.0], [-3.0, 4.0], [9.0, 9.0]])
+    assert top_rows(p, t, 3).tolist() == [[1, 2], [2, 1], [0, 3]]
+    assert top_rows(p, t, 10).shape == (4, 2)
+
+
+def test_rank_features(manifest, profiles_path, babel, in_process, tmp_path):
+    output_dir = rank_features(
+        "crispr", tmp_path / "ranking", k=K, max_plates=3, manifest=manifest
+    )
+    by_perturbation, by_feature = brute_force(pl.read_parquet(profiles_path), K)
+    assert len(by_perturbation) > 1000 and len(by_feature) == 24 * K
+    keys = ["Metadata_JCP2022", "feature"]
+    statistics = ["t_statistic", "p_value", "corrected_p_value"]
+
+    features = pl.read_parquet(output_dir / "feature_ranking.parquet")
+    assert_rows_equal(
+        features.select(*keys, *statistics, "Feature Rank"), by_perturbation
+    )
+
+    genes = pl.read_parquet(output_dir / "gene_ranking.parquet")
+    assert_rows_equal(genes.select(*keys, *statistics, "Gene Rank"), by_feature)
+
+    # Every ranked pair once, with the rank it did not get set to 999999
+    ranking = pl.read_parquet(output_dir / "ranking.parquet")
+    feature_ranks = {x[:2]: x[-1] for x in by_perturbation}
+    gene_ranks = {x[:2]: x[-1] for x in by_feature}
+    pairs = sorted(feature_ranks.keys() | gene_ranks.keys())
+    assert sorted(ranking.select(keys).rows()) == pairs
+    assert sorted(ranking.select(*keys, "Feature Rank", "Gene Rank").rows()) == [
+        (*pair, feature_ranks.get(pair, 999999), gene_ranks.get(pair, 999999))
+        for pair in pairs
+    ]
+    expected = {x[:2]: x[2:5] for x in by_feature + by_perturbation}
+    for *pair, t, p, corrected in ranking.select(*keys, *statistics).rows():
+        assert (t, p, corrected) == pytest.approx(expected[tuple(pair)], rel=1e-4)
+    assert ranking.get_column("Perturbation").to_list() == [
+        f"gene_{x}" for x in ranking.get_column("Metadata_JCP2022")
+    ]
+
+
+def test_rank_features_without_controls(
+    manifest, babel, in_process, tmp_path, monkeypatch
+):
+    table = babel.with_columns(pert_type=pl.lit("trt"))
+    monkeypatch.setattr(annotate, "get_babel_table", lambda: table)
+    output_dir = rank_features("crispr", tmp_path / "ranking", manifest=manifest)
+    for name, rank in [
+        ("feature_ranking", "Feature Rank"),
+        ("gene_ranking", "Gene Rank"),
+        ("ranking", "Gene Rank"),
+    ]:
+        table = pl.read_parquet(output_dir / f"{name}.parquet")
+        assert table.is_empty()
+        assert table.schema["t_statistic"] == pl.Float32
+        assert table.schema[rank] == pl.Int64
@@ -0,0 +1,59 @@
+import numpy as np
+import polars as pl
+from scipy import stats
+
+from jump_deps.feature_stats import (
+    benjamini_hochberg,
+    compare_clusters,
+    compare_features,
+    mann_whitney_u,
+)
+
+
+def sample(rng, shape, shift=0.0):
+    # Rounded values, so that there are ties
+    return np.round(rng.normal(shift, size=shape), 1)
+
+
+def test_mann_whitney_u_matches_scipy():
+    rng = np.random.default_rng(0)
+    a, b = sample(rng, (40, 6), 0.3), sample(rng, (55, 6))
+    a[:, 5] = b[:, 5] = 1.0  # Constant feature
+    u, p = mann_whitney_u(a, b)
+    expected = stats.mannwhitneyu(a, b, method="asymptotic", axis=0)
+    np.testing.assert_allclose(u, expected.statistic)
+    np.testing.assert_allclose(p, expected.pvalue)
+
+
+def test_nans_are_dropped_per_feature():
+    rng = np.random.default_rng(1)
+    a, b = sample(rng, (30, 3), 0.5), sample(rng, (35, 3))
+    a[[1, 4], 0] = np.nan
+    b[7, 2] = np.nan
+    u, p = mann_whitney_u(a, b)
+    result = compare_features(a, b, ["x", "y", "z"])
+    for j in range(3):
+        x, y = a[:, j][~np.isnan(a[:, j])], b[:, j][~np.isnan(b[:, j])]
+        expected = stats.mannwhitneyu(x, y, method="asymptotic")
+        np.testing.assert_allclose([u[j], p[j]], [expected.statistic, expected.pvalue])
+        welch = stats.ttest_ind(x, y, equal_var=False)
+        np.testing.assert_allclose(result["t_p_value"][j], welch.pvalue)
+
+
+def test_benjamini_hochberg_keeps_nans():
+    p = np.array([0.01, np.nan, 0.04, 0.03])
+    np.testing.assert_allclose(
+        benjamini_hochberg(p), [0.03, np.nan, 0.04, 0.04], equal_nan=True
+    )
+
+
+def test_compare_clusters_pairs():
+    rng = np.random.default_rng(2)
+    profiles = pl.DataFrame({
+        "Metadata_Cluster": np.repeat(["a", "b", "c"], 20),
+        "Cells_AreaShape_Area": rng.normal(size=60),
+        "Nuclei_AreaShape_Area": rng.normal(size=60),
+    })
+    result = compare_clusters(profiles, "Metadata_Cluster")
+    assert result.height == 6
+    assert result.select("cluster_a", "cluster_b").unique().height == 3
@@ -0,0 +1,102 @@
+import base64
+import json
+from urllib.parse import parse_qs
+
+import numpy as np
+import polars as pl
+import pytest
+from conftest import read_body, reply
+
+from jump_deps.fingerprints import (
+    COMPOUND_VERSION,
+    INDEX_FILE,
+    N_WORDS,
+    FingerprintIndex,
+    PubChemClient,
+    build_fingerprint_index,
+    decode_fingerprint,
+    get_fingerprint_index,
+    popcount,
+)
+
+
+def encode(words: np.ndarray) -> str:
+    """Fingerprint2D of some packed words."""
+    bits = words.tobytes()[:111]
+    return base64.b64encode(b"\0\0\3q" + bits).decode()
+
+
+@pytest.fixture
+def words():
+    rng = np.random.default_rng(0)
+    x = rng.integers(0, 2**63, size=(200, N_WORDS), dtype=np.uint64)
+    # Keep each fingerprint sparse, with the 881 bits of PubChem
+    x &= rng.integers(0, 2**63, size=x.shape, dtype=np.uint64)
+    x[:, -1] &= np.uint64((1 << 49) - 1)
+    return x
+
+
+@pytest.fixture
+def pubchem(serve, words):
+    """Stub PUG REST knowing keys KEY0..KEY199 and rejecting malformed ones."""
+    state = {"batches": []}
+
+    def respond(handler):
+        keys = parse_qs(read_body(handler).decode())["inchikey"][0].split(",")
+        state["batches"].append(keys)
+        if any(not x.startswith("KEY") for x in keys):
+            reply(handler, b'{"Fault": {"Code": "PUGREST.BadRequest"}}', 400)
+            return
+        found = [
+            {
+                "CID": int(x[3:]),
+                "InChIKey": x,
+                "Fingerprint2D": encode(words[int(x[3:])]),
+            }
+            for x in keys
+            if int(x[3:]) < len(words)
+        ]
+        if not found:
+            reply(handler, b'{"Fault": {"Code": "PUGREST.NotFound"}}', 404)
+            return
+        reply(handler, json.dumps({"PropertyTable": {"Properties": found}}).encode())
+
+    state["url"] = serve(respond)
+    return state
+
+
+def test_decode_fingerprint(words):
+    assert np.array_equal(decode_fingerprint(encode(words[3])), words[3])
+
+
+def test_rejected_batches_are_bisected(pubchem):
+    client = PubChemClient(pubchem["url"], batch_size=8, rate=1000)
+    keys = [f"KEY{i}" for i in range(8)]
+    found = client.fingerprints([*keys[:5], "not a key", *keys[5:], "KEY999"])
+    assert found.get_column("query").to_list() == keys
+    assert pubchem["batches"][0] == [*keys[:5], "not a key", *keys[5:7]]
+
+
+def test_search_matches_brute_force(words):
+    index = FingerprintIndex(words, pl.DataFrame({"row": np.arange(len(words))}))
+    query = words[7]
+    shared = popcount(words & query)
+    tanimoto = shared / (popcount(words) + popcount(query) - shared)
+
+    result = index.search(query, k=5, threshold=0.3)
+    expected = np.sort(tanimoto[tanimoto >= 0.3])[::-1][:5]
+    assert result.get_column("row")[0] == 7
+    np.testing.assert_allclose(result.get_column("tanimoto"), expected)
+
+
+def test_index_is_cached_per_compound_version(pubchem, cache_dir):
+    compounds = pl.DataFrame({
+        "Metadata_JCP2022": [f"JCP2022_{i:06d}" for i in range(10)],
+        "Metadata_InChIKey": [f"KEY{i}" for i in range(10)],
+    })
+    path = cache_dir / "fingerprints" / COMPOUND_VERSION
+    index = build_fingerprint_index(
+        path, compounds, PubChemClient(pubchem["url"], rate=1000)
+    )
+    assert (path / INDEX_FILE).exists()
+    assert get_fingerprint_index().compounds.equals(index.compounds)
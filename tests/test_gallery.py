@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from jump_deps.gallery import _render_panel, panel_name, site_montage
+from jump_deps.images import ImageCache
+
+
+def test_site_montage_fills_missing_channels():
+    images = {"DNA": np.full((40, 60), 100, np.uint16)}
+    montage = site_montage(images, ("DNA", "AGP"), scale=4)
+    assert montage.shape == (10, 15 * 3, 3)
+    assert montage.dtype == np.uint8
+    # DNA is blue; AGP is missing and black
+    assert montage[:, :15].max(axis=(0, 1)).tolist() == [0, 0, 255]
+    assert not montage[:, 15:30].any()
+
+
+def test_site_montage_without_images():
+    assert not site_montage({}, ("DNA",), scale=2, shape=(8, 8)).any()
+    with pytest.raises(ValueError, match="explicit shape"):
+        site_montage({}, ("DNA",))
+
+
+def test_panel_names_do_not_collide():
+    assert panel_name("RAB30") == "RAB30"
+    names = {panel_name(x) for x in ("A/B", "A_B", "A B")}
+    assert len(names) == 3
+
+
+def test_render_panel_with_mixed_site_shapes(cache_dir, tmp_path):
+    from PIL import Image
+
+    sites = [
+        ("source_2", "batch", "plate_2", "A01", 1),
+        ("source_9", "batch", "plate_9", "A01", 1),
+    ]
+    cache = ImageCache(cache_dir=cache_dir)
+    for site, shape in zip(sites, [(40, 40), (24, 32)]):
+        for channel in ("DNA", "RNA"):
+            tmp = cache.files.tempfile()
+            with open(tmp, "wb") as f:
+                np.save(f, np.ones(shape, np.uint16))
+            cache.files.put(cache.filename(site, channel), tmp)
+
+    path = _render_panel(
+        tmp_path / "panel.png",
+        sites,
+        ["trt", "negcon"],
+        ("DNA", "RNA"),
+        99.5,
+        4,
+        {"cache_dir": cache_dir},
+    )
+    panel = np.asarray(Image.open(path))
+    assert panel.shape == (10 + 6, 10 * 3, 3)
+    # The narrower row is padded with black
+    assert not panel[10:, 8 * 3 :].any()
@@ -0,0 +1,101 @@
+from io import BytesIO
+
+import numpy as np
+import polars as pl
+import pytest
+
+from jump_deps.images import CHANNELS, ImageCache, get_site_images, site_uris
+
+SITES = [
+    ("source_1", "batch", "plate", "A01", 1),
+    ("source_1", "batch", "plate", "A01", 2),
+]
+
+
+class StubS3:
+    """S3 client serving one small .npy array per key, counting requests."""
+
+    def __init__(self):
+        self.keys = []
+
+    def get_object(self, Bucket, Key):
+        self.keys.append(Key)
+        image = np.full((8, 8), len(Key), dtype=np.float32)
+        buffer = BytesIO()
+        np.save(buffer, image)
+        return {"Body": BytesIO(buffer.getvalue())}
+
+
+@pytest.fixture
+def index_file(tmp_path):
+    """Image index with the two sites, the site number stored as a string."""
+    path = tmp_path / "index.parquet"
+    pl.DataFrame({
+        "Metadata_Source": ["source_1"] * 2,
+        "Metadata_Batch": ["batch"] * 2,
+        "Metadata_Plate": ["plate"] * 2,
+        "Metadata_Well": ["A01"] * 2,
+        "Metadata_Site": ["1", "2"],
+        **{
+            f"URL_Orig{channel}": [
+                f"s3://cellpainting-gallery/plate/A01-{site}-{channel}.npy"
+                for site in (1, 2)
+            ]
+            for channel in CHANNELS
+        },
+    }).write_parquet(path)
+    return path
+
+
+def test_site_uris(index_file):
+    uris = site_uris(
+        [SITES[1], ("source_1", "batch", "plate", "B01", 1)], ("DNA", "RNA"), index_file
+    )
+    assert uris.sort("Metadata_Channel").rows() == [
+        (*SITES[1], "DNA", "s3://cellpainting-gallery/plate/A01-2-DNA.npy"),
+        (*SITES[1], "RNA", "s3://cellpainting-gallery/plate/A01-2-RNA.npy"),
+    ]
+
+
+def test_get_fetches_only_missing_channels(index_file, cache_dir):
+    client = StubS3()
+    cache = ImageCache(cache_dir=cache_dir, client=client, index_file=index_file)
+    images = cache.get(SITES[:1], ("DNA", "RNA"))
+    assert sorted(images[SITES[0]]) == ["DNA", "RNA"]
+    assert sorted(client.keys) == ["plate/A01-1-DNA.npy", "plate/A01-1-RNA.npy"]
+
+    # Cached channels are served locally, only the new one is downloaded
+    client.keys.clear()
+    images = cache.get(
+        [("source_1", "batch", "plate", "A01", "1")], ("DNA", "ER", "RNA")
+    )
+    assert sorted(images[SITES[0]]) == ["DNA", "ER", "RNA"]
+    assert client.keys == ["plate/A01-1-ER.npy"]
+    assert np.array_equal(images[SITES[0]]["DNA"], np.full((8, 8), 19, np.float32))
+
+    # A warm call does not query the index nor S3
+    client.keys.clear()
+    cache.index_file = "missing.parquet"
+    assert sorted(cache.get(SITES[:1], ("DNA", "ER"))[SITES[0]]) == ["DNA", "ER"]
+    assert client.keys == []
+
+
+def test_get_site_images(index_file, cache_dir):
+    images = get_site_images(
+        *SITES[1], cache_dir=cache_dir, client=StubS3(), index_file=index_file
+    )
+    assert list(images) == list(CHANNELS)
+
+
+def test_get_evicts_to_budget(index_file, cache_dir):
+    client = StubS3()
+    cache = ImageCache(cache_dir=cache_dir, client=client, index_file=index_file)
+    cache.get(SITES[:1], CHANNELS)
+    size = cache.files.size() // len(CHANNELS)
+
+    # Room for three images: the oldest ones are evicted after each call
+    cache.files.max_bytes = 3 * size
+    images = cache.get(SITES, CHANNELS)
+    assert all(len(images[site]) == len(CHANNELS) for site in SITES)
+    assert cache.files.size() <= cache.files.max_bytes
+    assert len(cache.files.entries()) == 3
@@ -0,0 +1,28 @@
+import pytest
+
+from jump_deps.io_trace import record_lookup, record_request, trace_io
+from jump_deps.remote import fetch_range
+
+
+def test_events_are_attributed_to_queries(serve_bytes):
+    url, _ = serve_bytes(bytes(1000))
+    record_request("ignored", 10, 0.1)
+    with trace_io() as trace:
+        with trace.query("first"):
+            fetch_range(url, 0, 99)
+            fetch_range(url, 100, 199)
+            record_lookup("profiles", True)
+            record_lookup("profiles", False)
+        record_request("other", 50, 0.002, file_size=100)
+
+    summary = {row["query"]: row for row in trace.summary().to_dicts()}
+    assert set(summary) == {"first", "(none)"}
+    assert summary["first"]["requests"] == 2
+    assert summary["first"]["bytes_fetched"] == 200
+    assert summary["first"]["file_bytes"] == 1000
+    assert summary["first"]["fetched_fraction"] == pytest.approx(0.2)
+    assert summary["first"]["cache_hit_rate"] == 0.5
+    assert summary["(none)"]["fetched_fraction"] == 0.5
+
+    histogram = trace.latency_histogram()
+    assert histogram.get_column("requests").sum() == 3
@@ -0,0 +1,31 @@
+import polars as pl
+
+from jump_deps.layout import LayoutIndex
+
+
+def make_index() -> LayoutIndex:
+    return LayoutIndex(
+        pl.DataFrame({
+            "Metadata_Source": ["source_1"] * 6,
+            "Metadata_Plate": ["P1", "P1", "P1", "P2", "P2", "P3"],
+            "Metadata_Well": ["A01", "A02", "A03", "A01", "A02", "A01"],
+            "Metadata_JCP2022": ["G1", "C1", "C2", "G1", "C2", "C1"],
+            "pert_type": ["trt", "negcon", "negcon", "trt", "negcon", "negcon"],
+        })
+    )
+
+
+def test_matched_controls():
+    index = make_index()
+    assert index.matched_controls(["G1"]) == (["P1", "P2"], ["C1", "C2"])
+    assert index.matched_controls(["G1"], controls=["C1"]) == (["P1", "P2"], ["C1"])
+    assert index.control_wells(["P2"], controls=["C1"]).is_empty()
+
+
+def test_save_leaves_no_partial_file(tmp_path):
+    index = make_index()
+    path = tmp_path / "layout.parquet"
+    index.save(path)
+    index.save(path)
+    assert [x.name for x in tmp_path.iterdir()] == ["layout.parquet"]
+    assert LayoutIndex.load(path).wells.equals(index.wells)
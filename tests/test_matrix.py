@@ -0,0 +1,38 @@
+import numpy as np
+import polars as pl
+
+from jump_deps.matrix import copairs_inputs, feature_matrix, split_columns
+
+
+def test_split_columns_treats_strings_as_metadata(profiles_path):
+    profiles = pl.scan_parquet(profiles_path).with_columns(pert_type=pl.lit("trt"))
+    metadata, features = split_columns(profiles)
+    assert metadata[:4] == [
+        "Metadata_Source",
+        "Metadata_Plate",
+        "Metadata_Well",
+        "Metadata_JCP2022",
+    ]
+    assert "pert_type" in metadata
+    assert len(features) == 24
+
+
+def test_feature_matrix_and_copairs_inputs(profiles_path):
+    profiles = pl.read_parquet(profiles_path).head(50)
+    profiles = profiles.with_columns(
+        pl
+        .when(pl.int_range(pl.len()) == 0)
+        .then(None)
+        .otherwise(pl.col("^Cells_.*$"))
+        .name.keep()
+    )
+    matrix = feature_matrix(profiles)
+    assert matrix.dtype == np.float32
+    assert matrix.flags.c_contiguous
+    assert matrix.shape == (50, 24)
+    assert np.isnan(matrix[0]).any()
+
+    meta, features = copairs_inputs(profiles, dtype=np.float64)
+    assert list(meta.columns) == split_columns(profiles)[0]
+    assert str(meta["Metadata_Plate"].dtype) == "category"
+    assert features.dtype == np.float64
@@ -0,0 +1,139 @@
+import hashlib
+import importlib.util
+import json
+from pathlib import Path
+
+import boto3
+import pytest
+from conftest import reply
+from moto import mock_aws
+
+SCRIPT = Path(__file__).parents[1] / "tools" / "mirror_zenodo_to_cpg.py"
+BUCKET = "cellpainting-gallery"
+PREFIX = "jump_rr"
+PART_SIZE = 5 << 20  # Smallest part S3 accepts
+CONTENT = bytes(range(256)) * (12 << 12)  # 12 MiB, three parts
+
+
+@pytest.fixture
+def mirror(monkeypatch):
+    spec = importlib.util.spec_from_file_location("mirror_zenodo_to_cpg", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    for name, value in {
+        "S3_BUCKET": BUCKET,
+        "S3_PREFIX": PREFIX,
+        "PART_SIZE": PART_SIZE,
+        "PARTS_IN_FLIGHT": 2,
+        "AWS_PROFILE_NAME": "",
+    }.items():
+        monkeypatch.setattr(module, name, value)
+    return module
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    for key in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+        monkeypatch.setenv(key, "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+@pytest.fixture
+def zenodo(serve, mirror, monkeypatch):
+    """Stub Zenodo with one record; `md5` can be changed to corrupt it."""
+    state = {"md5": hashlib.md5(CONTENT).hexdigest(), "downloads": 0}
+
+    def respond(handler):
+        if handler.path.endswith("/versions/latest"):
+            file = {
+                "key": "crispr.parquet",
+                "size": len(CONTENT),
+                "checksum": f"md5:{state['md5']}",
+                "links": {"self": f"{state['url']}/files/crispr.parquet/content"},
+            }
+            record = {
+                "id": 42,
+                "files": [file],
+                "metadata": {"publication_date": "2026-01-01"},
+            }
+            reply(handler, json.dumps(record).encode())
+        else:
+            state["downloads"] += 1
+            reply(handler, CONTENT)
+
+    state["url"] = serve(respond)
+    monkeypatch.setattr(mirror, "ZENODO_URL", state["url"])
+    return state
+
+
+def record_file(mirror, zenodo) -> dict:
+    return mirror.latest_record("1", mirror.requests.Session())["files"][0]
+
+
+def test_mirror_then_skip(mirror, s3, zenodo):
+    mirror.main()
+    for key in (
+        f"{PREFIX}/42/crispr.parquet/content",
+        f"{PREFIX}/latest/crispr.parquet/content",
+    ):
+        obj = s3.get_object(Bucket=BUCKET, Key=key)
+        assert obj["Body"].read() == CONTENT
+        assert obj["Metadata"] == {
+            "zenodo-md5": zenodo["md5"],
+            "zenodo-record-id": "42",
+        }
+
+    assert mirror.mirror_file(s3, record_file(mirror, zenodo), "42") == "skipped"
+    assert zenodo["downloads"] == 1
+
+
+def test_resume_pending_upload(mirror, s3, zenodo):
+    key = f"{PREFIX}/42/crispr.parquet/content"
+    upload_id = s3.create_multipart_upload(Bucket=BUCKET, Key=key)["UploadId"]
+    s3.upload_part(
+        Bucket=BUCKET,
+        Key=key,
+        UploadId=upload_id,
+        PartNumber=1,
+        Body=CONTENT[:PART_SIZE],
+    )
+
+    sent = mirror.stream_upload(
+        s3,
+        mirror.requests.Session(),
+        record_file(mirror, zenodo)["links"]["self"],
+        key,
+        zenodo["md5"],
+        {"zenodo-md5": zenodo["md5"]},
+    )
+    assert sent == 2
+    assert s3.get_object(Bucket=BUCKET, Key=key)["Body"].read() == CONTENT
+    assert s3.list_multipart_uploads(Bucket=BUCKET).get("Uploads", []) == []
+
+
+def test_md5_mismatch_aborts(mirror, s3, zenodo):
+    zenodo["md5"] = "0" * 32
+    with pytest.raises(ValueError, match="MD5"):
+        mirror.mirror_file(s3, record_file(mirror, zenodo), "42")
+    assert s3.list_multipart_uploads(Bucket=BUCKET).get("Uploads", []) == []
+    assert s3.list_objects_v2(Bucket=BUCKET).get("Contents", []) == []
+
+
+def test_dry_run_checks_existing_objects(mirror, s3, zenodo, monkeypatch):
+    monkeypatch.setattr(mirror, "DRY_RUN", True)
+    file = record_file(mirror, zenodo)
+    assert mirror.mirror_file(s3, file, "42") == "uploaded"
+    assert s3.list_objects_v2(Bucket=BUCKET).get("Contents", []) == []
+
+    s3.put_object(
+        Bucket=BUCKET,
+        Key=f"{PREFIX}/42/crispr.parquet/content",
+        Body=CONTENT,
+        Metadata={"zenodo-md5": zenodo["md5"]},
+    )
+    assert mirror.mirror_file(s3, file, "42") == "skipped"
+    assert zenodo["downloads"] == 0
@@ -0,0 +1,89 @@
+import json
+import time
+from urllib.parse import parse_qs
+
+import pytest
+import requests
+from conftest import read_body, reply
+
+from jump_deps import ncbi
+from jump_deps.ncbi import GeneSummaryCache, TokenBucket
+
+
+@pytest.fixture
+def esummary(serve):
+    """Stub E-utilities answering esummary for any id, after some failures."""
+    state = {"batches": [], "times": [], "failures": []}
+
+    def respond(handler):
+        state["times"].append(time.monotonic())
+        body = read_body(handler)
+        if state["failures"]:
+            reply(handler, b"busy", state["failures"].pop(0))
+            return
+        ids = parse_qs(body.decode())["id"][0].split(",")
+        state["batches"].append(ids)
+        result = {"uids": ids, **{x: {"name": f"GENE{x}"} for x in ids}}
+        reply(handler, json.dumps({"result": result}).encode())
+
+    state["url"] = serve(respond)
+    return state
+
+
+def test_batches_of_200(esummary, tmp_path):
+    cache = GeneSummaryCache(tmp_path / "genes.sqlite", base_url=esummary["url"])
+    documents = cache.get(range(1, 451))
+    assert len(documents) == 450
+    assert [len(x) for x in esummary["batches"]] == [200, 200, 50]
+    assert documents[7] == {"name": "GENE7"}
+
+
+def test_requests_are_paced(esummary, tmp_path):
+    cache = GeneSummaryCache(
+        tmp_path / "genes.sqlite", base_url=esummary["url"], batch_size=1
+    )
+    cache.bucket = TokenBucket(rate=20)
+    cache.get(range(1, 6))
+    gaps = [b - a for a, b in zip(esummary["times"], esummary["times"][1:])]
+    assert len(gaps) == 4
+    assert min(gaps) >= 0.04
+
+
+def test_token_bucket_allows_burst_then_waits():
+    bucket = TokenBucket(rate=50, capacity=3)
+    start = time.monotonic()
+    for _ in range(3):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.02
+    for _ in range(5):
+        bucket.acquire()
+    assert time.monotonic() - start >= 0.09
+
+
+def test_retries_on_429_and_5xx(esummary, tmp_path, monkeypatch):
+    monkeypatch.setattr(ncbi.time, "sleep", lambda seconds: None)
+    esummary["failures"] += [429, 503]
+    cache = GeneSummaryCache(tmp_path / "genes.sqlite", base_url=esummary["url"])
+    assert set(cache.get([1, 2])) == {1, 2}
+    assert len(esummary["times"]) == 3
+
+
+def test_gives_up_after_max_retries(esummary, tmp_path, monkeypatch):
+    monkeypatch.setattr(ncbi.time, "sleep", lambda seconds: None)
+    esummary["failures"] += [500, 500]
+    cache = GeneSummaryCache(
+        tmp_path / "genes.sqlite", base_url=esummary["url"], max_retries=2
+    )
+    with pytest.raises(requests.HTTPError, match="500"):
+        cache.get([1])
+
+
+def test_cached_documents_skip_the_network(esummary, tmp_path):
+    path = tmp_path / "genes.sqlite"
+    GeneSummaryCache(path, base_url=esummary["url"]).get([1, 2, 3])
+    assert len(esummary["batches"]) == 1
+
+    # A new instance reads the same database and only asks for the new gene
+    documents = GeneSummaryCache(path, base_url=esummary["url"]).get([2, 3, 4])
+    assert set(documents) == {2, 3, 4}
+    assert esummary["batches"][1:] == [["4"]]
@@ -0,0 +1,124 @@
+import numpy as np
+import polars as pl
+import pytest
+
+from jump_deps import annotate, neighbours
+from jump_deps.neighbours import (
+    build_neighbour_index,
+    get_neighbour_index,
+    nearest_neighbours,
+    top_k,
+)
+
+COLUMNS = ["query", "kind", "rank", "neighbour", "distance"]
+LABELS = [f"JCP2022_{i:06d}" for i in range(12)]
+
+
+@pytest.fixture(scope="module")
+def distances() -> np.ndarray:
+    rng = np.random.default_rng(0)
+    x = rng.uniform(0, 2, (len(LABELS), len(LABELS)))
+    x = (x + x.T) / 2
+    np.fill_diagonal(x, 0)
+    x[3, 5] = x[5, 3] = np.nan
+    return x
+
+
+@pytest.fixture
+def matrix_path(tmp_path, distances):
+    path = tmp_path / "crispr_cosinesim_full.parquet"
+    pl.DataFrame(distances, schema=LABELS).write_parquet(path)
+    return path
+
+
+def brute_force(distances: np.ndarray, k: int) -> list[tuple]:
+    rows = []
+    for i, query in enumerate(LABELS):
+        values = {
+            j: d for j, d in enumerate(distances[i]) if j != i and not np.isnan(d)
+        }
+        for kind, reverse in zip(neighbours.KINDS, (False, True)):
+            ranked = sorted(values, key=values.get, reverse=reverse)[:k]
+            rows += [
+                (query, kind, rank, LABELS[j], values[j])
+                for rank, j in enumerate(ranked, 1)
+            ]
+    return sorted(rows)
+
+
+def assert_rows_equal(frame: pl.DataFrame, expected: list[tuple]) -> None:
+    rows = sorted(frame.select(COLUMNS).rows())
+    assert [x[:-1] for x in rows] == [x[:-1] for x in expected]
+    assert [x[-1] for x in rows] == pytest.approx([x[-1] for x in expected])
+
+
+def test_top_k_skips_diagonal_and_nans(distances):
+    block = distances[2:6].copy()
+    closest, farthest = top_k(block, 3, offset=2)
+    for row, i in enumerate(range(2, 6)):
+        values = np.where(np.arange(len(LABELS)) == i, np.nan, distances[i])
+        order = np.argsort(np.nan_to_num(values, nan=np.inf))
+        assert closest[row].tolist() == order[:3].tolist()
+        order = np.argsort(-np.nan_to_num(values, nan=-np.inf))
+        assert farthest[row].tolist() == order[:3].tolist()
+    assert 5 not in closest[1] and 5 not in farthest[1]
+    # The block is left untouched
+    assert np.array_equal(block, distances[2:6], equal_nan=True)
+
+
+def test_build_neighbour_index(matrix_path, distances):
+    index = build_neighbour_index(matrix_path, k=4, batch_size=5)
+    assert index.columns == COLUMNS
+    assert_rows_equal(index, brute_force(distances, 4))
+
+
+def test_get_neighbour_index_is_reused_offline(
+    matrix_path, serve_bytes, cache_dir, monkeypatch
+):
+    url, _ = serve_bytes(matrix_path.read_bytes())
+    monkeypatch.setattr(neighbours, "zenodo_url", lambda filename, record: (url, "7"))
+    path = get_neighbour_index(matrix_path.name, k=3)
+    assert path.name == "crispr_cosinesim_full-7-k3.neighbours.parquet"
+
+    def offline(filename, record):
+        raise AssertionError("Zenodo was contacted")
+
+    monkeypatch.setattr(neighbours, "zenodo_url", offline)
+    assert get_neighbour_index(matrix_path.name, k=3) == path
+
+    # A refresh follows a new version
+    monkeypatch.setattr(neighbours, "zenodo_url", lambda filename, record: (url, "8"))
+    newer = get_neighbour_index(matrix_path.name, k=3, refresh=True)
+    assert newer.name == "crispr_cosinesim_full-8-k3.neighbours.parquet"
+    assert pl.read_parquet(newer).equals(pl.read_parquet(path))
+    monkeypatch.setattr(neighbours, "zenodo_url", offline)
+    assert get_neighbour_index(matrix_path.name, k=3) == newer
+
+
+def test_nearest_neighbours_by_symbol(matrix_path, serve_bytes, distances, monkeypatch):
+    # One gene with two guides in the matrix and an ORF in another matrix
+    babel = pl.DataFrame(
+        {
+            "standard_key": ["GENE1", "GENE1", "GENE1", "GENE2"],
+            "JCP2022": ["JCP2022_900000", LABELS[1], LABELS[4], LABELS[2]],
+            "plate_type": ["orf", "crispr", "crispr", "crispr"],
+            "NCBI_Gene_ID": None,
+            "broad_sample": None,
+            "pert_type": "trt",
+        },
+        schema_overrides={"NCBI_Gene_ID": pl.String, "broad_sample": pl.String},
+    )
+    monkeypatch.setattr(annotate, "get_babel_table", lambda: babel)
+    monkeypatch.setattr(neighbours, "get_babel_table", lambda: babel)
+    url, _ = serve_bytes(matrix_path.read_bytes())
+    monkeypatch.setattr(neighbours, "zenodo_url", lambda filename, record: (url, "7"))
+
+    result = nearest_neighbours(["GENE1"], matrix_path.name, n=2, k=3)
+    assert sorted(set(result.get_column("query"))) == [LABELS[1], LABELS[4]]
+    assert set(result.get_column("query_name")) == {"GENE1"}
+    assert result.height == 2 * 2 * 2
+    queries = {LABELS[1], LABELS[4]}
+    assert_rows_equal(result, [x for x in brute_force(distances, 2) if x[0] in queries])
+
+    with pytest.raises(ValueError, match="Only 3 neighbours"):
+        nearest_neighbours(["GENE1"], matrix_path.name, n=5, k=3)
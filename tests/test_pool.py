@@ -0,0 +1,16 @@
+import math
+
+import pytest
+
+from jump_deps.pool import map_unordered
+
+
+def test_map_unordered_returns_every_result():
+    jobs = ((n, (n,)) for n in range(12))
+    results = dict(map_unordered(math.factorial, jobs, max_workers=2))
+    assert results == {n: math.factorial(n) for n in range(12)}
+
+
+def test_map_unordered_raises_job_errors():
+    with pytest.raises(ValueError):
+        list(map_unordered(math.factorial, [("bad", (-1,))], max_workers=1))
@@ -0,0 +1,116 @@
+import polars as pl
+import pytest
+
+from jump_deps.remote import (
+    RangeFile,
+    coalesce_ranges,
+    fetch_range,
+    fetch_ranges,
+    open_parquet,
+    read_footer,
+    read_parquet,
+)
+
+CONTENT = bytes(range(256)) * 64
+
+
+def test_coalesce_ranges():
+    ranges = [(50, 60), (0, 10), (12, 20), (15, 30), (100, 110)]
+    assert coalesce_ranges(ranges, max_gap=2) == [(0, 30), (50, 60), (100, 110)]
+    assert coalesce_ranges(ranges, max_gap=39) == [(0, 60), (100, 110)]
+    assert coalesce_ranges([], max_gap=2) == []
+
+
+@pytest.mark.parametrize("honour_range", [True, False])
+def test_fetch_range(serve_bytes, honour_range):
+    url, _ = serve_bytes(CONTENT, honour_range)
+    assert fetch_range(url, 10, 19) == (CONTENT[10:20], len(CONTENT))
+    assert fetch_range(url, -5) == (CONTENT[-5:], len(CONTENT))
+    assert fetch_range(url, len(CONTENT) - 3)[0] == CONTENT[-3:]
+
+
+def test_fetch_ranges_coalesces_close_ranges(serve_bytes):
+    url, requested = serve_bytes(CONTENT)
+    blocks = fetch_ranges(url, [(0, 100), (150, 200), (5000, 5100)], max_gap=64)
+    assert blocks == {0: CONTENT[:200], 5000: CONTENT[5000:5100]}
+    assert sorted(requested) == ["bytes=0-199", "bytes=5000-5099"]
+
+
+def test_fetch_ranges_splits_large_spans(serve_bytes):
+    url, requested = serve_bytes(CONTENT)
+    blocks = fetch_ranges(url, [(0, 1000)], max_request=300)
+    assert blocks == {0: CONTENT[:1000]}
+    assert len(requested) == 4
+
+
+def test_fetch_ranges_without_range_support(serve_bytes):
+    url, _ = serve_bytes(CONTENT, honour_range=False)
+    blocks = fetch_ranges(url, [(10, 20), (4000, 4096)], max_gap=0, max_request=50)
+    assert blocks == {10: CONTENT[10:20], 4000: CONTENT[4000:4096]}
+
+
+def test_range_file_reads_across_blocks(serve_bytes):
+    url, requested = serve_bytes(CONTENT)
+    source = RangeFile(url, size=len(CONTENT))
+    source.prefetch([(100, 200), (300, 400)], max_gap=0)
+    requested.clear()
+
+    # Inside one block: no request
+    source.seek(120)
+    assert source.read(50) == CONTENT[120:170]
+    assert requested == []
+
+    # Across both blocks: only the gap between them is fetched
+    source.seek(150)
+    assert source.read(200) == CONTENT[150:350]
+    assert requested == ["bytes=200-299"]
+
+    # Past the end of the last block
+    requested.clear()
+    source.seek(390)
+    assert source.read(20) == CONTENT[390:410]
+    assert requested == ["bytes=400-409"]
+
+    # Reads stop at the end of the file
+    source.seek(-4, 2)
+    assert source.read(100) == CONTENT[-4:]
+
+
+def test_range_file_without_range_support(serve_bytes):
+    url, _ = serve_bytes(CONTENT, honour_range=False)
+    source = RangeFile(url)
+    assert source.size == len(CONTENT)
+    source.prefetch([(0, 10)])
+    source.seek(5)
+    assert source.read(20) == CONTENT[5:25]
+
+
+@pytest.mark.parametrize("honour_range", [True, False])
+def test_read_parquet_matches_local(serve_bytes, profiles_path, honour_range):
+    url, requested = serve_bytes(profiles_path.read_bytes(), honour_range)
+    columns = ["Metadata_JCP2022", "Cells_AreaShape_Area", "Nuclei_AreaShape_Area"]
+
+    remote = read_parquet(url, columns=columns, row_groups=[1, 4])
+    local = read_parquet(profiles_path, columns=columns, row_groups=[1, 4])
+    assert remote.columns == columns
+    assert remote.equals(local)
+    if honour_range:
+        # Footer, file size and a few coalesced spans, not one per chunk
+        assert len(requested) <= 4
+
+
+def test_open_parquet_prefetches_requested_chunks(serve_bytes, profiles_path):
+    url, requested = serve_bytes(profiles_path.read_bytes())
+    metadata, _ = read_footer(url)
+    assert metadata.num_row_groups == 6
+
+    pf = open_parquet(url, row_groups=[2], columns=["Cells_AreaShape_Area"])
+    n_prefetch = len(requested)
+    table = pf.read_row_group(2, columns=["Metadata_Plate", "Cells_AreaShape_Area"])
+    assert len(requested) == n_prefetch
+    assert pl.from_arrow(table).equals(
+        pl
+        .read_parquet(profiles_path)
+        .slice(2000, 1000)
+        .select("Metadata_Plate", "Cells_AreaShape_Area")
+    )
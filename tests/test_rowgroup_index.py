@@ -0,0 +1,55 @@
+import polars as pl
+import pytest
+
+from jump_deps.rowgroup_index import get_rowgroup_index, read_perturbations
+
+
+def test_index_lookup(manifest, profiles_path, cache_dir):
+    index = get_rowgroup_index("crispr", manifest)
+    profiles = pl.read_parquet(profiles_path)
+    assert index.values().to_list() == (
+        profiles.get_column("Metadata_JCP2022").unique().sort().to_list()
+    )
+    # The index is stored atomically and reused
+    assert [p.name for p in (cache_dir / "indices").iterdir()] == [
+        "crispr-synthetic-1.rowgroups.parquet"
+    ]
+    reloaded = get_rowgroup_index("crispr", manifest)
+    assert reloaded.keys.equals(index.keys)
+    assert reloaded.row_groups.equals(index.row_groups)
+
+
+def test_read_perturbations(manifest, profiles_path):
+    profiles = pl.read_parquet(profiles_path)
+    jcp_ids = profiles.get_column("Metadata_JCP2022").unique().sort()[5:8].to_list()
+    plate = profiles.get_column("Metadata_Plate")[0]
+    expected = profiles.filter(
+        pl.col("Metadata_JCP2022").is_in(jcp_ids) | (pl.col("Metadata_Plate") == plate)
+    )
+
+    # Generators are consumed once only
+    data = read_perturbations(
+        "crispr", (x for x in jcp_ids), iter([plate]), None, manifest
+    )
+    assert data.sort("Metadata_Plate", "Metadata_Well").equals(
+        expected.sort("Metadata_Plate", "Metadata_Well")
+    )
+
+    columns = ["Cells_AreaShape_Area"]
+    data = read_perturbations("crispr", jcp_ids, columns=columns, manifest=manifest)
+    assert data.columns == ["Metadata_JCP2022", "Metadata_Plate", *columns]
+    assert set(data.get_column("Metadata_JCP2022")) == set(jcp_ids)
+
+
+def test_read_perturbations_without_matches(manifest):
+    data = read_perturbations(
+        "crispr",
+        ["JCP2022_UNKNOWN"],
+        columns=["Cells_AreaShape_Area"],
+        manifest=manifest,
+    )
+    assert data.height == 0
+    assert "Cells_AreaShape_Area" in data.columns
+
+    with pytest.raises(ValueError, match="jcp_ids or plates"):
+        read_perturbations("crispr", manifest=manifest)
@@ -0,0 +1,39 @@
+import numpy as np
+import polars as pl
+import pytest
+
+from jump_deps.consensus import consensus_frame, get_consensus
+from jump_deps.similarity import build_similarity_store
+
+
+def test_consensus_matches_group_medians(manifest, profiles_path):
+    store = get_consensus("crispr", manifest=manifest)
+    expected = consensus_frame(pl.scan_parquet(profiles_path))
+    assert store.index.get_column("Metadata_JCP2022").equals(
+        expected.get_column("Metadata_JCP2022")
+    )
+    np.testing.assert_allclose(
+        store.matrix("median"), expected.select(store.features).to_numpy(), rtol=1e-5
+    )
+    with pytest.raises(ValueError, match="Unknown statistic"):
+        store.matrix("mode")
+
+
+def test_similarity_store_from_consensus(manifest, tmp_path):
+    consensus = get_consensus("crispr", manifest=manifest)
+    store = build_similarity_store(
+        consensus, tmp_path / "similarity", dtype=np.float32, block_size=7
+    )
+    features = np.array(consensus.matrix("median"), dtype=np.float64)
+    features /= np.linalg.norm(features, axis=1, keepdims=True)
+    np.testing.assert_allclose(store.matrix, features @ features.T, atol=1e-5)
+
+    labels = consensus.index.get_column("Metadata_JCP2022").to_list()[:3]
+    sub = store.submatrix(labels)
+    assert sub.columns == ["Metadata_JCP2022", *labels]
+
+
+def test_similarity_store_requires_unique_labels(tmp_path):
+    profiles = pl.DataFrame({"Metadata_JCP2022": ["a", "a"], "x": [1.0, 2.0]})
+    with pytest.raises(ValueError, match="one profile per row"):
+        build_similarity_store(profiles, tmp_path)
@@ -0,0 +1,24 @@
+from jump_deps.stats import dataset_statistics, footer_statistics, row_group_layout
+
+
+def test_footer_statistics(profiles_path, serve_bytes):
+    stats = footer_statistics(profiles_path)
+    assert stats["#rows"] == 6000
+    assert stats["#Metadata cols"] == 4
+    assert stats["#Feature cols"] == 24
+    assert stats["#row groups"] == 6
+
+    url, requested = serve_bytes(profiles_path.read_bytes())
+    assert footer_statistics(url) == stats
+    assert len(requested) == 1
+
+
+def test_dataset_statistics(manifest):
+    stats = dataset_statistics(manifest=manifest, use_cache=False)
+    assert stats.get_column("dataset").to_list() == ["crispr"]
+    assert stats.get_column("#rows").item() == 6000
+
+
+def test_row_group_layout(profiles_path):
+    layout = row_group_layout(profiles_path)
+    assert layout.height == 6
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from jump_deps import thumbnails
+from jump_deps.images import CHANNELS, ImageCache
+from jump_deps.synthetic import synthetic_site
+from jump_deps.thumbnails import ThumbnailCache, build_pyramid
+
+SITE = ("source_1", "batch", "plate", "A01", 1)
+
+
+@pytest.fixture
+def site_images(cache_dir):
+    """Synthetic site stored in the image cache, so nothing is downloaded."""
+    images = synthetic_site(size=512, channels=CHANNELS)
+    cache = ImageCache(cache_dir=cache_dir)
+    for channel, image in images.items():
+        tmp = cache.files.tempfile()
+        with open(tmp, "wb") as f:
+            np.save(f, image)
+        cache.files.put(cache.filename(SITE, channel), tmp)
+    return images
+
+
+def test_build_pyramid_starts_at_half_resolution():
+    levels = build_pyramid(np.ones((1080, 1080), dtype=np.uint16), min_size=64)
+    assert [level.shape[0] for level in levels] == [540, 270, 135, 67]
+    assert all(level.dtype == np.uint16 for level in levels)
+    assert build_pyramid(np.ones((100, 100)), min_size=64) == []
+
+
+def test_get_builds_single_sites_in_process(site_images, cache_dir, monkeypatch):
+    def no_pool(*args, **kwargs):
+        raise AssertionError("a process pool was started")
+
+    monkeypatch.setattr(thumbnails, "map_unordered", no_pool)
+    cache = ThumbnailCache(cache_dir=cache_dir)
+    images, percentiles = cache.get(SITE, size=100, channels=("DNA", "RNA"))
+    assert list(images) == ["DNA", "RNA"]
+    assert images["DNA"].shape == (128, 128)
+    assert percentiles["DNA"][50.0] == pytest.approx(
+        np.percentile(site_images["DNA"], 50)
+    )
+
+
+def test_get_serves_large_sizes_at_full_resolution(site_images, cache_dir):
+    cache = ThumbnailCache(cache_dir=cache_dir)
+    images, _ = cache.get(SITE, size=300, channels=("DNA",))
+    assert np.array_equal(images["DNA"], site_images["DNA"])
+    images, _ = cache.get(SITE, size=256, channels=("DNA",))
+    assert images["DNA"].shape == (256, 256)
+
+
+def test_get_extends_sites_built_with_fewer_channels(site_images, cache_dir):
+    cache = ThumbnailCache(cache_dir=cache_dir)
+    cache.build([SITE], ("DNA", "RNA"))
+    assert cache.missing_channels(SITE, CHANNELS) == ("AGP", "ER", "Mito")
+
+    images, percentiles = cache.get(SITE, size=100, channels=CHANNELS)
+    assert list(images) == list(CHANNELS)
+    assert list(percentiles) == list(CHANNELS)
+    assert cache.missing_channels(SITE, CHANNELS) == ()
+    assert images["ER"].shape == (128, 128)
@@ -4,9 +4,24 @@
 #   "pooch",
 # ]
 # ///
+"""
+Build table.csv, the genes covered by JUMP and other Cell Painting screens.
+
+Each dataset is reduced to a table with one row per gene in a persistent
+DuckDB database, together with the known hash of the file it came from and
+the version of the queries that reduced it. On later runs only the datasets
+whose hash or query version changed (or that are new) are recomputed, and
+the final table is a FULL JOIN of the stored ones. Adding a dataset to
+SOURCES therefore adds its column without rebuilding the rest.
+"""
+
 import duckdb
 from pooch import retrieve
 
+BUILD_DB = "gene_coverage.duckdb"
+# Bump when a query builder changes, so that its stored tables are rebuilt
+SCHEMA_VERSION = 1
+
 # Files
 periscope = {
     "A549": (
@@ -32,37 +47,68 @@ jump_url, jump_hash = (
     "72180e7889c6c0c66a12e976c0645b5b3d873f77fc00ce106ede70c9fba1bfa7",
 )
 
-# %% Periscope
-local_files = {k: retrieve(url, known_hash=hsh) for k, (url, hsh) in periscope.items()}
-csvs = list(local_files.values())
-per_tidy = duckdb.sql(
-    f"SELECT Gene,split_part(split_part(parse_filename(filename,true),'-',2), '_pl', 1) AS origin FROM read_csv({csvs}, filename=true)"
-)
-# This will be the table we will join
-per_p = duckdb.sql("PIVOT per_tidy ON origin")
-
-# %% JUMP
-jump_local = retrieve(
-    jump_url,
-    known_hash=jump_hash,
-    fname="babel",
-)
-duckdb.sql("INSTALL sqlite; LOAD sqlite;")
-duckdb.sql(f"ATTACH IF NOT EXISTS '{jump_local}'")
-jump_tidy = duckdb.sql(
-    f"SELECT standard_key AS Gene, UPPER(plate_type) AS origin FROM babel.babel WHERE plate_type IN ('orf', 'crispr')"
-)
-jump_p = duckdb.sql("PIVOT jump_tidy ON origin")
 
-merged = duckdb.sql("SELECT * FROM jump_p FULL JOIN per_p USING(Gene) ORDER BY Gene")
+# %% Per-dataset tables, each with a Gene column and one column per origin
+def jump_table(con: duckdb.DuckDBPyConnection, local: str) -> str:
+    con.sql("INSTALL sqlite; LOAD sqlite;")
+    con.sql(f"ATTACH IF NOT EXISTS '{local}' AS babel (READ_ONLY)")
+    return (
+        "PIVOT (SELECT standard_key AS Gene, UPPER(plate_type) AS origin "
+        "FROM babel.babel WHERE plate_type IN ('orf', 'crispr')) ON origin"
+    )
 
-# %% Lacoste paper
-lacoste_local = retrieve(lacoste_url, known_hash=lacoste_hash)
-lacoste_uniq = duckdb.sql(
-    f"SELECT DISTINCT Gene,1 AS Lacoste FROM read_xlsx('{lacoste_local}', all_varchar = true);"
-)
-merged_last = duckdb.sql(
-    "SELECT Gene,COALESCE(COLUMNS(* EXCLUDE(Gene)), 0) FROM merged FULL JOIN lacoste_uniq USING(Gene) ORDER BY Gene"
+
+def periscope_table(name: str):
+    def table(con: duckdb.DuckDBPyConnection, local: str) -> str:
+        return (
+            f"SELECT Gene, COUNT(*) AS \"{name}\" "
+            f"FROM read_csv('{local}') GROUP BY Gene"
+        )
+
+    return table
+
+
+def lacoste_table(con: duckdb.DuckDBPyConnection, local: str) -> str:
+    return (
+        "SELECT DISTINCT Gene, 1 AS Lacoste "
+        f"FROM read_xlsx('{local}', all_varchar = true)"
+    )
+
+
+# name: (url, known hash, pooch file name, query builder), in column order
+SOURCES = {
+    "jump": (jump_url, jump_hash, "babel", jump_table),
+    **{
+        f"periscope_{name}": (url, hsh, None, periscope_table(name))
+        for name, (url, hsh) in periscope.items()
+    },
+    "lacoste": (lacoste_url, lacoste_hash, None, lacoste_table),
+}
+
+# %% Recompute the datasets whose input changed
+con = duckdb.connect(BUILD_DB)
+con.sql(
+    "CREATE TABLE IF NOT EXISTS inputs (name VARCHAR PRIMARY KEY, known_hash VARCHAR)"
 )
+built = dict(con.sql("SELECT name, known_hash FROM inputs").fetchall())
+for name, (url, hsh, fname, table) in SOURCES.items():
+    key = f"{hsh}-v{SCHEMA_VERSION}"
+    if built.get(name) == key:
+        continue
+    local = retrieve(url, known_hash=hsh, fname=fname)
+    con.sql(f"CREATE OR REPLACE TABLE src_{name} AS {table(con, local)}")
+    con.execute("INSERT OR REPLACE INTO inputs VALUES (?, ?)", (name, key))
+    print(f"Rebuilt {name}")
 
-duckdb.sql("COPY merged_last TO 'table.csv'")
+# Datasets removed from SOURCES drop out of the table
+for name in set(built).difference(SOURCES):
+    con.sql(f"DROP TABLE IF EXISTS src_{name}")
+    con.execute("DELETE FROM inputs WHERE name = ?", (name,))
+
+# %% Merge
+tables = [f"src_{name}" for name in SOURCES]
+joined = tables[0] + "".join(f" FULL JOIN {t} USING(Gene)" for t in tables[1:])
+con.sql(
+    f"COPY (SELECT Gene,COALESCE(COLUMNS(* EXCLUDE(Gene)), 0) FROM {joined} ORDER BY Gene) TO 'table.csv'"
+)
+con.close()
@@ -0,0 +1,256 @@
+# /// script
+# dependencies = [
+#   "boto3",
+#   "requests",
+# ]
+# ///
+"""
+Mirror a Zenodo record onto the Cell Painting Gallery S3 bucket, in parallel.
+
+Every file is written to two keys:
+  - <S3_PREFIX>/<record_id>/<file>/content   immutable per-version copy
+  - <S3_PREFIX>/latest/<file>/content        mutable pointer to the most recent
+The trailing /content mirrors Zenodo's own download urls, so Datasette-Lite,
+which names tables after the last path segment, registers the parquet under
+the same name on both backends. Objects carry the Zenodo MD5 as user metadata
+`zenodo-md5`, so files whose version copy already has it are not uploaded
+again.
+
+Transfers:
+  - Several files are transferred at once (MAX_WORKERS), each streamed from
+    Zenodo as a multipart upload whose parts are sent concurrently.
+  - The MD5 is computed while streaming, and the upload is aborted instead
+    of completed when it does not match Zenodo's.
+  - An interrupted multipart upload is resumed: the file is streamed again to
+    verify its MD5, but parts that S3 already holds with the same checksum
+    are not sent again.
+  - The latest/ copy is skipped when it already points to the same record
+    and checksum.
+  - Dry runs (DRY_RUN=1) still look up the existing objects, so they report
+    the uploads and copies that a real run would make.
+
+Zenodo and S3 endpoints can be overridden (ZENODO_URL, S3_ENDPOINT_URL) to
+run against local stand-ins.
+
+Usage:
+  uv run tools/mirror_zenodo_to_cpg.py                  # mirror default record
+  DRY_RUN=1 uv run tools/mirror_zenodo_to_cpg.py        # print actions only
+  ONLY_FILE=crispr_gallery.parquet uv run tools/mirror_zenodo_to_cpg.py
+"""
+
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import requests
+
+CONCEPT_ID = os.environ.get("CONCEPT_ID", "10408587")
+S3_BUCKET = os.environ.get("S3_BUCKET", "cellpainting-gallery")
+S3_PREFIX = os.environ.get(
+    "S3_PREFIX",
+    "cpg0042-chandrasekaran-jump/source_all/workspace/publication_data/jump_rr",
+)
+AWS_PROFILE_NAME = os.environ.get("AWS_PROFILE_NAME", "cpg")
+DRY_RUN = os.environ.get("DRY_RUN", "0") == "1"
+ONLY_FILE = os.environ.get("ONLY_FILE", "")
+ZENODO_URL = os.environ.get("ZENODO_URL", "https://zenodo.org")
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL") or None
+MAX_WORKERS = int(os.environ.get("MAX_WORKERS", "4"))
+PART_SIZE = int(os.environ.get("PART_SIZE", str(64 << 20)))
+PARTS_IN_FLIGHT = int(os.environ.get("PARTS_IN_FLIGHT", "4"))
+
+
+def log(message: str) -> None:
+    print(f"[{time.strftime('%H:%M:%SZ', time.gmtime())}] {message}", flush=True)
+
+
+def latest_record(concept_id: str, session: requests.Session) -> dict:
+    """Metadata of the latest version of a Zenodo concept."""
+    response = session.get(
+        f"{ZENODO_URL}/api/records/{concept_id}/versions/latest", timeout=60
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def object_md5(client, key: str) -> str | None:
+    """zenodo-md5 metadata of an object, None if it does not exist."""
+    try:
+        head = client.head_object(Bucket=S3_BUCKET, Key=key)
+    except client.exceptions.ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+    return head.get("Metadata", {}).get("zenodo-md5")
+
+
+def pending_upload(client, key: str) -> tuple[str | None, dict[int, str]]:
+    """Most recent unfinished multipart upload of a key and its parts' ETags."""
+    uploads = client.list_multipart_uploads(Bucket=S3_BUCKET, Prefix=key).get(
+        "Uploads", []
+    )
+    uploads = [u for u in uploads if u["Key"] == key]
+    if not uploads:
+        return None, {}
+    upload_id = max(uploads, key=lambda u: u["Initiated"])["UploadId"]
+    parts = {}
+    for page in client.get_paginator("list_parts").paginate(
+        Bucket=S3_BUCKET, Key=key, UploadId=upload_id
+    ):
+        for part in page.get("Parts", []):
+            parts[part["PartNumber"]] = part["ETag"].strip('"')
+    return upload_id, parts
+
+
+def stream_upload(
+    client, session: requests.Session, url: str, key: str, md5: str, metadata: dict
+) -> int:
+    """
+    Stream a file from Zenodo into a multipart upload, verifying its MD5.
+
+    Returns the number of parts actually sent to S3.
+    """
+    upload_id, existing = pending_upload(client, key)
+    if upload_id is None:
+        upload_id = client.create_multipart_upload(
+            Bucket=S3_BUCKET, Key=key, Metadata=metadata
+        )["UploadId"]
+    else:
+        log(f"  resume: {key} has {len(existing)} parts already uploaded")
+
+    digest = hashlib.md5()
+    slots = threading.Semaphore(PARTS_IN_FLIGHT)
+    parts, futures = [], []
+
+    def send(number: int, chunk: bytes) -> None:
+        try:
+            client.upload_part(
+                Bucket=S3_BUCKET,
+                Key=key,
+                UploadId=upload_id,
+                PartNumber=number,
+                Body=chunk,
+            )
+        finally:
+            slots.release()
+
+    try:
+        with (
+            session.get(url, stream=True, timeout=300) as response,
+            ThreadPoolExecutor(max_workers=PARTS_IN_FLIGHT) as executor,
+        ):
+            response.raise_for_status()
+            for number, chunk in enumerate(split_parts(response), start=1):
+                digest.update(chunk)
+                part_md5 = hashlib.md5(chunk).hexdigest()
+                parts.append({"PartNumber": number, "ETag": f'"{part_md5}"'})
+                if existing.get(number) != part_md5:
+                    slots.acquire()
+                    futures.append(executor.submit(send, number, chunk))
+            for future in futures:
+                future.result()
+
+        if digest.hexdigest() != md5:
+            raise ValueError(f"{url} has MD5 {digest.hexdigest()}, Zenodo lists {md5}")
+    except ValueError:
+        # Parts of a corrupted stream must not be resumed
+        client.abort_multipart_upload(Bucket=S3_BUCKET, Key=key, UploadId=upload_id)
+        raise
+
+    if not parts:
+        # Multipart uploads need at least one part
+        client.abort_multipart_upload(Bucket=S3_BUCKET, Key=key, UploadId=upload_id)
+        client.put_object(Bucket=S3_BUCKET, Key=key, Body=b"", Metadata=metadata)
+        return 1
+    client.complete_multipart_upload(
+        Bucket=S3_BUCKET,
+        Key=key,
+        UploadId=upload_id,
+        MultipartUpload={"Parts": parts},
+    )
+    return len(futures)
+
+
+def split_parts(response: requests.Response):
+    """Yield the body of a streamed response in chunks of PART_SIZE bytes."""
+    buffer = bytearray()
+    for piece in response.iter_content(chunk_size=1 << 20):
+        buffer += piece
+        while len(buffer) >= PART_SIZE:
+            yield bytes(buffer[:PART_SIZE])
+            del buffer[:PART_SIZE]
+    if buffer:
+        yield bytes(buffer)
+
+
+def mirror_file(client, file: dict, record_id: str) -> str:
+    """Mirror one Zenodo file and refresh its latest/ copy; returns the action."""
+    name, url, size = file["key"], file["links"]["self"], file["size"]
+    md5 = file["checksum"].removeprefix("md5:")
+    version_key = f"{S3_PREFIX}/{record_id}/{name}/content"
+    latest_key = f"{S3_PREFIX}/latest/{name}/content"
+    metadata = {"zenodo-md5": md5, "zenodo-record-id": str(record_id)}
+    log(f"FILE {name} (size={size}, md5={md5})")
+
+    # The checks only read from S3, so they also run in dry runs
+    if object_md5(client, version_key) == md5:
+        log(f"  skip upload: {version_key} already has matching zenodo-md5")
+        action = "skipped"
+    elif DRY_RUN:
+        log(f"  DRY-RUN: stream {url} -> s3://{S3_BUCKET}/{version_key}")
+        action = "uploaded"
+    else:
+        with requests.Session() as session:
+            sent = stream_upload(client, session, url, version_key, md5, metadata)
+        log(f"  uploaded: {version_key} ({sent} parts sent)")
+        action = "uploaded"
+
+    head = None
+    try:
+        head = client.head_object(Bucket=S3_BUCKET, Key=latest_key)
+    except client.exceptions.ClientError:
+        pass
+    if head is not None and head.get("Metadata") == metadata:
+        log(f"  latest up to date: {latest_key}")
+    elif DRY_RUN:
+        log(f"  DRY-RUN: copy -> s3://{S3_BUCKET}/{latest_key}")
+    else:
+        # Managed copy, server-side and multipart for objects over 5 GB
+        client.copy(
+            {"Bucket": S3_BUCKET, "Key": version_key},
+            S3_BUCKET,
+            latest_key,
+            ExtraArgs={"MetadataDirective": "REPLACE", "Metadata": metadata},
+        )
+        log(f"  sync: {version_key} -> {latest_key}")
+    return action
+
+
+def main() -> None:
+    session = requests.Session()
+    log(f"Resolving latest version of Zenodo concept {CONCEPT_ID}")
+    record = latest_record(CONCEPT_ID, session)
+    record_id, files = record["id"], record["files"]
+    log(
+        f"Latest record: {record_id} (doi {record.get('doi')}, published "
+        f"{record['metadata']['publication_date']}, {len(files)} files)"
+    )
+    log(f"Target prefix: s3://{S3_BUCKET}/{S3_PREFIX}/{{{record_id},latest}}/")
+
+    files = [f for f in files if not ONLY_FILE or f["key"] == ONLY_FILE]
+    # Empty AWS_PROFILE_NAME: credentials come from the environment (CI)
+    aws = boto3.Session(profile_name=AWS_PROFILE_NAME or None)
+    client = aws.client("s3", endpoint_url=S3_ENDPOINT_URL)
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        actions = list(executor.map(lambda f: mirror_file(client, f, record_id), files))
+    log(
+        f"Done. uploaded={actions.count('uploaded')} "
+        f"skipped={actions.count('skipped')} synced={len(actions)}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -11,10 +11,9 @@
 
 from pathlib import Path
 
-import pandas as pd  # TODO stick to polars
 import polars as pl
-import scipy.stats as stats
-from statsmodels.stats.multitest import multipletests
+
+from jump_deps.feature_stats import compare_clusters
 
 fpath = Path(
     "/dgx1nas1/storage/data/shared/morphmap_profiles/orf/full_profiles_cc_adj_mean_corr.parquet"
@@ -40,33 +39,19 @@ feature_diff = diff.filter(~pl.all_horizontal(pl.all().is_null())).melt()
 feature_diff.sort(by="value").write_csv("feature_diffs.csv")
 
 
-cluster_a = clusters.filter(pl.col("Metadata_Cluster") == "RAB40B/C").select(
-    pl.all().exclude("^Metadata.*$")
-)
-cluster_b = clusters.filter(pl.col("Metadata_Cluster") == "INS/PIK").select(
-    pl.all().exclude("^Metadata.*$")
+# Welch's t-test (and Mann-Whitney U) for all features at once, BH-corrected
+results = compare_clusters(
+    clusters,
+    "Metadata_Cluster",
+    pairs=[("RAB40B/C", "INS/PIK")],
 )
-results = []
-for feature in cluster_a.columns:
-    cluster_A = cluster_a.get_column(feature)
-    cluster_B = cluster_b.get_column(feature)
-
-    # Use t-test or Mann-Whitney U test based on data distribution
-    t_stat, p_val = stats.ttest_ind(cluster_A, cluster_B, equal_var=False)
-
-    results.append({"Feature": feature, "T-Statistic": t_stat, "P-Value": p_val})
-
-
-results_df = pd.DataFrame(results)
-
-# drop rows with NaN
-results_df = results_df.dropna()
-
-# Apply multiple testing correction
-
-corrected_pvals = multipletests(results_df["P-Value"], method="fdr_bh")[1]
-results_df["Corrected P-Value"] = corrected_pvals
+results_df = results.select(
+    pl.col("feature").alias("Feature"),
+    pl.col("t_statistic").alias("T-Statistic"),
+    pl.col("t_p_value").alias("P-Value"),
+    pl.col("t_p_value_corrected").alias("Corrected P-Value"),
+).drop_nans()
 
 # Filter significant features
-significant_features = results_df[results_df["Corrected P-Value"] < 0.05]
-significant_features.to_csv("significant_features.csv")
+significant_features = results_df.filter(pl.col("Corrected P-Value") < 0.05)
+significant_features.write_csv("significant_features.csv")